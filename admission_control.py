@@ -0,0 +1,175 @@
+"""
+Admission control for upstream-bound endpoints: per-endpoint concurrency
+limits with bounded wait queues, and request-size limits, so overload is
+shed early instead of queueing every request behind the upstream
+"""
+
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Request-size limits
+MAX_REQUEST_BYTES = int(os.environ.get('MAX_REQUEST_BYTES', 2 * 1024 * 1024))
+QUIZ_MAX_QUESTIONS = int(os.environ.get('QUIZ_MAX_QUESTIONS', 50))
+MAX_ANSWER_CHARS = int(os.environ.get('MAX_ANSWER_CHARS', 5000))
+MAX_CONTEXT_CHARS = int(os.environ.get('MAX_CONTEXT_CHARS', 4000))
+MAX_MESSAGE_CHARS = int(os.environ.get('MAX_MESSAGE_CHARS', 8000))
+MAX_FIELD_CHARS = 200
+
+# name: (concurrent, queued, max wait seconds)
+GATE_DEFAULTS = {
+    'chat': (8, 16, 5),
+    'explain': (6, 12, 5),
+    'generate-quiz': (4, 8, 10),
+    'assess-review': (4, 8, 5)
+}
+
+
+class OverloadedError(Exception):
+    """Raised when a gate has no free slot and no room (or time) left in its queue"""
+
+    def __init__(self, gate, retry_after):
+        super().__init__(f'{gate} is at capacity')
+        self.gate = gate
+        self.retry_after = retry_after
+
+
+class AdmissionGate:
+    """Counting semaphore with a bounded, time-limited wait queue and metrics"""
+
+    def __init__(self, name, max_concurrent, max_waiting, max_wait):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self._admitted = 0
+        self._rejected = 0
+        # Smoothed time a request holds a slot, for Retry-After estimates
+        self._avg_hold = 1.0
+
+    def retry_after(self):
+        """Seconds until a slot is likely free, rounded up"""
+        return max(1, math.ceil(self._avg_hold * (self._waiting + 1) / self.max_concurrent))
+
+    def _reject(self):
+        self._rejected += 1
+        raise OverloadedError(self.name, self.retry_after())
+
+    def _acquire(self):
+        with self._cond:
+            if self._active >= self.max_concurrent or self._waiting:
+                if self._waiting >= self.max_waiting:
+                    self._reject()
+                self._waiting += 1
+                try:
+                    admitted = self._cond.wait_for(lambda: self._active < self.max_concurrent, timeout=self.max_wait)
+                finally:
+                    self._waiting -= 1
+                if not admitted:
+                    self._reject()
+            self._active += 1
+            self._admitted += 1
+
+    def _try_acquire(self):
+        with self._cond:
+            if self._active >= self.max_concurrent or self._waiting:
+                self._reject()
+            self._active += 1
+            self._admitted += 1
+
+    def _release(self, held):
+        with self._cond:
+            self._active -= 1
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * held
+            self._cond.notify()
+
+    @contextmanager
+    def admit(self):
+        self._acquire()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - start)
+
+    @contextmanager
+    def try_admit(self):
+        """Admit only if a slot is free right now; for event-loop callers, which must not block"""
+        self._try_acquire()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - start)
+
+    def metrics(self):
+        with self._cond:
+            return {
+                'active': self._active,
+                'waiting': self._waiting,
+                'limit': self.max_concurrent,
+                'queue_limit': self.max_waiting,
+                'admitted': self._admitted,
+                'rejected': self._rejected,
+                'avg_hold_seconds': round(self._avg_hold, 3)
+            }
+
+
+def _gate_from_env(name, defaults):
+    prefix = 'ADMISSION_' + name.upper().replace('-', '_')
+    concurrent, queued, wait = defaults
+    return AdmissionGate(
+        name,
+        int(os.environ.get(f'{prefix}_CONCURRENCY', concurrent)),
+        int(os.environ.get(f'{prefix}_QUEUE', queued)),
+        float(os.environ.get(f'{prefix}_WAIT', wait))
+    )
+
+
+gates = {name: _gate_from_env(name, defaults) for name, defaults in GATE_DEFAULTS.items()}
+
+
+def admission_metrics():
+    return {name: gate.metrics() for name, gate in gates.items()}
+
+
+def check_request_limits(data):
+    """Error message for the first request-size limit the payload breaks, or None"""
+    if not isinstance(data, dict):
+        return 'Request body must be a JSON object'
+
+    if 'numQuestions' in data:
+        try:
+            num_questions = int(data['numQuestions'])
+        except (TypeError, ValueError):
+            return 'numQuestions must be an integer'
+        if not 1 <= num_questions <= QUIZ_MAX_QUESTIONS:
+            return f'numQuestions must be between 1 and {QUIZ_MAX_QUESTIONS}'
+
+    for field in ('subject', 'topic', 'academicLevel', 'difficulty', 'quizType'):
+        if len(str(data.get(field) or '')) > MAX_FIELD_CHARS:
+            return f'{field} is longer than {MAX_FIELD_CHARS} characters'
+    if len(str(data.get('context') or '')) > MAX_CONTEXT_CHARS:
+        return f'context is longer than {MAX_CONTEXT_CHARS} characters'
+    if len(str(data.get('message') or '')) > MAX_MESSAGE_CHARS:
+        return f'message is longer than {MAX_MESSAGE_CHARS} characters'
+
+    answer_sets = [data.get('answers')] + [student.get('answers') for student in data.get('students') or []
+                                           if isinstance(student, dict)]
+    for answers in answer_sets:
+        if not answers:
+            continue
+        if not isinstance(answers, dict) or len(answers) > QUIZ_MAX_QUESTIONS:
+            return f'answers must map at most {QUIZ_MAX_QUESTIONS} question ids to answers'
+        if any(len(str(answer or '')) > MAX_ANSWER_CHARS for answer in answers.values()):
+            return f'answers must be at most {MAX_ANSWER_CHARS} characters each'
+
+    quiz = data.get('quiz')
+    if isinstance(quiz, dict) and len(quiz.get('questions') or []) > QUIZ_MAX_QUESTIONS:
+        return f'quiz may have at most {QUIZ_MAX_QUESTIONS} questions'
+    return None
@@ -1,68 +1,232 @@
-from flask import Flask, send_from_directory, send_file, request, jsonify
+from flask import Blueprint, Flask, Response, current_app, g, send_from_directory, send_file, request, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
+import hmac
 import json
 import requests
+import threading
 import urllib3
+from concurrent.futures import TimeoutError as FutureTimeout
 from datetime import datetime
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+from admission_control import MAX_REQUEST_BYTES, OverloadedError, admission_metrics, check_request_limits, gates
+from assessment_format import compact_assessment, find_question_feedback
+from batch_assessment import assess_mcq_class, assess_subjective_class
+from batch_generation import QUIZ_BATCH_MAX_SPECS, QUIZ_GENERATION_CONCURRENCY, SPEC_FIELDS, generate_batch, normalize_spec
+from bulkheads import bulkhead_metrics
+from cache_warmer import (
+    WARMER_ENABLED,
+    add_to_pool,
+    cache_explanation,
+    cache_warmer,
+    cached_explanation,
+    demand,
+    explanation_key,
+    quiz_key,
+    sample_from_pool,
+    stash_upgrade,
+    take_upgrade
+)
+from chat_sessions import (
+    build_chat_messages,
+    create_chat_session,
+    delete_chat_session,
+    get_chat_session,
+    record_turn,
+    update_chat_context
+)
+from completion_continuation import continue_truncated_array, is_truncated
+from deadline_race import quiz_deadline, race_to_deadline
+from feedback_cache import feedback_cache_metrics
 from fallback_quiz import generate_fallback_quiz, generate_fallback_assessment
 from fallback_quiz_enhanced import generate_enhanced_fallback_quiz, generate_enhanced_fallback_assessment
-
-# Load environment variables from .env file
-load_dotenv()
-
-app = Flask(__name__)
-CORS(app)
+from groq_client import GROQ_API_URL, probe_upstream, run_completion_steps
+from http_compression import compress_response
+from job_queue import TERMINAL_STATES, QueueFullError, job_queue
+from json_provider import json_provider_class
+from mcq_grading import ENRICH_BY_DEFAULT, get_assessment, grade_mcq_quiz, normalize_option, start_explanation_enrichment
+from progressive_explanation import (
+    SECTION_WAIT_SECONDS,
+    build_outline,
+    cached_outline,
+    cached_section,
+    get_outline,
+    outline_steps,
+    prefetch_sections,
+    remember_outline,
+    section_future,
+    section_steps
+)
+from question_dedup import dedupe_questions
+from rate_limit import check_rate_limit, client_id, endpoint_for, rate_limit_headers, rate_limited_body, rate_limiter
+from quiz_store import HIDE_ANSWER_KEYS, load_quiz_session, save_quiz_session, strip_answer_keys
+from quiz_variants import MAX_VARIANTS, make_variant, random_variant_seed, variant_error, variant_seed
+from static_assets import StaticAssets
+from subjective_grader import build_subjective_assessment, pre_grade_answers, review_escalated_answers
+from upstream_health import PROBE_ENABLED, READY_REQUIRES_UPSTREAM, UpstreamUnavailable, upstream_health
+from usage_accounting import (
+    ADMIN_TOKEN,
+    USAGE_WINDOW_MINUTES,
+    TokenBudgetExceeded,
+    budget_state,
+    reset_usage_tag,
+    set_usage_tag,
+    usage_report
+)
+
+# Routes live on a blueprint; create_app() builds the Flask app around it
+bp = Blueprint('acadtutor', __name__)
 
 # Get port from environment variable (Render sets this)
 PORT = int(os.environ.get('PORT', 5000))
 
-# Groq API configuration
-GROQ_API_KEY = os.getenv('GROQ_API_KEY')
-GROQ_API_URL = 'https://api.groq.com/openai/v1/chat/completions'
-
-print(f"Groq API Key loaded: {'✅ Yes' if GROQ_API_KEY else '❌ No'}")
-if GROQ_API_KEY:
-    print(f"API Key length: {len(GROQ_API_KEY)} characters")
-else:
-    print("⚠️  Please set GROQ_API_KEY in your .env file")
-
-# Create a robust HTTP session with retry logic
-def create_http_session():
-    session = requests.Session()
+# Groq API configuration, set by load_settings()
+GROQ_API_KEY = None
+_settings_loaded = False
+
+# Heavy components are built on first use, or up front when preloading under gunicorn
+_static_assets = None
+_init_lock = threading.Lock()
+_default_app = None
+
+def load_settings():
+    """Load .env and the API key once per process"""
+    global GROQ_API_KEY, _settings_loaded
+    if _settings_loaded:
+        return
+    # Load environment variables from .env file
+    load_dotenv()
+    GROQ_API_KEY = os.getenv('GROQ_API_KEY')
+    _settings_loaded = True
     
-    # Retry strategy
-    retry_strategy = Retry(
-        total=3,
-        backoff_factor=1,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=["HEAD", "GET", "OPTIONS", "POST"]
+    print(f"Groq API Key loaded: {'✅ Yes' if GROQ_API_KEY else '❌ No'}")
+    if GROQ_API_KEY:
+        print(f"API Key length: {len(GROQ_API_KEY)} characters")
+    else:
+        print("⚠️  Please set GROQ_API_KEY in your .env file")
+
+def get_static_assets():
+    """Static files, precompressed and fingerprinted on first use"""
+    global _static_assets
+    if _static_assets is None:
+        with _init_lock:
+            if _static_assets is None:
+                _static_assets = StaticAssets(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
+    return _static_assets
+
+@bp.before_app_request
+def enforce_request_limits():
+    """Reject oversized API payloads before they reach a worker or the upstream"""
+    if request.method != 'POST' or not request.path.startswith('/api/'):
+        return None
+    data = request.get_json(silent=True)
+    if data is None:
+        return None
+    payloads = [data]
+    if isinstance(data, dict):
+        payloads += [data['payload']] if isinstance(data.get('payload'), dict) else []
+        payloads += [spec for spec in data.get('specs') or [] if isinstance(spec, dict)]
+    for payload in payloads:
+        error = check_request_limits(payload)
+        if error:
+            return jsonify({'error': error, 'code': 'request_limit'}), 400
+    return None
+
+@bp.before_app_request
+def tag_usage():
+    """Charge this request's upstream calls to its endpoint and client"""
+    endpoint = request.endpoint.rsplit('.', 1)[-1] if request.endpoint else 'unknown'
+    data = request.get_json(silent=True) if request.method == 'POST' else None
+    endpoint = endpoint_for(request.method, request.path, data)[0] or endpoint
+    g.usage_tag_token = set_usage_tag(endpoint, client_id(request.headers, request.remote_addr))
+
+@bp.teardown_app_request
+def untag_usage(error=None):
+    token = g.pop('usage_tag_token', None)
+    if token is not None:
+        try:
+            reset_usage_tag(token)
+        except ValueError:
+            # Streamed responses can finish in another context; that context ends with the request
+            pass
+
+@bp.before_app_request
+def enforce_rate_limits():
+    """Per-client token buckets for upstream-bound endpoints, so one client cannot starve the rest"""
+    decision = check_rate_limit(
+        request.method, request.path, request.headers, request.remote_addr,
+        request.get_json(silent=True) if request.method == 'POST' else None
     )
-    
-    # Mount adapter with retry strategy
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-    
-    return session
+    if decision is None:
+        return None
+    g.rate_limit = decision
+    if not decision['allowed']:
+        print(f"🚫 Rate limited {request.path} ({decision['bucket']} budget)")
+        return jsonify(rate_limited_body(decision)), 429
+    return None
+
+@bp.after_app_request
+def add_rate_limit_headers(response):
+    decision = g.get('rate_limit')
+    if decision is not None:
+        response.headers.update(rate_limit_headers(decision))
+    return response
+
+def start_background_services():
+    """Start per-process background threads; threads do not survive a fork, so gunicorn calls this post_fork"""
+    load_settings()
+    # Health checks and request routing read the prober's cached upstream state
+    if PROBE_ENABLED and GROQ_API_KEY:
+        upstream_health.start(probe_upstream)
+    # Pre-generate popular quizzes and explanations while the upstream is idle
+    if WARMER_ENABLED and GROQ_API_KEY:
+        cache_warmer.start(generate_quiz_response, generate_explanation_response)
+
+def create_app(start_background=True, eager=False):
+    """
+    Build the Flask app. eager=True constructs the heavy components now, so a
+    preloading gunicorn master shares them with its workers copy-on-write.
+    """
+    load_settings()
+    flask_app = Flask(__name__)
+    flask_app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
+    flask_app.json = json_provider_class()(flask_app)
+    CORS(flask_app)
+    flask_app.register_blueprint(bp)
+    if eager:
+        get_static_assets()
+    if start_background:
+        start_background_services()
+    return flask_app
+
+@bp.after_app_request
+def compress_large_responses(response):
+    """Compress buffered responses when the client accepts gzip or brotli"""
+    return compress_response(request, response)
+
+def __getattr__(name):
+    # `from app import app` (and gunicorn's app:app) builds the default app lazily
+    global _default_app
+    if name in ('app', 'application'):
+        if _default_app is None:
+            _default_app = create_app()
+        return _default_app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Serve static files
-@app.route('/')
+@bp.route('/')
 def index():
-    return send_file('static/index.html')
+    return get_static_assets().response('index.html', request) or send_file('static/index.html')
 
-@app.route('/test')
+@bp.route('/test')
 def test_frontend():
     return send_file('test_frontend.html')
 
-@app.route('/<path:filename>')
+@bp.route('/<path:filename>')
 def static_files(filename):
-    return send_from_directory('static', filename)
+    return get_static_assets().response(filename, request) or send_from_directory('static', filename)
 
-@app.route('/api/test', methods=['GET'])
+@bp.route('/api/test', methods=['GET'])
 def test_api():
     """Test endpoint to verify API key is loaded"""
     return jsonify({
@@ -70,113 +234,175 @@ def test_api():
         'groq_api_key_loaded': bool(GROQ_API_KEY),
         'api_key_length': len(GROQ_API_KEY) if GROQ_API_KEY else 0,
         'api_url': GROQ_API_URL,
-        'env_file_loaded': os.path.exists('.env')
+        'env_file_loaded': os.path.exists('.env'),
+        'upstream': upstream_health.state
     })
 
-@app.route('/api/test-connection', methods=['GET'])
+@bp.route('/api/test-connection', methods=['GET'])
 def test_connection():
-    """Test connection to Groq API"""
+    """Groq reachability from the prober's cache; ?fresh=true runs a zero-token probe now"""
     if not GROQ_API_KEY:
         return jsonify({'error': 'API key not configured'}), 400
     
-    headers = {
-        'Authorization': f'Bearer {GROQ_API_KEY}',
-        'Content-Type': 'application/json'
-    }
-    
-    # Simple test payload for Groq
-    payload = {
-        'model': 'llama3-8b-8192',
-        'messages': [
-            {
-                'role': 'user',
-                'content': 'Say "Hello" in JSON format: {"message": "Hello"}'
-            }
-        ],
-        'max_tokens': 50,
-        'temperature': 0.1
-    }
-    
-    session = create_http_session()
+    if request.args.get('fresh') == 'true' or upstream_health.checked_at is None:
+        snapshot = upstream_health.probe(probe_upstream)
+    else:
+        snapshot = upstream_health.snapshot()
     
-    try:
-        response = session.post(GROQ_API_URL, headers=headers, json=payload, timeout=(5, 15))
-        
-        if response.status_code == 200:
-            return jsonify({
-                'status': 'success',
-                'message': 'Connection to Groq API successful',
-                'response_preview': response.json()
-            })
-        else:
-            return jsonify({
-                'status': 'error',
-                'message': f'API returned status {response.status_code}',
-                'error': response.text[:200]
-            }), response.status_code
-            
-    except Exception as e:
+    status = snapshot['last_status']
+    if status is None or (status >= 400 and status != 429):
         return jsonify({
             'status': 'error',
-            'message': f'Connection failed: {str(e)}'
-        }), 500
+            'message': f"Groq API check failed ({snapshot['state']})",
+            'error': snapshot['last_error'],
+            'upstream': snapshot
+        }), 503
+    return jsonify({
+        'status': 'success',
+        'message': f"Connection to Groq API successful ({snapshot['latency_ms']} ms)",
+        'upstream': snapshot
+    })
+
+@bp.route('/api/health/live', methods=['GET'])
+def liveness():
+    """Liveness: the process is serving requests; never touches the upstream"""
+    return jsonify({'status': 'alive'})
+
+@bp.route('/api/health/ready', methods=['GET'])
+def readiness():
+    """Readiness: settings are loaded; with HEALTH_READY_REQUIRES_UPSTREAM, Groq must be reachable too"""
+    upstream = upstream_health.state
+    ready = _settings_loaded and not (READY_REQUIRES_UPSTREAM and upstream == 'down')
+    return jsonify({
+        'status': 'ready' if ready else 'not_ready',
+        'upstream': upstream,
+        'degraded': upstream in ('degraded', 'down')
+    }), 200 if ready else 503
 
-@app.route('/api/health', methods=['GET'])
+@bp.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint for monitoring"""
+    upstream = upstream_health.snapshot()
     return jsonify({
-        'status': 'healthy',
+        'status': 'degraded' if upstream['state'] in ('degraded', 'down') else 'healthy',
         'service': 'AcadTutor',
         'version': '1.0.0',
         'groq_api': 'configured' if GROQ_API_KEY else 'not_configured',
-        'environment': os.environ.get('RENDER_SERVICE_NAME', 'local')
+        'upstream': upstream,
+        'environment': os.environ.get('RENDER_SERVICE_NAME', 'local'),
+        'job_queue_depth': job_queue.metrics()['queue_depth'],
+        'cache_warmer': cache_warmer.metrics(),
+        'admission': admission_metrics(),
+        'bulkheads': bulkhead_metrics(),
+        'feedback_cache': feedback_cache_metrics(),
+        'rate_limit': rate_limiter.metrics(),
+        'token_budget': budget_state()
     })
 
-@app.route('/api/chat', methods=['POST'])
+@bp.route('/api/admin/usage', methods=['GET'])
+def admin_usage():
+    """LLM token usage per endpoint/model/client over a rolling window (requires ADMIN_TOKEN)"""
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'Admin endpoints are disabled - set ADMIN_TOKEN'}), 403
+    supplied = request.headers.get('X-Admin-Token') or request.headers.get('Authorization', '').replace('Bearer ', '', 1)
+    if not hmac.compare_digest(supplied.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+        return jsonify({'error': 'Invalid admin token'}), 401
+    
+    minutes = min(request.args.get('minutes', 60, type=int), USAGE_WINDOW_MINUTES)
+    group_by = [field for field in request.args.get('group_by', 'endpoint,model').split(',')
+                if field in ('endpoint', 'model', 'client')]
+    return jsonify(usage_report(minutes, group_by))
+
+@bp.route('/api/chat', methods=['POST'])
 def chat():
     """Handle chat requests for topic explanations"""
+    try:
+        with gates['chat'].admit():
+            result, status = run_completion_steps(chat_steps(request.get_json(silent=True)))
+    except OverloadedError as e:
+        result, status = overloaded_chat_response(e.retry_after)
+    return api_response(result, status)
+
+def token_budget_response(error):
+    """Daily token budget spent: tell the client when AI answers come back"""
+    return {
+        'status': 'error',
+        'error': 'Daily AI usage budget reached - please try again after the reset',
+        'code': 'token_budget',
+        'retry_after': error.retry_after
+    }, 503
+
+def upstream_unavailable_response(error):
+    """Upstream known to be down: fail fast rather than wait out connection timeouts"""
+    return {
+        'status': 'error',
+        'error': 'AI service is temporarily unreachable - please retry shortly',
+        'code': 'upstream_unavailable',
+        'retry_after': error.retry_after
+    }, 503
+
+def overloaded_chat_response(retry_after):
+    return {
+        'status': 'error',
+        'error': 'Tutor is busy - please retry shortly',
+        'code': 'overloaded',
+        'retry_after': retry_after
+    }, 503
+
+def chat_steps(data):
+    """Chat turn as completion steps: yields the Groq payload, receives the response"""
     try:
         if not GROQ_API_KEY:
-            return jsonify({
+            return {
                 'status': 'error',
                 'error': 'Groq API key not configured'
-            }), 500
+            }, 500
 
-        data = request.get_json()
         if not data or 'message' not in data:
-            return jsonify({
+            return {
                 'status': 'error',
                 'error': 'Message is required'
-            }), 400
+            }, 400
 
         message = data['message']
         context = data.get('context', '')
         
-        # Prepare the request to Groq API
-        headers = {
-            'Authorization': f'Bearer {GROQ_API_KEY}',
-            'Content-Type': 'application/json'
-        }
+        # Conversations keep their history server-side; pass sessionId (or session: true to start one)
+        session_id = data.get('sessionId')
+        chat_session = None
+        if session_id or data.get('session'):
+            chat_session = get_chat_session(session_id)
+            if chat_session is None:
+                session_id = create_chat_session(context)
+                chat_session = get_chat_session(session_id)
+            elif context and context != chat_session['context']:
+                chat_session = update_chat_context(session_id, context)
+            context = chat_session['context']
         
-        payload = {
-            'model': 'llama3-8b-8192',
-            'messages': [
+        system_prompt = f'You are an expert AI tutor. Context: {context}'
+        if chat_session is not None:
+            messages = build_chat_messages(chat_session, system_prompt, message)
+        else:
+            messages = [
                 {
                     'role': 'system',
-                    'content': f'You are an expert AI tutor. Context: {context}'
+                    'content': system_prompt
                 },
                 {
                     'role': 'user',
                     'content': message
                 }
-            ],
+            ]
+        
+        payload = {
+            'model': 'llama3-8b-8192',
+            'messages': messages,
             'max_tokens': 4000,
             'temperature': 0.7
         }
         
-        # Create session and make request
-        session = create_http_session()
-        response = session.post(GROQ_API_URL, headers=headers, json=payload, timeout=(10, 30))
+        # Make request to Groq API
+        response = yield payload, (10, 30)
         
         if response.status_code == 200:
             groq_response = response.json()
@@ -184,47 +410,286 @@ def chat():
             if 'choices' in groq_response and len(groq_response['choices']) > 0:
                 ai_response = groq_response['choices'][0]['message']['content']
                 
-                return jsonify({
+                result = {
                     'status': 'success',
                     'response': ai_response,
                     'model': groq_response.get('model', 'llama3-8b-8192'),
                     'usage': groq_response.get('usage', {})
-                })
+                }
+                if chat_session is not None:
+                    record_turn(session_id, message, ai_response)
+                    result['session_id'] = session_id
+                return result, 200
             else:
-                return jsonify({
+                return {
                     'status': 'error',
                     'error': 'No response from AI model'
-                }), 500
+                }, 500
         else:
             error_detail = response.text
-            return jsonify({
+            return {
                 'status': 'error',
                 'error': f'Groq API error: {response.status_code}',
                 'detail': error_detail
-            }), response.status_code
+            }, response.status_code
             
+    except TokenBudgetExceeded as e:
+        return token_budget_response(e)
+    except UpstreamUnavailable as e:
+        return upstream_unavailable_response(e)
     except requests.exceptions.Timeout:
-        return jsonify({
+        return {
             'status': 'error',
             'error': 'Request timeout - please try again'
-        }), 408
+        }, 408
     except requests.exceptions.RequestException as e:
-        return jsonify({
+        return {
             'status': 'error',
             'error': f'Network error: {str(e)}'
-        }), 500
+        }, 500
     except Exception as e:
-        return jsonify({
+        return {
             'status': 'error',
             'error': f'Server error: {str(e)}'
-        }), 500
+        }, 500
 
-@app.route('/api/generate-quiz', methods=['POST'])
+@bp.route('/api/chat/<session_id>', methods=['DELETE'])
+def end_chat_session(session_id):
+    """Forget a server-side chat session"""
+    if not delete_chat_session(session_id):
+        return jsonify({'status': 'error', 'error': 'Chat session not found or expired'}), 404
+    return jsonify({'status': 'success', 'session_id': session_id})
+
+@bp.route('/api/generate-quiz', methods=['POST'])
 def generate_quiz():
     """Generate quiz questions using Groq API"""
+    data = request.json or {}
+    if request.args.get('mode') == 'job':
+        return submit_job('generate-quiz', data)
+    result, status = run_quiz_generation(data)
+    return jsonify(result), status
+
+def run_quiz_generation(data):
+    """Generate a quiz and register its server-side session"""
+    result, status = create_quiz_response(data)
+    return attach_quiz_session(data, result, status), status
+
+def attach_quiz_session(data, result, status):
+    """Keep a generated quiz (and its answer key) server-side and tag it with its quiz_id"""
+    if status != 200 or not result.get('quiz'):
+        return result
+    
+    quiz = result['quiz']
+    quiz_id = save_quiz_session(
+        quiz,
+        data.get('quizType', 'mcq'),
+        data.get('subject', ''),
+        data.get('topic', ''),
+        data.get('academicLevel', 'Secondary')
+    )
+    if HIDE_ANSWER_KEYS:
+        quiz = strip_answer_keys(quiz)
+    return {**result, 'quiz': {**quiz, 'quiz_id': quiz_id}, 'quiz_id': quiz_id}
+
+@bp.route('/api/generate-quiz/batch', methods=['POST'])
+def generate_quiz_batch():
+    """Generate quizzes for many topics concurrently, streaming each as NDJSON when ready"""
+    data = request.json or {}
+    raw_specs = data.get('specs', [])
+    
+    if not isinstance(raw_specs, list) or not raw_specs:
+        return jsonify({'error': 'A non-empty list of quiz specs is required'}), 400
+    if len(raw_specs) > QUIZ_BATCH_MAX_SPECS:
+        return jsonify({'error': f'At most {QUIZ_BATCH_MAX_SPECS} quiz specs per batch'}), 400
+    
+    defaults = {key: data[key] for key in SPEC_FIELDS if key in data}
+    try:
+        specs = [normalize_spec(spec, defaults) for spec in raw_specs]
+    except (TypeError, ValueError, AttributeError) as e:
+        return jsonify({'error': f'Invalid quiz spec: {str(e)}'}), 400
+    
+    print(f"📚 Batch generating {len(specs)} quizzes (concurrency {QUIZ_GENERATION_CONCURRENCY})")
+    
+    def generate():
+        sources = {}
+        for record in generate_batch(specs, create_quiz_response):
+            result = attach_quiz_session(record['spec'], record['result'], record['status'])
+            sources[result.get('source', 'error')] = sources.get(result.get('source', 'error'), 0) + 1
+            yield current_app.json.dumps({'type': 'quiz', 'index': record['index'], 'spec': record['spec'], 'status': record['status'], **result}) + '\n'
+        yield current_app.json.dumps({'type': 'summary', 'total': len(specs), 'sources': sources}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@bp.route('/api/quiz/<quiz_id>/variants', methods=['POST'])
+def quiz_variants(quiz_id):
+    """Seeded per-student variants of a stored MCQ quiz - no extra LLM calls"""
+    data = request.json or {}
+    quiz_session = load_quiz_session(quiz_id)
+    if quiz_session is None:
+        return jsonify({'error': 'Quiz session not found or expired', 'code': 'quiz_session_expired'}), 404
+    if quiz_session['quiz_type'] != 'mcq':
+        return jsonify({'error': 'Variants are only available for MCQ quizzes'}), 400
+    error = variant_error(quiz_session['quiz'])
+    if error:
+        return jsonify({'error': f'Quiz cannot be varied: {error}'}), 400
+    
+    # Students get a seed derived from the quiz and their id; otherwise explicit seeds,
+    # or random seeds for anonymous students (returned so they can be sent back for grading)
+    students = data.get('students')
+    requested_seeds = data.get('seeds')
+    for field, value in (('students', students), ('seeds', requested_seeds)):
+        if value is not None and not isinstance(value, list):
+            return jsonify({'error': f'{field} must be a list'}), 400
+    try:
+        count = int(data.get('count', 1))
+        size = int(data['numQuestions']) if data.get('numQuestions') else None
+    except (TypeError, ValueError, OverflowError) as e:
+        return jsonify({'error': f'Invalid variant request: {str(e)}'}), 400
+    # Bound the request before building anything proportional to it
+    requested = len(students) if students else len(requested_seeds) if requested_seeds else count
+    if not 1 <= requested <= MAX_VARIANTS:
+        return jsonify({'error': f'Between 1 and {MAX_VARIANTS} variants per request'}), 400
+    try:
+        if students:
+            seeds = [(student, variant_seed(quiz_id, student)) for student in students]
+        elif requested_seeds:
+            seeds = [(None, int(seed)) for seed in requested_seeds]
+        else:
+            seeds = [(None, random_variant_seed()) for _ in range(count)]
+    except (TypeError, ValueError, OverflowError) as e:
+        return jsonify({'error': f'Invalid variant request: {str(e)}'}), 400
+
+    variants = []
+    for student, seed in seeds:
+        quiz = make_variant(quiz_session['quiz'], seed, size)
+        if HIDE_ANSWER_KEYS:
+            quiz = strip_answer_keys(quiz)
+        variant = {'variant_seed': seed, 'variant_size': quiz['variant_size'], 'quiz': {**quiz, 'quiz_id': quiz_id}}
+        if student is not None:
+            variant['student_id'] = student
+        variants.append(variant)
+    
+    print(f"🔀 Built {len(variants)} variants of quiz {quiz_id} locally")
+    return jsonify({'quiz_id': quiz_id, 'variants': variants})
+
+def create_quiz_response(data):
+    """Build the generate-quiz response body and status for a request payload"""
+    pooled = warm_pool_quiz_response(data)
+    if pooled:
+        return pooled
+    upgraded = take_upgrade(data)
+    if upgraded:
+        print(f"⬆️ Serving the AI quiz that arrived after a fallback for {data.get('topic', '')}")
+        return {**upgraded, 'upgraded': True}, 200
+
+    if not upstream_health.available():
+        return local_quiz_response(data, 'upstream_down')
+    try:
+        deadline = quiz_deadline(data)
+        if deadline:
+            return race_quiz_generation(data, deadline)
+        return gated_quiz_generation(data)
+    except OverloadedError:
+        return local_quiz_response(data, 'overloaded')
+
+def gated_quiz_generation(data):
+    """Generate with the AI under the admission gate, feeding the warm pool"""
+    with gates['generate-quiz'].admit():
+        result, status = generate_quiz_response(data)
+    return remember_generated_quiz(data, result, status)
+
+def race_quiz_generation(data, deadline):
+    """Start the AI and the local fallback together; a late AI quiz is kept for the next identical request"""
+    def keep_late_quiz(late):
+        result, status = late
+        if status == 200 and result.get('source') == 'groq_ai_realtime':
+            stash_upgrade(data, result)
+            print(f"⬆️ Late AI quiz for {data.get('topic', '')} stashed for the next identical request")
+
+    (result, status), on_time = race_to_deadline(
+        lambda: gated_quiz_generation(data),
+        lambda: (local_quiz_body(data, 'deadline'), 200),
+        deadline,
+        keep_late_quiz
+    )
+    if on_time:
+        return result, status
+    print(f"⏱️ AI quiz missed the {deadline:g}s deadline - serving the fallback while it finishes")
+    return {**result, 'upgrade_pending': True}, status
+
+def warm_pool_quiz_response(data):
+    """Record demand for the request and serve it from the warm pool when the pool is big enough"""
+    key = quiz_key(data)
+    if key is None:
+        return None
+    demand.record(key, data)
+    num_questions = int(data.get('numQuestions', 10))
+    questions = sample_from_pool(key, num_questions)
+    if not questions:
+        return None
+    print(f"🔥 Serving {num_questions} questions from the warm pool for {data.get('topic', '')}")
+    return {
+        'success': True,
+        'quiz': {
+            'questions': questions,
+            'total_questions': len(questions),
+            'subject': data.get('subject', ''),
+            'topic': data.get('topic', ''),
+            'difficulty': data.get('difficulty', 'medium'),
+            'academic_level': data.get('academicLevel', 'Secondary'),
+            'quiz_type': data.get('quizType', 'mcq'),
+            'generated_by': 'groq_ai',
+            'generation_timestamp': datetime.now().isoformat()
+        },
+        'source': 'warm_pool',
+        'message': f'Served {len(questions)} pre-generated questions'
+    }, 200
+
+def local_quiz_response(data, reason):
+    """Saturated, out of budget or upstream down: an immediate local quiz beats waiting on the upstream"""
+    print(f"🚦 Serving the enhanced fallback quiz ({reason})")
+    return local_quiz_body(data, reason), 200
+
+def local_quiz_body(data, reason):
+    """Enhanced fallback quiz body, tagged with why it was served"""
+    quiz_type = data.get('quizType', 'mcq')
+    return {
+        'success': True,
+        'quiz': generate_enhanced_fallback_quiz(
+            data.get('subject', ''), data.get('topic', ''), quiz_type, int(data.get('numQuestions', 10)),
+            data.get('difficulty', 'medium'), data.get('academicLevel', 'Secondary')
+        ),
+        'quiz_type': quiz_type,
+        'subject': data.get('subject', ''),
+        'topic': data.get('topic', ''),
+        'academic_level': data.get('academicLevel', 'Secondary'),
+        'source': 'enhanced_fallback',
+        'degraded': reason
+    }
+
+def remember_generated_quiz(data, result, status):
+    """Feed fresh AI questions into the warm pool for this request's key"""
+    if status == 200 and result.get('source') == 'groq_ai_realtime':
+        add_to_pool(quiz_key(data), result['quiz']['questions'])
+    return result, status
+
+def generate_quiz_response(data):
+    """Generate a quiz with the AI (falling back locally), bypassing the warm pool"""
+    return run_completion_steps(quiz_generation_steps(data))
+
+def quiz_continuation_payload(payload, kept, remaining):
+    """Follow-up request for the questions a truncated quiz completion is missing"""
+    written = '\n'.join(f"- {question.get('question', '')}" for question in kept)
+    note = f"""Your previous response was cut off after {len(kept)} complete questions. These are already written:
+{written}
+
+Generate ONLY the {remaining} remaining questions, different from the ones above, numbered from {len(kept) + 1}.
+Use the same JSON format: {{"questions": [...]}}. Respond with ONLY the JSON object."""
+    return {**payload, 'messages': payload['messages'] + [{'role': 'user', 'content': note}]}
+
+def quiz_generation_steps(data):
+    """Quiz generation as completion steps: yields the Groq payload, receives the response"""
     try:
-        data = request.json
-        
         # Extract parameters
         academic_level = data.get('academicLevel', 'Secondary')
         subject = data.get('subject', '')
@@ -235,7 +700,7 @@ def generate_quiz():
         difficulty = data.get('difficulty', 'medium')  # 'easy', 'medium', 'hard'
         
         if not GROQ_API_KEY:
-            return jsonify({'error': 'Groq API key not configured. Please set GROQ_API_KEY in your .env file'}), 500
+            return {'error': 'Groq API key not configured. Please set GROQ_API_KEY in your .env file'}, 500
         
         print(f"🎯 Generating {quiz_type} quiz: {num_questions} questions for {subject} - {topic} (Level: {academic_level}, Difficulty: {difficulty})")
         
@@ -360,57 +825,6 @@ RESPONSE FORMAT - VALID JSON ONLY:
 }}
 
 CRITICAL: Respond with ONLY the JSON object. No additional text, markdown, or explanations."""
-        "A": "First detailed option",
-        "B": "Second detailed option", 
-        "C": "Third detailed option",
-        "D": "Fourth detailed option"
-      }},
-      "correct_answer": "B",
-      "explanation": "Detailed explanation of why option B is correct and why others are wrong",
-      "difficulty": "{difficulty}",
-      "academic_level": "{academic_level}"
-    }}
-  ]
-}}"""
-        else:  # subjective
-            system_prompt = f"""You are an internationally renowned educator and master of {subject} at the {academic_level} level. You have deep expertise in {topic}.
-
-Create {num_questions} subjective (long answer) questions about {topic} for {academic_level} level students with {difficulty} difficulty.
-
-Context: {context}
-
-Difficulty Guidelines:
-- Easy: Basic explanation and description questions
-- Medium: Analysis, comparison, and application questions
-- Hard: Critical evaluation, synthesis, and complex problem-solving questions
-
-Requirements:
-- Questions should be appropriate for {academic_level} level students
-- All questions should be at {difficulty} difficulty level
-- Questions should encourage critical thinking and detailed explanations
-- Include key points that should be covered in answers
-- Questions should test deep understanding and application
-
-You MUST respond with ONLY valid JSON. No other text, no markdown, no explanations. Just the JSON object.
-
-Format:
-{{
-  "questions": [
-    {{
-      "id": 1,
-      "question": "Explain the main concept and its applications?",
-      "key_points": ["Key point 1", "Key point 2", "Key point 3"],
-      "difficulty": "{difficulty}",
-      "expected_length": "2-3 paragraphs"
-    }}
-  ]
-}}"""
-        
-        # Enhanced API call for real-time AI generation
-        headers = {
-            'Authorization': f'Bearer {GROQ_API_KEY}',
-            'Content-Type': 'application/json'
-        }
         
         payload = {
             'model': 'llama3-70b-8192',  # Use more powerful model for better quality
@@ -432,27 +846,10 @@ Format:
         }
         
         print(f"🤖 Making enhanced Groq API call for {num_questions} unique {quiz_type} questions...")
-                },
-                {
-                    'role': 'user',
-                    'content': system_prompt
-                }
-            ],
-            'max_tokens': 4000,  # Increased for more questions
-            'temperature': 0.7,  # Balanced for creativity and consistency
-            'top_p': 0.9
-        }
         
         print(f"Making request to Groq API for {num_questions} questions...")
         
-        session = create_http_session()
-        
-        response = session.post(
-            GROQ_API_URL, 
-            headers=headers, 
-            json=payload, 
-            timeout=(15, 90)  # Increased timeout for complex generation
-        )
+        response = yield payload, (15, 90)  # Increased timeout for complex generation
         
         if response.status_code == 200:
             result = response.json()
@@ -475,7 +872,17 @@ Format:
             
             # Try to extract and validate JSON
             try:
-                quiz_data = json.loads(content)
+                if is_truncated(result):
+                    # Cut off at max_tokens: keep the complete questions and ask only for the rest
+                    questions = yield from continue_truncated_array(
+                        payload, result, 'questions', num_questions,
+                        lambda kept, remaining: quiz_continuation_payload(payload, kept, remaining), (15, 90)
+                    )
+                    for number, question in enumerate(questions, 1):
+                        question['id'] = number
+                    quiz_data = {'questions': questions}
+                else:
+                    quiz_data = json.loads(content)
                 
                 # Comprehensive validation
                 if 'questions' not in quiz_data or not isinstance(quiz_data['questions'], list):
@@ -537,6 +944,11 @@ Format:
                     
                     validated_questions.append(validated_question)
                 
+                # Reject near-duplicates the prompt alone cannot prevent
+                validated_questions, duplicates = dedupe_questions(validated_questions)
+                if duplicates:
+                    print(f"🧹 Removed {len(duplicates)} near-duplicate AI questions")
+                
                 # Ensure we have the requested number of questions
                 if len(validated_questions) < num_questions:
                     print(f"⚠️ Only {len(validated_questions)} valid questions generated, need {num_questions}")
@@ -559,15 +971,15 @@ Format:
                 
                 print(f"✅ Successfully processed {len(validated_questions)} AI-generated questions")
                 
-                return jsonify({
+                return {
                     'success': True,
                     'quiz': quiz_result,
                     'source': 'groq_ai_realtime',
                     'message': f'Generated {len(validated_questions)} unique {quiz_type} questions using AI'
-                })
+                }, 200
                 
                 print(f"✅ Successfully generated {len(quiz_data['questions'])} questions via AI")
-                return jsonify({
+                return {
                     'success': True,
                     'quiz': quiz_data,
                     'quiz_type': quiz_type,
@@ -575,7 +987,7 @@ Format:
                     'topic': topic,
                     'academic_level': academic_level,
                     'source': 'ai'
-                })
+                }, 200
                 
             except json.JSONDecodeError as e:
                 print(f"JSON parsing error: {e}")
@@ -589,7 +1001,7 @@ Format:
                         quiz_data = json.loads(json_match.group())
                         if 'questions' in quiz_data and len(quiz_data['questions']) > 0:
                             print("✅ Successfully extracted JSON from response")
-                            return jsonify({
+                            return {
                                 'success': True,
                                 'quiz': quiz_data,
                                 'quiz_type': quiz_type,
@@ -597,14 +1009,14 @@ Format:
                                 'topic': topic,
                                 'academic_level': academic_level,
                                 'source': 'ai_extracted'
-                            })
+                            }, 200
                     except Exception as extract_error:
                         print(f"Failed to extract JSON: {extract_error}")
                 
                 # If all parsing fails, use enhanced fallback
                 print("🔄 Using enhanced fallback quiz due to parsing failure")
                 fallback_quiz = generate_enhanced_fallback_quiz(subject, topic, quiz_type, num_questions, difficulty, academic_level)
-                return jsonify({
+                return {
                     'success': True,
                     'quiz': fallback_quiz,
                     'quiz_type': quiz_type,
@@ -612,14 +1024,14 @@ Format:
                     'topic': topic,
                     'academic_level': academic_level,
                     'source': 'enhanced_fallback'
-                })
+                }, 200
                 
             except ValueError as e:
                 print(f"Quiz validation error: {e}")
                 # Use enhanced fallback instead of returning error
                 print("🔄 Using enhanced fallback quiz due to validation error")
                 fallback_quiz = generate_enhanced_fallback_quiz(subject, topic, quiz_type, num_questions, difficulty, academic_level)
-                return jsonify({
+                return {
                     'success': True,
                     'quiz': fallback_quiz,
                     'quiz_type': quiz_type,
@@ -627,7 +1039,7 @@ Format:
                     'topic': topic,
                     'academic_level': academic_level,
                     'source': 'enhanced_fallback'
-                })
+                }, 200
                 
         else:
             print(f"Groq API error: {response.status_code}")
@@ -635,7 +1047,7 @@ Format:
             # Use enhanced fallback instead of returning error
             print("🔄 Using enhanced fallback quiz due to API error")
             fallback_quiz = generate_enhanced_fallback_quiz(subject, topic, quiz_type, num_questions, difficulty, academic_level)
-            return jsonify({
+            return {
                 'success': True,
                 'quiz': fallback_quiz,
                 'quiz_type': quiz_type,
@@ -643,8 +1055,12 @@ Format:
                 'topic': topic,
                 'academic_level': academic_level,
                 'source': 'enhanced_fallback'
-            })
+            }, 200
             
+    except TokenBudgetExceeded:
+        return local_quiz_response(data, 'token_budget')
+    except UpstreamUnavailable:
+        return local_quiz_response(data, 'upstream_down')
     except Exception as e:
         print(f"Error generating quiz: {e}")
         
@@ -652,7 +1068,7 @@ Format:
         print("🔄 Using enhanced fallback quiz generation due to exception...")
         try:
             fallback_quiz = generate_enhanced_fallback_quiz(subject, topic, quiz_type, num_questions, difficulty, academic_level)
-            return jsonify({
+            return {
                 'success': True,
                 'quiz': fallback_quiz,
                 'quiz_type': quiz_type,
@@ -660,13 +1076,13 @@ Format:
                 'topic': topic,
                 'academic_level': academic_level,
                 'source': 'enhanced_fallback'
-            })
+            }, 200
         except Exception as fallback_error:
             print(f"Enhanced fallback quiz generation failed: {fallback_error}")
             # Last resort - use basic fallback
             try:
                 basic_fallback = generate_fallback_quiz(subject, topic, quiz_type, num_questions, difficulty, academic_level)
-                return jsonify({
+                return {
                     'success': True,
                     'quiz': basic_fallback,
                     'quiz_type': quiz_type,
@@ -674,16 +1090,134 @@ Format:
                     'topic': topic,
                     'academic_level': academic_level,
                     'source': 'basic_fallback'
-                })
+                }, 200
             except:
-                return jsonify({'error': f'Failed to generate quiz: {str(e)}'}), 500
+                return {'error': f'Failed to generate quiz: {str(e)}'}, 500
 
-@app.route('/api/explain-topic', methods=['POST'])
+@bp.route('/api/explain-topic', methods=['POST'])
 def explain_topic():
     """Generate real-time AI explanation for any topic"""
+    result, status = create_explanation_response(request.json or {})
+    return api_response(result, status)
+
+def api_response(result, status):
+    """JSON response, with Retry-After when the body reports overload"""
+    if status == 503 and 'retry_after' in result:
+        return jsonify(result), status, {'Retry-After': str(result['retry_after'])}
+    return jsonify(result), status
+
+def create_explanation_response(data):
+    """Serve a popular explanation from the warm cache, otherwise generate it"""
+    if data.get('mode') == 'progressive':
+        return create_outline_response(data)
+    cached = cached_explanation_response(data)
+    if cached:
+        return cached
+
+    try:
+        with gates['explain'].admit():
+            result, status = generate_explanation_response(data)
+    except OverloadedError as e:
+        return overloaded_explanation_response(e.retry_after)
+    return remember_explanation(data, result, status)
+
+def cached_explanation_response(data):
+    """Record demand for the request and serve it from the explanation cache if present"""
+    key = explanation_key(data)
+    if key is None:
+        return None
+    demand.record(key, data)
+    cached = cached_explanation(key)
+    return ({**cached, 'cached': True}, 200) if cached else None
+
+def overloaded_explanation_response(retry_after):
+    return {'error': 'Explanation service is busy - please retry shortly', 'code': 'overloaded', 'retry_after': retry_after}, 503
+
+def remember_explanation(data, result, status):
+    if status == 200:
+        cache_explanation(explanation_key(data), result)
+    return result, status
+
+def create_outline_response(data):
+    """Progressive mode: a quick outline now, sections on demand from /api/explain-topic/<id>/sections/<n>"""
+    cached = cached_outline_response(data)
+    if cached:
+        return cached
+    try:
+        with gates['explain'].admit():
+            outline = run_completion_steps(outline_steps(data))
+    except Exception as e:
+        return outline_error_response(data, e)
+    return serve_outline(data, outline)
+
+def cached_outline_response(data):
+    """Validation error or cached outline for a progressive request, else None"""
+    if not GROQ_API_KEY:
+        return {'error': 'Groq API key not configured'}, 500
+    if not data.get('topic'):
+        return {'error': 'Topic is required'}, 400
+    entry = cached_outline(data)
+    if entry is None:
+        return None
+    prefetch_sections(entry['outline'], lambda section_id: section_generator(entry, section_id))
+    return {**entry['outline'], 'cached': True}, 200
+
+def outline_error_response(data, error):
+    """Map a failed outline call to its response; other upstream errors get the template outline"""
+    if isinstance(error, OverloadedError):
+        return overloaded_explanation_response(error.retry_after)
+    if isinstance(error, TokenBudgetExceeded):
+        return token_budget_response(error)
+    if isinstance(error, UpstreamUnavailable):
+        return upstream_unavailable_response(error)
+    if isinstance(error, requests.exceptions.RequestException):
+        print(f"⚠️ Outline call failed, serving the template outline: {error}")
+        return serve_outline(data, build_outline(data, None))
+    raise error
+
+def serve_outline(data, outline):
+    """Keep the outline for section requests and start generating the first sections"""
+    entry = remember_outline(data, outline)
+    prefetch_sections(outline, lambda section_id: section_generator(entry, section_id))
+    print(f"🗂️ Outline for {data.get('topic', '')}: {len(outline['sections'])} sections ({outline['source']})")
+    return outline, 200
+
+def section_generator(entry, section_id):
+    return lambda: run_completion_steps(section_steps(entry, section_id))
+
+@bp.route('/api/explain-topic/<explanation_id>/sections/<int:section_id>', methods=['GET'])
+def explanation_section(explanation_id, section_id):
+    """One section of a progressive explanation, generated on first request and cached"""
+    entry = get_outline(explanation_id)
+    if entry is None:
+        return jsonify({'error': 'Explanation outline not found or expired', 'code': 'outline_expired'}), 404
+    if not 1 <= section_id <= len(entry['outline']['sections']):
+        return jsonify({'error': 'Section not found in outline'}), 404
+    
+    cached = cached_section(explanation_id, section_id)
+    if cached:
+        return jsonify({**cached, 'cached': True})
+    try:
+        with gates['explain'].admit():
+            future = section_future(explanation_id, section_id, section_generator(entry, section_id))
+            result, status = future.result(timeout=SECTION_WAIT_SECONDS)
+    except OverloadedError as e:
+        result, status = overloaded_explanation_response(e.retry_after)
+    except TokenBudgetExceeded as e:
+        result, status = token_budget_response(e)
+    except UpstreamUnavailable as e:
+        result, status = upstream_unavailable_response(e)
+    except (requests.exceptions.RequestException, FutureTimeout) as e:
+        result, status = {'error': f'Failed to generate section: {str(e) or "timed out"}'}, 502
+    return api_response(result, status)
+
+def generate_explanation_response(data):
+    """Generate an explanation with the AI, bypassing the warm cache"""
+    return run_completion_steps(explanation_steps(data))
+
+def explanation_steps(data):
+    """Explanation as completion steps: yields the Groq payload, receives the response"""
     try:
-        data = request.json
-        
         topic = data.get('topic', '')
         subject = data.get('subject', '')
         academic_level = data.get('academicLevel', 'Secondary')
@@ -691,10 +1225,10 @@ def explain_topic():
         explanation_type = data.get('type', 'comprehensive')  # comprehensive, quick, detailed
         
         if not GROQ_API_KEY:
-            return jsonify({'error': 'Groq API key not configured'}), 500
+            return {'error': 'Groq API key not configured'}, 500
         
         if not topic:
-            return jsonify({'error': 'Topic is required'}), 400
+            return {'error': 'Topic is required'}, 400
         
         print(f"Generating AI explanation for {topic} in {subject}")
         
@@ -761,12 +1295,6 @@ Aim for 1500-2000 words with technical depth appropriate for {academic_level} le
 
 Context: {context}"""
         
-        # Make request to Groq API
-        headers = {
-            'Authorization': f'Bearer {GROQ_API_KEY}',
-            'Content-Type': 'application/json'
-        }
-        
         payload = {
             'model': 'llama3-8b-8192',
             'messages': [
@@ -783,8 +1311,7 @@ Context: {context}"""
             'temperature': 0.7
         }
         
-        session = create_http_session()
-        response = session.post(GROQ_API_URL, headers=headers, json=payload, timeout=(10, 30))
+        response = yield payload, (10, 30)
         
         if response.status_code == 200:
             groq_response = response.json()
@@ -792,7 +1319,7 @@ Context: {context}"""
             if 'choices' in groq_response and len(groq_response['choices']) > 0:
                 explanation = groq_response['choices'][0]['message']['content'].strip()
                 
-                return jsonify({
+                return {
                     'success': True,
                     'explanation': explanation,
                     'topic': topic,
@@ -802,22 +1329,32 @@ Context: {context}"""
                     'word_count': len(explanation.split()),
                     'generated_at': datetime.now().isoformat(),
                     'source': 'groq_ai'
-                })
+                }, 200
             else:
-                return jsonify({'error': 'No response from AI model'}), 500
+                return {'error': 'No response from AI model'}, 500
         else:
-            return jsonify({'error': f'AI API error: {response.status_code}'}), response.status_code
+            return {'error': f'AI API error: {response.status_code}'}, response.status_code
             
+    except TokenBudgetExceeded as e:
+        return token_budget_response(e)
+    except UpstreamUnavailable as e:
+        return upstream_unavailable_response(e)
     except Exception as e:
         print(f"Explanation generation error: {str(e)}")
-        return jsonify({'error': f'Failed to generate explanation: {str(e)}'}), 500
+        return {'error': f'Failed to generate explanation: {str(e)}'}, 500
 
-@app.route('/api/assess-quiz', methods=['POST'])
+@bp.route('/api/assess-quiz', methods=['POST'])
 def assess_quiz():
-    """Assess quiz answers using Groq API with detailed feedback"""
+    """Assess quiz answers: MCQ graded locally, subjective via Groq API with detailed feedback"""
+    data = request.json or {}
+    if request.args.get('mode') == 'job':
+        return submit_job('assess-quiz', data)
+    result, status = create_assessment_response(data)
+    return jsonify(result), status
+
+def create_assessment_response(data):
+    """Build the assess-quiz response body and status for a request payload"""
     try:
-        data = request.json
-        
         quiz_data = data.get('quiz', {})
         user_answers = data.get('answers', {})
         quiz_type = data.get('quizType', 'mcq')
@@ -825,176 +1362,254 @@ def assess_quiz():
         topic = data.get('topic', '')
         academic_level = data.get('academicLevel', 'Secondary')
         
-        if not GROQ_API_KEY:
-            return jsonify({'error': 'Groq API key not configured'}), 500
+        # Grade against the server's own copy of the quiz when we have one
+        quiz_id = data.get('quizId')
+        if quiz_id:
+            quiz_session = load_quiz_session(quiz_id)
+            if quiz_session is None:
+                return {'error': 'Quiz session not found or expired', 'code': 'quiz_session_expired'}, 404
+            quiz_data = quiz_session['quiz']
+            quiz_type = quiz_session['quiz_type']
+            subject = data.get('subject') or quiz_session['subject']
+            topic = data.get('topic') or quiz_session['topic']
+            academic_level = data.get('academicLevel') or quiz_session['academic_level']
+        elif missing_answer_keys(quiz_data, quiz_type):
+            return quiz_expired_response()
+        
+        # responseFormat 'compact' references questions by id; details are fetched per question
+        compact = data.get('responseFormat') == 'compact'
         
-        print(f"Assessing {quiz_type} quiz for {subject} - {topic}")
+        # A seeded variant is rebuilt from the canonical quiz, so feedback matches what the student saw
+        seed = data.get('variantSeed')
+        if seed is not None:
+            if quiz_type != 'mcq':
+                return {'error': 'Variants are only available for MCQ quizzes'}, 400
+            try:
+                seed = int(seed)
+                size = int(data['variantSize']) if data.get('variantSize') else None
+            except (TypeError, ValueError):
+                return {'error': 'variantSeed and variantSize must be integers'}, 400
+            quiz_data = make_variant(quiz_data, seed, size)
         
-        # Create comprehensive assessment prompt
+        # MCQ quizzes carry their own answer key - grade deterministically
         if quiz_type == 'mcq':
-            assessment_prompt = f"""You are an expert educator assessing a multiple-choice quiz on {topic} for a {academic_level} level student.
-
-QUIZ QUESTIONS AND USER ANSWERS:
-{json.dumps({'questions': quiz_data.get('questions', []), 'user_answers': user_answers}, indent=2)}
-
-Provide a comprehensive assessment with detailed question-by-question feedback. For each question, include:
-1. The full question text
-2. All answer options (A, B, C, D)
-3. User's selected answer
-4. Correct answer
-5. Detailed explanation of why the correct answer is right
-6. Why other options are wrong
-
-You MUST respond with ONLY valid JSON in this exact format:
-
-{{
-  "score": 85,
-  "total_questions": 5,
-  "correct_answers": 4,
-  "percentage": 80,
-  "grade": "B+",
-  "assessment": {{
-    "strengths": ["Good understanding of basic concepts", "Strong analytical skills"],
-    "areas_for_improvement": ["Need to review advanced concepts", "Practice more complex problems"],
-    "overall_feedback": "You demonstrate solid foundational knowledge but should focus on strengthening areas where you struggled."
-  }},
-  "question_feedback": [
-    {{
-      "question_id": 1,
-      "question_text": "What is the first and most famous cryptocurrency?",
-      "options": {{
-        "A": "Ethereum",
-        "B": "Bitcoin", 
-        "C": "Litecoin",
-        "D": "Ripple"
-      }},
-      "user_answer": "A",
-      "correct_answer": "B",
-      "is_correct": false,
-      "explanation": "Bitcoin was the first cryptocurrency, created by Satoshi Nakamoto in 2009. It remains the most famous and valuable cryptocurrency.",
-      "why_wrong": "Ethereum came later in 2015, though it introduced smart contracts."
-    }}
-  ],
-  "study_recommendations": [
-    "Review cryptocurrency history and major milestones",
-    "Study blockchain fundamentals and consensus mechanisms",
-    "Practice identifying key features of different cryptocurrencies"
-  ],
-  "resources": [
-    {{
-      "title": "Cryptocurrency Basics",
-      "description": "Comprehensive guide to understanding cryptocurrencies",
-      "type": "article"
-    }}
-  ]
-}}
-
-Ensure all question feedback includes the complete question text, all options, and detailed explanations."""
-
-        else:  # subjective
-            assessment_prompt = f"""You are an expert educator assessing subjective answers on {topic} for a {academic_level} level student.
-
-QUESTIONS AND USER ANSWERS:
-{json.dumps({'questions': quiz_data.get('questions', []), 'user_answers': user_answers}, indent=2)}
-
-Provide detailed feedback for each answer including what was good, what could be improved, and model answers.
-
-You MUST respond with ONLY valid JSON in this exact format:
-
-{{
-  "score": 85,
-  "total_questions": 3,
-  "percentage": 85,
-  "grade": "A-",
-  "assessment": {{
-    "strengths": ["Clear explanations", "Good use of examples", "Logical structure"],
-    "areas_for_improvement": ["More technical detail needed", "Better conclusion", "Include more recent developments"],
-    "overall_feedback": "Your answers show good understanding but could benefit from more depth and current examples."
-  }},
-  "question_feedback": [
-    {{
-      "question_id": 1,
-      "question_text": "Explain how blockchain technology works",
-      "user_answer": "User's actual answer text here",
-      "score": 7,
-      "max_score": 10,
-      "feedback": "Your explanation covers the basic concepts well. You correctly identified the key components like blocks, hashing, and decentralization. However, you could improve by explaining the consensus mechanism in more detail and providing a specific example of how transactions are validated.",
-      "model_answer": "A comprehensive model answer explaining blockchain technology...",
-      "suggestions": ["Add more detail about consensus mechanisms", "Include specific examples", "Explain cryptographic hashing"]
-    }}
-  ],
-  "study_recommendations": [
-    "Study consensus mechanisms in detail",
-    "Practice explaining technical concepts clearly",
-    "Review recent blockchain applications"
-  ]
-}}"""
-
-        # Make request to Groq API
-        headers = {
-            'Authorization': f'Bearer {GROQ_API_KEY}',
-            'Content-Type': 'application/json'
-        }
+            assessment_result = grade_mcq_quiz(quiz_data, user_answers, subject, topic)
+            if seed is not None:
+                canonical_ids = [question['canonical_id'] for question in quiz_data['questions']]
+                for item, canonical_id in zip(assessment_result['question_feedback'], canonical_ids):
+                    item['canonical_question_id'] = canonical_id
+                assessment_result['variant_seed'] = seed
+            print(f"⚡ Graded MCQ quiz locally: {assessment_result['correct_answers']}/{assessment_result['total_questions']} correct")
+            
+            if GROQ_API_KEY and data.get('enrichExplanations', ENRICH_BY_DEFAULT):
+                start_explanation_enrichment(assessment_result, topic, academic_level)
+            
+            return format_assessment(assessment_result, compact), 200
         
-        payload = {
-            'model': 'llama3-8b-8192',
-            'messages': [
-                {
-                    'role': 'system',
-                    'content': 'You are an expert educator providing detailed quiz assessments. Always respond with valid JSON only.'
-                },
-                {
-                    'role': 'user',
-                    'content': assessment_prompt
-                }
-            ],
-            'max_tokens': 4000,
-            'temperature': 0.3
-        }
+        # Pre-grade locally; only borderline or long answers go to the LLM
+        questions = quiz_data.get('questions', [])
+        question_feedback = pre_grade_answers(questions, user_answers)
+        review_ids = {str(item['question_id']) for item in question_feedback if item['needs_review']}
+        print(f"📝 Pre-graded {len(question_feedback)} {quiz_type} answers for {subject} - {topic}, {len(review_ids)} need AI review")
         
-        session = create_http_session()
-        response = session.post(GROQ_API_URL, headers=headers, json=payload, timeout=(10, 30))
+        if not review_ids or not GROQ_API_KEY:
+            return format_assessment(build_subjective_assessment(question_feedback, topic), compact), 200
         
-        if response.status_code == 200:
-            groq_response = response.json()
-            
-            if 'choices' in groq_response and len(groq_response['choices']) > 0:
-                ai_response = groq_response['choices'][0]['message']['content'].strip()
-                
-                try:
-                    # Parse the JSON response
-                    assessment_result = json.loads(ai_response)
-                    
-                    # Ensure we have the required structure
-                    if 'question_feedback' not in assessment_result:
-                        assessment_result['question_feedback'] = []
-                    
-                    return jsonify(assessment_result)
-                    
-                except json.JSONDecodeError as e:
-                    print(f"JSON decode error: {e}")
-                    print(f"AI Response: {ai_response[:500]}...")
-                    
-                    # Fallback to enhanced fallback assessment
-                    return jsonify(generate_enhanced_fallback_assessment(quiz_data, user_answers, quiz_type, subject, topic))
-            else:
-                return jsonify({'error': 'No response from AI model'}), 500
-        else:
-            print(f"Groq API error: {response.status_code} - {response.text}")
-            # Fallback to enhanced fallback assessment
-            return jsonify(generate_enhanced_fallback_assessment(quiz_data, user_answers, quiz_type, subject, topic))
+        # Escalated answers are graded by concurrent per-question calls
+        try:
+            with gates['assess-review'].admit():
+                question_feedback = review_escalated_answers(questions, question_feedback, topic, academic_level, compact=compact)
+        except OverloadedError:
+            # Saturated: keep the local provisional grades rather than wait
+            print(f"🚦 AI review at capacity - returning {len(review_ids)} provisional grades")
+            question_feedback = [
+                {**item, 'needs_review': False, 'review_status': 'overloaded'} if item['needs_review'] else item
+                for item in question_feedback
+            ]
+        return format_assessment(build_subjective_assessment(question_feedback, topic), compact), 200
             
     except Exception as e:
         print(f"Assessment error: {str(e)}")
         # Fallback to enhanced fallback assessment
         try:
-            return jsonify(generate_enhanced_fallback_assessment(quiz_data, user_answers, quiz_type, subject, topic))
+            fallback = generate_enhanced_fallback_assessment(quiz_data, user_answers, quiz_type, subject, topic)
+            return format_assessment(fallback, data.get('responseFormat') == 'compact'), 200
         except:
-            return jsonify({'error': f'Failed to assess quiz: {str(e)}'}), 500
+            return {'error': f'Failed to assess quiz: {str(e)}'}, 500
+
+def missing_answer_keys(quiz_data, quiz_type):
+    """True when a client-posted quiz lacks the answer keys needed to grade it (e.g. they were hidden)"""
+    questions = (quiz_data.get('questions') or []) if isinstance(quiz_data, dict) else []
+    if quiz_type == 'mcq':
+        return any(normalize_option(question.get('correct_answer')) is None for question in questions)
+    return any(not question.get('model_answer') and not question.get('key_points') for question in questions)
+
+def quiz_expired_response():
+    """A posted quiz without answer keys cannot be graded; its server-side session has expired"""
+    return {
+        'error': 'This quiz has expired and can no longer be graded - please generate a new quiz',
+        'code': 'quiz_expired'
+    }, 410
+
+def format_assessment(assessment_result, compact):
+    """Full assessment, or its compact view with the full one kept for lazy lookups"""
+    return compact_assessment(assessment_result) if compact else assessment_result
+
+@bp.route('/api/assess-quiz/batch', methods=['POST'])
+def assess_quiz_batch():
+    """Assess a whole class against one quiz, streaming NDJSON results per student"""
+    data = request.json or {}
+    
+    quiz_data = data.get('quiz', {})
+    quiz_type = data.get('quizType', 'mcq')
+    topic = data.get('topic', '')
+    academic_level = data.get('academicLevel', 'Secondary')
+    students = data.get('students', [])
+    
+    quiz_id = data.get('quizId')
+    if quiz_id:
+        quiz_session = load_quiz_session(quiz_id)
+        if quiz_session is None:
+            return jsonify({'error': 'Quiz session not found or expired', 'code': 'quiz_session_expired'}), 404
+        quiz_data = quiz_session['quiz']
+        quiz_type = quiz_session['quiz_type']
+        topic = data.get('topic') or quiz_session['topic']
+        academic_level = data.get('academicLevel') or quiz_session['academic_level']
+    elif missing_answer_keys(quiz_data, quiz_type):
+        return api_response(*quiz_expired_response())
+    
+    questions = quiz_data.get('questions', [])
+    if not questions:
+        return jsonify({'error': 'Quiz with questions (or a valid quizId) is required'}), 400
+    if not isinstance(students, list) or not students:
+        return jsonify({'error': 'At least one student answer set is required'}), 400
+    
+    # variants: true grades each student on the variant derived from the quiz and their id
+    if data.get('variants') and quiz_type == 'mcq':
+        if not quiz_id:
+            return jsonify({'error': 'variants needs a quizId to derive student seeds'}), 400
+        try:
+            students = [
+                {**student, 'variantSeed': variant_seed(quiz_id, student.get('studentId', student.get('student_id')))}
+                if isinstance(student, dict) and student.get('variantSeed') is None else student
+                for student in students
+            ]
+        except ValueError:
+            return jsonify({'error': 'variants needs a studentId or variantSeed for every student'}), 400
+    try:
+        students = [
+            {**student, 'variantSeed': int(student['variantSeed']),
+             'variantSize': int(student.get('variantSize') or data.get('variantSize') or 0) or None}
+            if isinstance(student, dict) and student.get('variantSeed') is not None else student
+            for student in students
+        ]
+    except (TypeError, ValueError):
+        return jsonify({'error': 'variantSeed and variantSize must be integers'}), 400
+    
+    use_llm = bool(GROQ_API_KEY) and data.get('aiFeedback', True)
+    print(f"🏫 Batch assessing {len(students)} students on {quiz_type} quiz for {topic}")
+    
+    if quiz_type == 'mcq':
+        records = assess_mcq_class(questions, students, topic, academic_level, use_llm)
+    else:
+        records = assess_subjective_class(questions, students, topic, academic_level, use_llm)
+    
+    def generate():
+        for record in records:
+            yield current_app.json.dumps(record) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@bp.route('/api/assessment/<assessment_id>', methods=['GET'])
+def get_assessment_result(assessment_id):
+    """Fetch a stored assessment, including background-enriched explanations"""
+    assessment_result = get_assessment(assessment_id)
+    if assessment_result is None:
+        return jsonify({'error': 'Assessment not found or expired'}), 404
+    return jsonify(assessment_result)
+
+@bp.route('/api/assessment/<assessment_id>/questions/<question_id>', methods=['GET'])
+def get_assessment_question(assessment_id, question_id):
+    """Detailed feedback for one question, for clients holding a compact assessment"""
+    assessment_result = get_assessment(assessment_id)
+    if assessment_result is None:
+        return jsonify({'error': 'Assessment not found or expired'}), 404
+    item = find_question_feedback(assessment_result, question_id)
+    if item is None:
+        return jsonify({'error': 'Question not found in assessment'}), 404
+    return jsonify({**item, 'assessment_id': assessment_id, 'enrichment': assessment_result.get('enrichment')})
+
+# Background jobs: submit returns immediately, clients poll or subscribe via SSE
+JOB_HANDLERS = {
+    'generate-quiz': run_quiz_generation,
+    'assess-quiz': create_assessment_response
+}
+
+def submit_job(kind, payload):
+    try:
+        job = job_queue.submit(kind, JOB_HANDLERS[kind], payload)
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '10'}
+    
+    print(f"📥 Queued {kind} job {job.id}")
+    return jsonify({
+        **job.to_dict(include_result=False),
+        'status_url': f'/api/jobs/{job.id}',
+        'events_url': f'/api/jobs/{job.id}/events'
+    }), 202
+
+@bp.route('/api/jobs', methods=['POST'])
+def create_job():
+    """Queue a quiz generation or assessment job and return its id immediately"""
+    data = request.json or {}
+    kind = data.get('type')
+    if kind not in JOB_HANDLERS:
+        return jsonify({'error': f"Job type must be one of: {', '.join(JOB_HANDLERS)}"}), 400
+    return submit_job(kind, data.get('payload') or {})
+
+@bp.route('/api/jobs/metrics', methods=['GET'])
+def job_metrics():
+    """Queue depth, worker usage and timing for background jobs"""
+    return jsonify(job_queue.metrics())
+
+@bp.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Poll a job; the result and the handler's status_code are included once it has finished"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    return jsonify(job.to_dict())
+
+@bp.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued job, or discard the result of a running one"""
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    return jsonify(job.to_dict(include_result=False))
+
+@bp.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-sent events for job status changes, ending with the terminal state"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    
+    def stream():
+        version = None
+        while True:
+            if job.version != version:
+                version = job.version
+                yield f"event: {job.status}\ndata: {current_app.json.dumps(job.to_dict())}\n\n"
+                if job.status in TERMINAL_STATES:
+                    return
+            else:
+                yield ": keep-alive\n\n"
+            job_queue.wait_for_change(job, version, timeout=15)
+    
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 if __name__ == '__main__':
     # For local development
-    app.run(host='0.0.0.0', port=PORT, debug=True)
-else:
-    # For production (Gunicorn)
-    application = app
+    create_app().run(host='0.0.0.0', port=PORT, debug=True)
@@ -0,0 +1,283 @@
+"""
+ASGI serving mode. The upstream-bound endpoints (chat, explain-topic and
+generate-quiz) run on the event loop with the async Groq client, so slow
+upstream calls wait on sockets rather than holding a worker thread each.
+Every other route is served by the Flask app through a WSGI adapter.
+
+Run with: uvicorn asgi:app   (needs: pip install -r requirements.txt uvicorn)
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+
+import app as tutor
+from admission_control import MAX_REQUEST_BYTES, OverloadedError, check_request_limits, gates
+from bulkheads import current_bulkhead
+from cache_warmer import stash_upgrade, take_upgrade
+from deadline_race import quiz_deadline
+from groq_async import close_async_client, httpx, run_completion_steps_async
+from http_compression import RESPONSE_COMPRESSION, RESPONSE_COMPRESS_MIN_BYTES, compress, negotiate_encoding
+from progressive_explanation import outline_steps
+from rate_limit import check_rate_limit, client_id, endpoint_for, rate_limit_headers, rate_limited_body
+from upstream_health import upstream_health
+from usage_accounting import usage_tag
+
+try:
+    from asgiref.sync import sync_to_async
+    from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+except ImportError:  # optional; only the async serving mode needs it
+    WsgiToAsgi = None
+
+# Upstream calls allowed in flight at once; an async wait costs a socket, not a thread
+ASYNC_MAX_INFLIGHT = int(os.environ.get('ASYNC_MAX_INFLIGHT', 200))
+# Threads for Flask-routed requests (assessments, batches, SSE streams, health checks)
+ASYNC_WSGI_THREADS = int(os.environ.get('ASYNC_WSGI_THREADS', 32))
+
+_default_app = None
+
+
+class PooledWsgiToAsgi:
+    """
+    WSGI adapter that runs each request on a bounded thread pool. asgiref's
+    own WsgiToAsgi runs every request on one shared thread, so a long
+    assessment or an open SSE stream would hold up even the health checks.
+    """
+
+    def __init__(self, wsgi_application, max_threads=ASYNC_WSGI_THREADS):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='asgi-wsgi')
+        # The undecorated body of WsgiToAsgiInstance.run_wsgi_app; an asgiref
+        # internal, so the version is pinned in requirements.txt
+        run_wsgi_app = getattr(WsgiToAsgiInstance.__dict__.get('run_wsgi_app'), 'func', None)
+        if run_wsgi_app is None:
+            raise RuntimeError('Unsupported asgiref version: install the one pinned in requirements.txt')
+        self._run_wsgi_app = run_wsgi_app
+
+    async def __call__(self, scope, receive, send):
+        instance = WsgiToAsgiInstance(self.wsgi_application)
+        run = self._run_wsgi_app
+        instance.run_wsgi_app = sync_to_async(lambda body: run(instance, body), thread_sensitive=False, executor=self.executor)
+        await instance(scope, receive, send)
+
+
+class AsyncTutorApp:
+    """Native async handlers for the upstream-bound routes, Flask for everything else"""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = PooledWsgiToAsgi(flask_app)
+        self.json = flask_app.json
+        self.inflight = 0
+        self.background = set()
+        self.routes = {
+            '/api/chat': self.chat,
+            '/api/explain-topic': self.explain_topic,
+            '/api/generate-quiz': self.generate_quiz
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        handler = None
+        if scope['type'] == 'http' and scope['method'] == 'POST':
+            handler = self.routes.get(scope['path'])
+        # Job mode only enqueues work, the Flask route handles it
+        if handler is None or parse_qs(scope['query_string'].decode('latin-1')).get('mode') == ['job']:
+            return await self.wsgi(scope, receive, send)
+
+        body = await self.read_body(receive)
+        if body is None:
+            return await self.respond(scope, send, {'error': 'Request body too large', 'code': 'request_limit'}, 413)
+        try:
+            data = self.json.loads(body) if body else None
+        except ValueError:
+            return await self.respond(scope, send, {'error': 'Request body must be valid JSON'}, 400)
+        if data is not None:
+            error = check_request_limits(data)
+            if error:
+                return await self.respond(scope, send, {'error': error, 'code': 'request_limit'}, 400)
+
+        headers = Headers([(name.decode('latin-1'), value.decode('latin-1')) for name, value in scope['headers']])
+        remote_addr = (scope.get('client') or [None])[0]
+        decision = check_rate_limit('POST', scope['path'], headers, remote_addr, data)
+        extra_headers = rate_limit_headers(decision) if decision else {}
+        if decision and not decision['allowed']:
+            print(f"🚫 Rate limited {scope['path']} ({decision['bucket']} budget)")
+            return await self.respond(scope, send, rate_limited_body(decision), 429, extra_headers)
+
+        try:
+            with usage_tag(endpoint_for('POST', scope['path'], data)[0], client_id(headers, remote_addr)):
+                result, status = await handler(data)
+        except Exception as e:
+            print(f"❌ Async handler error on {scope['path']}: {str(e)}")
+            result, status = {'error': f'Internal server error: {str(e)}'}, 500
+        await self.respond(scope, send, result, status, extra_headers)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await close_async_client()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, receive):
+        """Request body, or None once it passes MAX_REQUEST_BYTES"""
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_REQUEST_BYTES:
+                return None
+            chunks.append(chunk)
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    async def respond(self, scope, send, result, status, extra_headers=None):
+        body = self.json.dumps(result).encode('utf-8') + b'\n'
+        headers = [
+            (b'content-type', b'application/json'),
+            (b'access-control-allow-origin', b'*'),
+            (b'vary', b'Accept-Encoding')
+        ]
+        headers += [(name.lower().encode(), value.encode()) for name, value in (extra_headers or {}).items()]
+        if status == 503 and 'retry_after' in result:
+            headers.append((b'retry-after', str(result['retry_after']).encode()))
+
+        if RESPONSE_COMPRESSION and len(body) >= RESPONSE_COMPRESS_MIN_BYTES:
+            accept = dict(scope['headers']).get(b'accept-encoding', b'').decode('latin-1')
+            encoding = negotiate_encoding(parse_accept_header(accept))
+            if encoding:
+                compressed = compress(body, encoding)
+                if len(compressed) < len(body):
+                    body = compressed
+                    headers.append((b'content-encoding', encoding.encode()))
+
+        headers.append((b'content-length', str(len(body)).encode()))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def run_steps(self, steps):
+        """Drive completion steps on the async client, shedding load past ASYNC_MAX_INFLIGHT or the partition's cap"""
+        if self.inflight >= ASYNC_MAX_INFLIGHT:
+            steps.close()
+            raise OverloadedError('async-upstream', 1)
+        bulkhead = current_bulkhead()
+        if bulkhead is not None and not bulkhead.try_enter_async():
+            steps.close()
+            raise OverloadedError(f'bulkhead-{bulkhead.name}', 1)
+        self.inflight += 1
+        try:
+            return await run_completion_steps_async(steps)
+        finally:
+            self.inflight -= 1
+            if bulkhead is not None:
+                bulkhead.leave_async()
+
+    async def chat(self, data):
+        try:
+            return await self.run_steps(tutor.chat_steps(data))
+        except OverloadedError as e:
+            return tutor.overloaded_chat_response(e.retry_after)
+
+    async def explain_topic(self, data):
+        data = data or {}
+        if data.get('mode') == 'progressive':
+            return await self.explain_outline(data)
+        cached = tutor.cached_explanation_response(data)
+        if cached:
+            return cached
+        try:
+            result, status = await self.run_steps(tutor.explanation_steps(data))
+        except OverloadedError as e:
+            return tutor.overloaded_explanation_response(e.retry_after)
+        return tutor.remember_explanation(data, result, status)
+
+    async def explain_outline(self, data):
+        """Progressive mode's outline; sections are fetched from the Flask route"""
+        cached = tutor.cached_outline_response(data)
+        if cached:
+            return cached
+        try:
+            outline = await self.run_steps(outline_steps(data))
+        except Exception as e:
+            return tutor.outline_error_response(data, e)
+        return tutor.serve_outline(data, outline)
+
+    async def generate_quiz(self, data):
+        data = data or {}
+        result, status = tutor.warm_pool_quiz_response(data) or self.upgraded_quiz(data) or await self.fresh_quiz(data)
+        return tutor.attach_quiz_session(data, result, status), status
+
+    async def fresh_quiz(self, data):
+        """Same upstream-health check as app.create_quiz_response before spending an AI call"""
+        if not upstream_health.available():
+            return tutor.local_quiz_response(data, 'upstream_down')
+        return await self.race_quiz(data)
+
+    def upgraded_quiz(self, data):
+        upgraded = take_upgrade(data)
+        return ({**upgraded, 'upgraded': True}, 200) if upgraded else None
+
+    async def ai_quiz(self, data):
+        try:
+            # The sync workers' generate-quiz gate, taken without queueing so the loop never blocks
+            with gates['generate-quiz'].try_admit():
+                result, status = await self.run_steps(tutor.quiz_generation_steps(data))
+        except OverloadedError:
+            return tutor.local_quiz_response(data, 'overloaded')
+        return tutor.remember_generated_quiz(data, result, status)
+
+    async def race_quiz(self, data):
+        """Event-loop version of app.race_quiz_generation"""
+        deadline = quiz_deadline(data)
+        if not deadline:
+            return await self.ai_quiz(data)
+        task = asyncio.ensure_future(self.ai_quiz(data))
+        fallback = tutor.local_quiz_body(data, 'deadline')
+        done, _ = await asyncio.wait({task}, timeout=deadline)
+        if done:
+            return task.result()
+
+        def keep_late_quiz(finished):
+            self.background.discard(finished)
+            if finished.cancelled() or finished.exception() is not None:
+                return
+            result, status = finished.result()
+            if status == 200 and result.get('source') == 'groq_ai_realtime':
+                stash_upgrade(data, result)
+                print(f"⬆️ Late AI quiz for {data.get('topic', '')} stashed for the next identical request")
+
+        # The loop only holds weak references to tasks
+        self.background.add(task)
+        task.add_done_callback(keep_late_quiz)
+        print(f"⏱️ AI quiz missed the {deadline:g}s deadline - serving the fallback while it finishes")
+        return {**fallback, 'upgrade_pending': True}, 200
+
+
+def create_asgi_app(start_background=True):
+    """Build the ASGI app around a fresh Flask app"""
+    if WsgiToAsgi is None or httpx is None:
+        raise RuntimeError('The async serving mode needs httpx and asgiref: pip install -r requirements.txt uvicorn')
+    print(f"⚡ Async serving mode: up to {ASYNC_MAX_INFLIGHT} upstream calls in flight, {ASYNC_WSGI_THREADS} threads for Flask routes")
+    return AsyncTutorApp(tutor.create_app(start_background=start_background, eager=True))
+
+
+def __getattr__(name):
+    # `uvicorn asgi:app` builds the default app lazily, like app.py does
+    global _default_app
+    if name == 'app':
+        if _default_app is None:
+            _default_app = create_asgi_app()
+        return _default_app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
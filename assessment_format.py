@@ -0,0 +1,45 @@
+"""
+Compact assessment responses: questions referenced by id, no echoed question
+content, and detail only where the student lost marks. The full assessment
+stays in the assessment store for lazy per-question lookups.
+"""
+
+from mcq_grading import save_assessment
+
+# Fields kept per question in compact mode; everything else is fetched lazily
+_MCQ_WRONG_FIELDS = ('question_id', 'is_correct', 'user_answer', 'correct_answer', 'why_wrong')
+_SUBJECTIVE_FIELDS = ('question_id', 'score', 'max_score', 'feedback', 'missing_points', 'graded_by', 'review_status')
+_SUMMARY_FIELDS = ('score', 'total_questions', 'correct_answers', 'percentage', 'grade', 'assessment',
+                   'study_recommendations', 'graded_by', 'enrichment', 'partial', 'provisional_questions')
+
+
+def compact_question(item):
+    if 'is_correct' in item:
+        if item['is_correct']:
+            return {'question_id': item['question_id'], 'is_correct': True}
+        return {key: item.get(key) for key in _MCQ_WRONG_FIELDS}
+
+    compact = {key: item[key] for key in _SUBJECTIVE_FIELDS if key in item}
+    if item.get('score', 0) >= item.get('max_score', 10):
+        # Full marks: nothing to improve on
+        compact.pop('feedback', None)
+        compact.pop('missing_points', None)
+    return compact
+
+
+def compact_assessment(assessment):
+    """Store the full assessment (if not stored yet) and return its compact view"""
+    assessment_id = assessment.get('assessment_id') or save_assessment(assessment)
+    compact = {key: assessment[key] for key in _SUMMARY_FIELDS if key in assessment}
+    compact['assessment_id'] = assessment_id
+    compact['format'] = 'compact'
+    compact['question_feedback'] = [compact_question(item) for item in assessment.get('question_feedback', [])]
+    return compact
+
+
+def find_question_feedback(assessment, question_id):
+    """Full feedback entry for one question of a stored assessment, or None"""
+    for item in assessment.get('question_feedback', []):
+        if str(item.get('question_id')) == str(question_id):
+            return item
+    return None
@@ -0,0 +1,265 @@
+"""
+Classroom batch assessment: grade many students against one quiz, explain each
+distinct wrong answer once, and report class-level aggregates
+"""
+
+import os
+import statistics
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import copy_context
+
+from admission_control import OverloadedError, gates
+from feedback_cache import feedback_key, lookup, remember
+from fallback_quiz_enhanced import calculate_grade, generate_question_explanation
+from mcq_grading import explain_wrong_answers_with_llm, lookup_answer, normalize_option
+from quiz_variants import canonical_answers
+from subjective_grader import build_subjective_assessment, pre_grade_answers, review_escalated_answers
+
+EXPLANATION_CHUNK = int(os.environ.get('BATCH_EXPLANATION_CHUNK', 8))
+EXPLANATION_WORKERS = int(os.environ.get('BATCH_EXPLANATION_WORKERS', 4))
+SUBJECTIVE_STUDENT_WORKERS = int(os.environ.get('BATCH_SUBJECTIVE_WORKERS', 4))
+
+
+def student_id(position, student):
+    return student.get('studentId', student.get('student_id', position + 1))
+
+
+def explanation_key(question_id, option):
+    return f"{question_id}:{option}"
+
+
+def answer_key(questions):
+    """(question ids, normalized correct options) for a list of MCQ questions"""
+    return ([question.get('id', i + 1) for i, question in enumerate(questions)],
+            [normalize_option(question.get('correct_answer')) for question in questions])
+
+
+def grade_mcq_students(questions, students):
+    """
+    Grade every student in one pass over a precomputed answer key.
+
+    Yields one compact result per student; wrong answers reference a shared
+    explanation_key instead of carrying their own explanation text. Students
+    with a variantSeed answered a seeded variant; their answers are mapped
+    back and graded against the canonical key.
+    """
+    canonical_key = answer_key(questions)
+
+    for position, student in enumerate(students):
+        answers = student.get('answers') or {}
+        student_questions, (question_ids, key) = questions, canonical_key
+        seed = student.get('variantSeed')
+        if seed is not None:
+            student_questions, answers = canonical_answers({'questions': questions}, seed, answers, student.get('variantSize'))
+            question_ids, key = answer_key(student_questions)
+        chosen = [normalize_option(lookup_answer(answers, question, i)) for i, question in enumerate(student_questions)]
+        correct = [answer is not None and answer == expected for answer, expected in zip(chosen, key)]
+        correct_count = sum(correct)
+        total = len(key)
+        percentage = (correct_count / total * 100) if total else 0
+
+        result = {
+            'type': 'student',
+            'student_id': student_id(position, student),
+            'score': correct_count * 10,
+            'correct_answers': correct_count,
+            'total_questions': total,
+            'percentage': round(percentage, 1),
+            'grade': calculate_grade(percentage),
+            'question_results': [
+                {
+                    'question_id': question_id,
+                    'user_answer': answer,
+                    'correct_answer': expected,
+                    'is_correct': is_correct,
+                    'explanation_key': None if is_correct or answer is None else explanation_key(question_id, answer)
+                }
+                for question_id, answer, expected, is_correct in zip(question_ids, chosen, key, correct)
+            ]
+        }
+        if seed is not None:
+            result['variant_seed'] = seed
+        yield result
+
+
+def explain_distinct_wrong_answers(questions, wrong_counts, topic, academic_level, use_llm):
+    """
+    One explanation per distinct (question, wrong option) pair. Pairs with
+    cached AI feedback are served from the cache; the rest are sent to the LLM
+    in small concurrent chunks, and anything the LLM does not cover gets the
+    local explanation.
+    """
+    questions_by_id = {str(question.get('id', i + 1)): question for i, question in enumerate(questions)}
+    items = []
+    explanations = {}
+    cache_keys = {}
+    for (question_id, option), count in wrong_counts.most_common():
+        question = questions_by_id[str(question_id)]
+        question_text = question.get('question', '')
+        correct_answer = normalize_option(question.get('correct_answer'))
+        key = explanation_key(question_id, option)
+        cache_keys[key] = feedback_key(question, correct_answer, option)
+        cached = lookup(cache_keys[key])
+        if cached is not None:
+            explanations[key] = {
+                'key': key,
+                'question_id': question_id,
+                'user_answer': option,
+                'students': count,
+                'explanation': cached['explanation'],
+                'why_wrong': cached['why_wrong'],
+                'source': 'ai'
+            }
+            continue
+        explanation, why_wrong = generate_question_explanation(question_text, correct_answer, option, question.get('options', {}))
+        explanations[key] = {
+            'key': key,
+            'question_id': question_id,
+            'user_answer': option,
+            'students': count,
+            'explanation': question.get('explanation') or explanation,
+            'why_wrong': why_wrong,
+            'source': 'local'
+        }
+        items.append({
+            'id': key,
+            'question': question_text,
+            'options': question.get('options', {}),
+            'correct_answer': correct_answer,
+            'user_answer': option
+        })
+
+    if use_llm and items:
+        chunks = [items[i:i + EXPLANATION_CHUNK] for i in range(0, len(items), EXPLANATION_CHUNK)]
+        with ThreadPoolExecutor(max_workers=min(EXPLANATION_WORKERS, len(chunks))) as pool:
+            futures = [pool.submit(copy_context().run, explain_wrong_answers_with_llm, chunk, topic, academic_level) for chunk in chunks]
+            for future in as_completed(futures):
+                try:
+                    generated = future.result()
+                except Exception as e:
+                    print(f"⚠️ Batch explanation chunk failed: {e}")
+                    continue
+                for key, extra in generated.items():
+                    if key in explanations:
+                        explanations[key].update({
+                            'explanation': extra.get('explanation') or explanations[key]['explanation'],
+                            'why_wrong': extra.get('why_wrong') or explanations[key]['why_wrong'],
+                            'source': 'ai'
+                        })
+                        remember(cache_keys[key], explanations[key]['explanation'], explanations[key]['why_wrong'])
+
+    return list(explanations.values())
+
+
+def class_summary(results, questions):
+    """Class-level aggregates over the streamed student results"""
+    percentages = [result['percentage'] for result in results]
+    summary = {
+        'type': 'summary',
+        'students': len(results),
+        'average_percentage': round(statistics.mean(percentages), 1) if percentages else 0,
+        'median_percentage': round(statistics.median(percentages), 1) if percentages else 0,
+        'highest_percentage': max(percentages) if percentages else 0,
+        'lowest_percentage': min(percentages) if percentages else 0,
+        'grade_distribution': dict(Counter(result['grade'] for result in results))
+    }
+
+    rows_by_question = defaultdict(list)
+    for result in results:
+        for row in result.get('question_results', []):
+            rows_by_question[row['question_id']].append(row)
+
+    question_stats = []
+    for i, question in enumerate(questions):
+        question_id = question.get('id', i + 1)
+        rows = rows_by_question.get(question_id)
+        if not rows:
+            continue
+        if 'is_correct' in rows[0]:
+            wrong = Counter(row['user_answer'] for row in rows if not row['is_correct'] and row['user_answer'])
+            question_stats.append({
+                'question_id': question_id,
+                'correct_rate': round(sum(1 for row in rows if row['is_correct']) / len(rows) * 100, 1),
+                'wrong_answers': dict(wrong),
+                'most_common_wrong_answer': wrong.most_common(1)[0][0] if wrong else None
+            })
+        else:
+            scores = [row['score'] for row in rows]
+            question_stats.append({
+                'question_id': question_id,
+                'average_score': round(statistics.mean(scores), 2),
+                'max_score': rows[0]['max_score']
+            })
+    summary['question_stats'] = question_stats
+    return summary
+
+
+def assess_mcq_class(questions, students, topic, academic_level, use_llm):
+    """Stream records for an MCQ class: students, shared explanations, summary"""
+    results = []
+    wrong_counts = Counter()
+    for result in grade_mcq_students(questions, students):
+        results.append(result)
+        for row in result['question_results']:
+            if row['explanation_key']:
+                wrong_counts[(row['question_id'], row['user_answer'])] += 1
+        yield result
+
+    yield {
+        'type': 'explanations',
+        'items': explain_distinct_wrong_answers(questions, wrong_counts, topic, academic_level, use_llm)
+    }
+    yield class_summary(results, questions)
+
+
+def assess_subjective_class(questions, students, topic, academic_level, use_llm):
+    """Stream records for a subjective class as each student's grading finishes"""
+    def grade_student(position, student):
+        feedback = pre_grade_answers(questions, student.get('answers') or {})
+        if use_llm and any(item['needs_review'] for item in feedback):
+            # Each student's review calls share the single-assessment gate, so a
+            # large class queues behind it instead of flooding the review pool
+            try:
+                with gates['assess-review'].admit():
+                    feedback = review_escalated_answers(questions, feedback, topic, academic_level)
+            except OverloadedError:
+                print(f"🚦 AI review at capacity - keeping provisional grades for student {student_id(position, student)}")
+                feedback = [
+                    {**item, 'needs_review': False, 'review_status': 'overloaded'} if item['needs_review'] else item
+                    for item in feedback
+                ]
+        assessment = build_subjective_assessment(feedback, topic)
+        return {
+            'type': 'student',
+            'student_id': student_id(position, student),
+            'score': assessment['score'],
+            'total_questions': assessment['total_questions'],
+            'percentage': assessment['percentage'],
+            'grade': assessment['grade'],
+            'partial': assessment.get('partial', False),
+            'question_results': [
+                {key: item.get(key) for key in ('question_id', 'score', 'max_score', 'feedback', 'missing_points', 'graded_by', 'review_status')}
+                for item in feedback
+            ]
+        }
+
+    results = []
+    with ThreadPoolExecutor(max_workers=SUBJECTIVE_STUDENT_WORKERS) as pool:
+        futures = {
+            pool.submit(copy_context().run, grade_student, position, student): (position, student)
+            for position, student in enumerate(students)
+        }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # One student's failure must not end the stream for the rest of the class
+                position, student = futures[future]
+                print(f"❌ Grading failed for student {student_id(position, student)}: {e}")
+                yield {'type': 'error', 'student_id': student_id(position, student), 'error': f'Grading failed: {str(e)}'}
+                continue
+            results.append(result)
+            yield result
+
+    yield class_summary(results, questions)
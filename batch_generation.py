@@ -0,0 +1,54 @@
+"""
+Bulk multi-topic quiz generation under a process-wide concurrency cap
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import copy_context
+
+# Shared by every batch request, so concurrent batches cannot multiply upstream load
+QUIZ_GENERATION_CONCURRENCY = int(os.environ.get('QUIZ_GENERATION_CONCURRENCY', 4))
+QUIZ_BATCH_MAX_SPECS = int(os.environ.get('QUIZ_BATCH_MAX_SPECS', 25))
+
+_generation_pool = ThreadPoolExecutor(max_workers=QUIZ_GENERATION_CONCURRENCY, thread_name_prefix='quiz-batch')
+
+SPEC_FIELDS = ('subject', 'topic', 'difficulty', 'quizType', 'numQuestions', 'academicLevel', 'context')
+
+
+def normalize_spec(spec, defaults=None):
+    """Fill a batch item from batch-level defaults and the single-quiz defaults"""
+    merged = {**(defaults or {}), **{key: spec[key] for key in SPEC_FIELDS if key in spec}}
+    return {
+        'subject': str(merged.get('subject', '')).strip(),
+        'topic': str(merged.get('topic', '')).strip(),
+        'difficulty': str(merged.get('difficulty', 'medium')).strip().lower(),
+        'quizType': str(merged.get('quizType', 'mcq')).strip().lower(),
+        'numQuestions': int(merged.get('numQuestions', 10)),
+        'academicLevel': merged.get('academicLevel', 'Secondary'),
+        'context': merged.get('context', '')
+    }
+
+
+def spec_key(spec):
+    return (spec['subject'].lower(), spec['topic'].lower(), spec['difficulty'],
+            spec['quizType'], spec['numQuestions'], spec['academicLevel'], spec['context'])
+
+
+def generate_batch(specs, generate_fn):
+    """
+    Run generate_fn(spec) -> (result, status) for every spec on the shared pool
+    and yield {'index', 'spec', 'status', 'result'} records as they complete.
+    Identical specs in one batch are generated once and fanned back out.
+    """
+    positions = {}
+    for index, spec in enumerate(specs):
+        positions.setdefault(spec_key(spec), []).append(index)
+
+    futures = {_generation_pool.submit(copy_context().run, generate_fn, specs[indexes[0]]): indexes for indexes in positions.values()}
+    for future in as_completed(futures):
+        try:
+            result, status = future.result()
+        except Exception as e:
+            result, status = {'error': f'Failed to generate quiz: {str(e)}'}, 500
+        for index in futures[future]:
+            yield {'index': index, 'spec': specs[index], 'status': status, 'result': result}
@@ -0,0 +1,516 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for AcadTutor's local (non-LLM) hot paths
+
+Usage:
+    python benchmark.py dedup --count 5000
+    python benchmark.py grader --samples graded_answers.jsonl
+    python benchmark.py responses --iterations 200
+    python benchmark.py serving --requests 400 --concurrency 200 --latency 1.0
+    python benchmark.py bulkheads --quizzes 60 --chats 40 --quiz-latency 5
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+
+def _question_bank():
+    """Flatten the fallback QUESTION_DATABASE into a list of MCQ questions"""
+    from fallback_quiz_enhanced import QUESTION_DATABASE
+
+    bank = []
+    for topics in QUESTION_DATABASE.values():
+        for levels in topics.values():
+            for questions in levels.values():
+                bank.extend(questions)
+    return bank
+
+
+def _synthetic_questions(count, seed=42):
+    """Distinct questions mixed with reworded bank copies, so duplicates are realistic"""
+    bank = _question_bank()
+
+    rng = random.Random(seed)
+    vocabulary = sorted({word for q in bank for word in q['question'].split()})
+    fillers = ['exactly', 'really', 'in practice', 'typically', 'best']
+    questions = []
+    for i in range(count):
+        base = bank[i % len(bank)]
+        if rng.random() < 0.5:
+            # Distinct question assembled from the bank's vocabulary
+            text = ' '.join(rng.sample(vocabulary, 10)) + '?'
+            options = {key: ' '.join(rng.sample(vocabulary, 3)) for key in 'ABCD'}
+        else:
+            # Near-duplicate rewording of a bank question
+            text = base['question'].replace('?', f" {rng.choice(fillers)}?")
+            options = dict(base['options'])
+        questions.append({'question': text, 'options': options})
+    return questions
+
+
+def bench_dedup(args):
+    from question_dedup import NearDuplicateIndex, dedupe_questions
+
+    questions = _synthetic_questions(args.count)
+    index = NearDuplicateIndex(threshold=args.threshold)
+
+    start = time.perf_counter()
+    unique, duplicates = dedupe_questions(questions, index=index)
+    elapsed = time.perf_counter() - start
+
+    print(f"🧪 Near-duplicate detection ({index.num_perm} perms, {index.bands} bands, threshold {index.threshold})")
+    print(f"   Questions:  {len(questions)}")
+    print(f"   Unique:     {len(unique)}")
+    print(f"   Duplicates: {len(duplicates)}")
+    print(f"   Time:       {elapsed * 1000:.1f} ms")
+    print(f"   Throughput: {len(questions) / elapsed:,.0f} questions/s")
+
+    bank = _question_bank()
+    _, bank_duplicates = dedupe_questions(bank, threshold=args.threshold)
+    print(f"   Question bank: {len(bank)} entries, {len(bank_duplicates)} near-duplicates")
+    return True
+
+
+_SAMPLE_QUESTION = {
+    'question': 'Explain how blockchain technology keeps records secure.',
+    'key_points': [
+        'Blocks are linked using cryptographic hashes',
+        'The ledger is decentralized across many nodes',
+        'Consensus mechanisms validate new transactions'
+    ],
+    'model_answer': 'A blockchain groups transactions into blocks. Each block stores the cryptographic hash '
+                    'of the previous block, so tampering breaks the chain. Copies of the ledger are kept on '
+                    'many decentralized nodes and a consensus mechanism such as proof of work validates '
+                    'new transactions before they are added.'
+}
+
+_SAMPLE_ANSWERS = [
+    '',
+    'It is secure.',
+    'Blockchain uses hashes to link blocks so that the records cannot be changed easily.',
+    'Each block contains the hash of the previous block, linking blocks together. The ledger is '
+    'decentralized over many nodes, and a consensus mechanism like proof of work validates transactions.',
+]
+
+
+def _grader_samples(path):
+    """Samples of {question, answer, llm_score?, llm_latency_ms?} from JSONL, or a built-in set"""
+    if path:
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    return [{'question': _SAMPLE_QUESTION, 'answer': answer} for answer in _SAMPLE_ANSWERS] * 250
+
+
+def bench_grader(args):
+    from subjective_grader import score_answer
+
+    samples = _grader_samples(args.samples)
+    results = []
+    start = time.perf_counter()
+    for sample in samples:
+        results.append(score_answer(sample['question'], sample.get('answer', '')))
+    elapsed = time.perf_counter() - start
+
+    escalated = sum(1 for r in results if r['needs_review'])
+    print(f"🧪 Subjective pre-grader on {len(samples)} answers")
+    print(f"   Local latency: {elapsed / len(samples) * 1000:.3f} ms/answer ({len(samples) / elapsed:,.0f} answers/s)")
+    print(f"   Escalated to LLM: {escalated} ({escalated / len(samples):.0%})")
+
+    graded = [(r['score'], float(s['llm_score'])) for r, s in zip(results, samples) if 'llm_score' in s]
+    if graded:
+        errors = [abs(local - llm) for local, llm in graded]
+        print(f"   Agreement vs LLM grades ({len(graded)} samples):")
+        print(f"     Mean absolute error: {sum(errors) / len(errors):.2f} points")
+        print(f"     Within 1 point: {sum(1 for e in errors if e <= 1) / len(errors):.0%}")
+        print(f"     Within 2 points: {sum(1 for e in errors if e <= 2) / len(errors):.0%}")
+        kept = [abs(r['score'] - float(s['llm_score'])) for r, s in zip(results, samples)
+                if 'llm_score' in s and not r['needs_review']]
+        if kept:
+            print(f"     MAE on answers kept local: {sum(kept) / len(kept):.2f} points")
+    else:
+        print("   No llm_score values in samples - agreement not measured")
+
+    llm_latencies = [float(s['llm_latency_ms']) for s in samples if 'llm_latency_ms' in s]
+    if llm_latencies:
+        print(f"   Recorded LLM latency: {sum(llm_latencies) / len(llm_latencies):.0f} ms/answer")
+    return True
+
+
+def _sample_payloads():
+    """A full MCQ assessment and a long explanation, the two largest response shapes"""
+    from mcq_grading import grade_mcq_quiz
+
+    questions = [dict(q, id=i + 1) for i, q in enumerate(_question_bank()[:10])]
+    answers = {str(q['id']): 'A' for q in questions}
+    assessment = grade_mcq_quiz({'questions': questions}, answers, 'Computer Science', 'Blockchain')
+
+    rng = random.Random(7)
+    vocabulary = sorted({word for q in _question_bank() for word in q['question'].split()})
+    paragraphs = [' '.join(rng.choice(vocabulary) for _ in range(120)) for _ in range(15)]
+    explanation = {
+        'success': True,
+        'explanation': '\n\n'.join(f"## Section {i + 1}\n{p}" for i, p in enumerate(paragraphs)),
+        'topic': 'Blockchain',
+        'word_count': 1800,
+        'source': 'groq_ai'
+    }
+    return {'assessment': assessment, 'explanation': explanation}
+
+
+def _time_per_call(fn, iterations):
+    start = time.process_time()
+    for _ in range(iterations):
+        result = fn()
+    return (time.process_time() - start) / iterations * 1000, result
+
+
+def bench_responses(args):
+    from flask import Flask
+    from flask.json.provider import DefaultJSONProvider
+
+    import http_compression
+    from json_provider import OrjsonProvider, orjson
+
+    app = Flask(__name__)
+    providers = [('stdlib', DefaultJSONProvider(app))]
+    if orjson is not None:
+        providers.append(('orjson', OrjsonProvider(app)))
+    else:
+        print("   (orjson not installed - only the stdlib provider is measured)")
+
+    encodings = ['gzip'] + (['br'] if http_compression.brotli is not None else [])
+    print(f"🧪 Response encoding, CPU per response over {args.iterations} iterations")
+    for name, payload in _sample_payloads().items():
+        print(f"   {name}:")
+        body = None
+        for provider_name, provider in providers:
+            cpu_ms, body = _time_per_call(lambda: provider.response(payload).get_data(), args.iterations)
+            parse_ms, _ = _time_per_call(lambda: provider.loads(body), args.iterations)
+            print(f"     {provider_name:<8} serialize {cpu_ms:.3f} ms, parse {parse_ms:.3f} ms, {len(body):,} bytes")
+        for encoding in encodings:
+            cpu_ms, compressed = _time_per_call(lambda: http_compression.compress(body, encoding), args.iterations)
+            print(f"     {encoding:<8} compress  {cpu_ms:.3f} ms, {len(compressed):,} bytes "
+                  f"({1 - len(compressed) / len(body):.0%} smaller)")
+    return True
+
+
+def _mock_upstream(latency, quiz_latency=None):
+    """
+    Local stand-in for the Groq API that answers every completion after
+    `latency` seconds, or quiz generations (max_tokens >= 6000) after quiz_latency
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    body = json.dumps({
+        'choices': [{'message': {'content': 'A short tutoring answer.'}, 'finish_reason': 'stop'}],
+        'usage': {'prompt_tokens': 200, 'completion_tokens': 20}
+    }).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body go out in separate writes; Nagle would add ~40 ms per reply
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            slow = quiz_latency is not None and request.get('max_tokens', 0) >= 6000
+            time.sleep(quiz_latency if slow else latency)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _latency_report(label, latencies, elapsed):
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2]
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"   {label:<6} {len(latencies) / elapsed:7.1f} req/s, p50 {p50 * 1000:6.0f} ms, p95 {p95 * 1000:6.0f} ms")
+
+
+def _serve_sync(flask_app, args, payload):
+    """Closed-loop clients against a fixed pool of sync workers, like gunicorn's sync worker class"""
+    from admission_control import gates
+
+    # Measure the serving model, not admission control
+    gates['chat'].max_concurrent = args.workers
+    gates['chat'].max_waiting = args.concurrency
+    client = flask_app.test_client()
+    workers = threading.BoundedSemaphore(args.workers)
+    remaining = iter(range(args.requests))
+    lock = threading.Lock()
+    latencies = []
+
+    def run_client():
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    return
+            start = time.perf_counter()
+            with workers:
+                response = client.post('/api/chat', json=payload)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.get_data(as_text=True)
+
+    start = time.perf_counter()
+    clients = [threading.Thread(target=run_client) for _ in range(args.concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    return latencies, time.perf_counter() - start
+
+
+def _serve_async(asgi_app, args, payload):
+    """Closed-loop clients calling the ASGI app in-process on one event loop"""
+    import asyncio
+    from bulkheads import bulkheads
+
+    # Measure the serving model, not the interactive partition's cap
+    bulkheads['interactive'].async_limit = args.concurrency
+
+    body = json.dumps(payload).encode()
+    scope = {'type': 'http', 'method': 'POST', 'path': '/api/chat', 'query_string': b'',
+             'headers': [(b'content-type', b'application/json')]}
+    latencies = []
+
+    async def call():
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+
+        await asgi_app(scope, receive, send)
+        assert sent[0]['status'] == 200, sent[-1]['body']
+
+    async def run_client(remaining):
+        while next(remaining, None) is not None:
+            start = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - start)
+
+    async def run():
+        from groq_async import close_async_client
+
+        remaining = iter(range(args.requests))
+        start = time.perf_counter()
+        await asyncio.gather(*(run_client(remaining) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+        await close_async_client()
+        return elapsed
+
+    elapsed = asyncio.run(run())
+    return latencies, elapsed
+
+
+def _serve_mixed(asgi_app, args):
+    """
+    Slow Flask-routed requests (subjective assessments whose AI review waits on
+    the mock upstream) in flight together with a liveness probe, through the ASGI app
+    """
+    import asyncio
+
+    answer = ' '.join(['photosynthesis converts light energy into chemical energy'] * 40)
+    assessment = {
+        'quizType': 'subjective',
+        'topic': 'Photosynthesis',
+        'quiz': {'questions': [{'id': 1, 'question': 'Explain photosynthesis', 'key_points': ['light energy'],
+                                'model_answer': 'Plants convert light energy into chemical energy.'}]},
+        'answers': {'1': answer}
+    }
+
+    async def call(method, path, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else b''
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'http_version': '1.1',
+                 'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]}
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+
+        start = time.perf_counter()
+        await asgi_app(scope, receive, send)
+        assert sent[0]['status'] == 200, sent
+        return time.perf_counter() - start
+
+    async def run():
+        start = time.perf_counter()
+        slow = [asyncio.ensure_future(call('POST', '/api/assess-quiz', assessment)) for _ in range(args.mixed)]
+        await asyncio.sleep(0.05)
+        live = await call('GET', '/api/health/live')
+        await asyncio.gather(*slow)
+        return time.perf_counter() - start, live
+
+    elapsed, live = asyncio.run(run())
+    print(f"   mixed  {args.mixed} Flask-routed assessments took {elapsed * 1000:.0f} ms in total, "
+          f"/api/health/live answered in {live * 1000:.0f} ms meanwhile")
+
+
+def bench_serving(args):
+    import groq_client
+    import rate_limit
+
+    # One benchmark client would trip its own per-client quota
+    rate_limit.RATE_LIMIT_ENABLED = False
+
+    server = _mock_upstream(args.latency)
+    groq_client.GROQ_API_URL = f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+    os.environ['GROQ_API_KEY'] = os.environ.get('GROQ_API_KEY') or 'benchmark'
+
+    from app import create_app
+    flask_app = create_app(start_background=False)
+    payload = {'message': 'Explain photosynthesis briefly', 'context': 'Biology'}
+
+    print(f"🧪 Serving {args.requests} chat requests from {args.concurrency} clients, "
+          f"upstream latency {args.latency * 1000:.0f} ms")
+    latencies, elapsed = _serve_sync(flask_app, args, payload)
+    _latency_report(f"sync ({args.workers} workers)", latencies, elapsed)
+
+    try:
+        from asgi import create_asgi_app
+        asgi_app = create_asgi_app(start_background=False)
+    except (ImportError, RuntimeError) as e:
+        print(f"   async mode unavailable: {str(e)}")
+    else:
+        latencies, elapsed = _serve_async(asgi_app, args, payload)
+        _latency_report('async', latencies, elapsed)
+        _serve_mixed(asgi_app, args)
+    server.shutdown()
+    return True
+
+
+def _flood(flask_app, args):
+    """Quiz generations flood a fixed request-thread pool while chat clients measure latency"""
+    client = flask_app.test_client()
+    threads = threading.BoundedSemaphore(args.workers)
+    lock = threading.Lock()
+    chat_latencies = []
+    quiz_sources = {}
+
+    def request(path, payload):
+        with threads:
+            return client.post(path, json=payload)
+
+    def quiz(i):
+        response = request('/api/generate-quiz', {'subject': 'Biology', 'topic': f'Cells {i}', 'numQuestions': 5})
+        source = response.get_json().get('degraded') or response.get_json().get('source')
+        with lock:
+            quiz_sources[source] = quiz_sources.get(source, 0) + 1
+
+    def chat(count):
+        for _ in range(count):
+            start = time.perf_counter()
+            response = request('/api/chat', {'message': 'Explain osmosis briefly'})
+            with lock:
+                chat_latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.get_data(as_text=True)
+
+    flood = [threading.Thread(target=quiz, args=(i,)) for i in range(args.quizzes)]
+    for thread in flood:
+        thread.start()
+    # Let the flood take its threads before the interactive traffic arrives
+    time.sleep(0.5)
+    start = time.perf_counter()
+    chatters = [threading.Thread(target=chat, args=(args.chats // 4,)) for _ in range(4)]
+    for thread in chatters:
+        thread.start()
+    for thread in chatters:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    for thread in flood:
+        thread.join()
+    return chat_latencies, elapsed, quiz_sources
+
+
+def bench_bulkheads(args):
+    import bulkheads
+    import groq_client
+    import rate_limit
+    from admission_control import gates
+
+    rate_limit.RATE_LIMIT_ENABLED = False
+    server = _mock_upstream(args.latency, args.quiz_latency)
+    groq_client.GROQ_API_URL = f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+    os.environ['GROQ_API_KEY'] = os.environ.get('GROQ_API_KEY') or 'benchmark'
+    args.workers = args.workers or bulkheads.request_thread_budget()
+
+    from app import create_app
+    flask_app = create_app(start_background=False)
+    print(f"🧪 {args.quizzes} quiz generations ({args.quiz_latency:g}s upstream) vs {args.chats} chats "
+          f"({args.latency * 1000:.0f} ms upstream) on {args.workers} request threads")
+
+    generation_gate = gates['generate-quiz']
+    limits = (generation_gate.max_concurrent, generation_gate.max_waiting)
+    for label, enabled in (('shared', False), ('bulkheads', True)):
+        bulkheads.BULKHEADS_ENABLED = enabled
+        # Without partitions nothing stops generation from taking every thread
+        generation_gate.max_concurrent, generation_gate.max_waiting = limits if enabled else (args.workers, args.quizzes)
+        latencies, elapsed, sources = _flood(flask_app, args)
+        _latency_report(label, latencies, elapsed)
+        print(f"          quizzes: {sources}")
+    print(f"   partitions: {json.dumps({name: {key: value for key, value in metrics.items() if key in ('admitted', 'rejected')} for name, metrics in bulkheads.bulkhead_metrics().items() if name != 'enabled'})}")
+    server.shutdown()
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    dedup = subparsers.add_parser('dedup', help='near-duplicate question detection throughput')
+    dedup.add_argument('--count', type=int, default=5000)
+    dedup.add_argument('--threshold', type=float, default=None)
+    dedup.set_defaults(func=bench_dedup)
+
+    grader = subparsers.add_parser('grader', help='subjective pre-grader latency and agreement with LLM grades')
+    grader.add_argument('--samples', help='JSONL of {question, answer, llm_score, llm_latency_ms}')
+    grader.set_defaults(func=bench_grader)
+
+    responses = subparsers.add_parser('responses', help='JSON provider and response compression bytes/CPU')
+    responses.add_argument('--iterations', type=int, default=200)
+    responses.set_defaults(func=bench_responses)
+
+    serving = subparsers.add_parser('serving', help='sync workers vs the async serving mode against a slow mock upstream')
+    serving.add_argument('--requests', type=int, default=400)
+    serving.add_argument('--concurrency', type=int, default=200)
+    serving.add_argument('--workers', type=int, default=8, help='sync worker threads to emulate')
+    serving.add_argument('--latency', type=float, default=1.0, help='mock upstream latency in seconds')
+    serving.add_argument('--mixed', type=int, default=4, help='concurrent Flask-routed assessments in the mixed-traffic case')
+    serving.set_defaults(func=bench_serving)
+
+    partitions = subparsers.add_parser('bulkheads', help='chat latency while quiz generations flood the request threads')
+    partitions.add_argument('--quizzes', type=int, default=60)
+    partitions.add_argument('--chats', type=int, default=40)
+    partitions.add_argument('--workers', type=int, default=None, help='request threads (default: the bulkhead thread budget)')
+    partitions.add_argument('--latency', type=float, default=0.2, help='mock chat latency in seconds')
+    partitions.add_argument('--quiz-latency', type=float, default=5.0, help='mock quiz generation latency in seconds')
+    partitions.set_defaults(func=bench_bulkheads)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,116 @@
+"""
+Bulkhead partitions for upstream work: interactive chat/explain, quiz
+generation and assessment each get their own concurrency gate, wait queue,
+upstream connection pools and async in-flight cap, so a burst in one class
+cannot use up the capacity the others depend on
+"""
+
+import os
+import threading
+
+from admission_control import AdmissionGate
+from usage_accounting import current_usage_tag
+
+BULKHEADS_ENABLED = os.environ.get('BULKHEADS_ENABLED', 'true').lower() == 'true'
+
+# name: (concurrent upstream calls, queued, max wait seconds, async in-flight calls)
+BULKHEAD_DEFAULTS = {
+    'interactive': (12, 12, 5, 100),
+    'generation': (4, 4, 10, 60),
+    'assessment': (6, 6, 5, 40)
+}
+
+# Usage-tag endpoint -> partition; anything else is treated as bulk generation work
+PARTITIONS = {
+    'chat': 'interactive',
+    'explain': 'interactive',
+    'explain-section': 'interactive',
+    'generate-quiz': 'generation',
+    'generate-quiz-batch': 'generation',
+    'cache-warmer': 'generation',
+    'assess-quiz': 'assessment',
+    'assess-quiz-batch': 'assessment'
+}
+DEFAULT_PARTITION = 'generation'
+# Request threads for health checks, static files and other local routes
+LOCAL_THREADS = 4
+
+
+class Bulkhead:
+    """One partition: an admission gate for sync upstream calls plus an async in-flight cap"""
+
+    def __init__(self, name, max_concurrent, max_waiting, max_wait, async_limit):
+        self.name = name
+        self.gate = AdmissionGate(f'bulkhead-{name}', max_concurrent, max_waiting, max_wait)
+        self.async_limit = async_limit
+        self._lock = threading.Lock()
+        self._async_inflight = 0
+        self._async_rejected = 0
+
+    def try_enter_async(self):
+        """Take an async in-flight slot without waiting; False when the partition is full"""
+        with self._lock:
+            if self._async_inflight >= self.async_limit:
+                self._async_rejected += 1
+                return False
+            self._async_inflight += 1
+            return True
+
+    def leave_async(self):
+        with self._lock:
+            self._async_inflight -= 1
+
+    def thread_budget(self):
+        """Request threads this partition can hold: running plus queued calls"""
+        return self.gate.max_concurrent + self.gate.max_waiting
+
+    def metrics(self):
+        with self._lock:
+            async_metrics = {
+                'async_inflight': self._async_inflight,
+                'async_limit': self.async_limit,
+                'async_rejected': self._async_rejected
+            }
+        return {
+            **self.gate.metrics(),
+            **async_metrics,
+            'endpoints': sorted(endpoint for endpoint, partition in PARTITIONS.items() if partition == self.name)
+        }
+
+
+def _bulkhead_from_env(name, defaults):
+    prefix = 'BULKHEAD_' + name.upper()
+    concurrent, queued, wait, async_limit = defaults
+    return Bulkhead(
+        name,
+        int(os.environ.get(f'{prefix}_CONCURRENCY', concurrent)),
+        int(os.environ.get(f'{prefix}_QUEUE', queued)),
+        float(os.environ.get(f'{prefix}_WAIT', wait)),
+        int(os.environ.get(f'{prefix}_ASYNC_INFLIGHT', async_limit))
+    )
+
+
+bulkheads = {name: _bulkhead_from_env(name, defaults) for name, defaults in BULKHEAD_DEFAULTS.items()}
+
+
+def partition_for(endpoint):
+    return PARTITIONS.get(endpoint, DEFAULT_PARTITION)
+
+
+def current_bulkhead():
+    """The partition the current request's upstream calls belong to, or None when bulkheads are off"""
+    if not BULKHEADS_ENABLED:
+        return None
+    return bulkheads[partition_for(current_usage_tag()[0])]
+
+
+def request_thread_budget():
+    """Request threads that let every partition fill its gate and queue at once"""
+    return sum(bulkhead.thread_budget() for bulkhead in bulkheads.values()) + LOCAL_THREADS
+
+
+def bulkhead_metrics():
+    return {
+        'enabled': BULKHEADS_ENABLED,
+        **{name: bulkhead.metrics() for name, bulkhead in bulkheads.items()}
+    }
@@ -0,0 +1,275 @@
+"""
+Popularity-driven cache warming: tracks demand per normalized quiz and
+explanation key, and pre-generates the popular ones while the upstream has
+spare capacity
+"""
+
+import hashlib
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from groq_client import inflight_requests
+from question_dedup import dedupe_questions
+from ttl_store import TTLStore
+from upstream_health import upstream_health
+from usage_accounting import budget_state, usage_tag
+
+WARMER_ENABLED = os.environ.get('WARMER_ENABLED', 'true').lower() == 'true'
+# Demand counts halve every WARMER_HALF_LIFE seconds without new requests
+WARMER_HALF_LIFE = float(os.environ.get('WARMER_HALF_LIFE', 3600))
+WARMER_MIN_DEMAND = float(os.environ.get('WARMER_MIN_DEMAND', 3))
+WARMER_INTERVAL = float(os.environ.get('WARMER_INTERVAL', 20))
+# Only warm while user traffic leaves the upstream this idle
+WARMER_MAX_INFLIGHT = int(os.environ.get('WARMER_MAX_INFLIGHT', 1))
+# The warmer's own share of the upstream rate limit
+WARMER_CALLS_PER_MINUTE = int(os.environ.get('WARMER_CALLS_PER_MINUTE', 6))
+WARM_POOL_SIZE = int(os.environ.get('WARM_POOL_SIZE', 30))
+WARM_POOL_CHUNK = int(os.environ.get('WARM_POOL_CHUNK', 10))
+# A pool serves a request only when it is this much larger than the request
+WARM_POOL_SERVE_FACTOR = float(os.environ.get('WARM_POOL_SERVE_FACTOR', 1.5))
+WARM_CACHE_TTL = int(os.environ.get('WARM_CACHE_TTL', 6 * 3600))
+DEMAND_MAX_KEYS = 5000
+
+quiz_pool = TTLStore(maxsize=int(os.environ.get('WARM_POOL_KEYS', 500)), ttl=WARM_CACHE_TTL)
+explanation_cache = TTLStore(maxsize=int(os.environ.get('WARM_EXPLANATION_KEYS', 500)), ttl=WARM_CACHE_TTL)
+# AI quizzes that arrived after their request was served a fallback, held for the next identical request
+quiz_upgrades = TTLStore(maxsize=int(os.environ.get('QUIZ_UPGRADE_KEYS', 500)),
+                         ttl=int(os.environ.get('QUIZ_UPGRADE_TTL', 3600)))
+_pool_lock = threading.Lock()
+
+
+def _norm(value):
+    return ' '.join(str(value or '').lower().split())
+
+
+def quiz_key(data):
+    """Cache key for a quiz request, or None when its context makes it personal"""
+    if _norm(data.get('context')) or not _norm(data.get('topic')):
+        return None
+    return ('quiz', _norm(data.get('subject')), _norm(data.get('topic')), _norm(data.get('academicLevel', 'Secondary')),
+            _norm(data.get('difficulty', 'medium')), _norm(data.get('quizType', 'mcq')))
+
+
+def upgrade_key(data):
+    """Exact-request key for late AI quizzes; unlike quiz_key it covers size and context"""
+    if not _norm(data.get('topic')):
+        return None
+    context = hashlib.sha1(_norm(data.get('context')).encode('utf-8')).hexdigest()[:16]
+    return ('quiz-upgrade', _norm(data.get('subject')), _norm(data.get('topic')),
+            _norm(data.get('academicLevel', 'Secondary')), _norm(data.get('difficulty', 'medium')),
+            _norm(data.get('quizType', 'mcq')), _norm(data.get('numQuestions', 10)), context)
+
+
+def explanation_key(data):
+    """Cache key for an explanation request, or None when it carries context"""
+    if _norm(data.get('context')) or not _norm(data.get('topic')):
+        return None
+    return ('explanation', _norm(data.get('subject')), _norm(data.get('topic')),
+            _norm(data.get('academicLevel', 'Secondary')), _norm(data.get('type', 'comprehensive')))
+
+
+class DemandTracker:
+    """Exponentially decayed request counts per key, with the last request seen for each"""
+
+    def __init__(self, half_life=WARMER_HALF_LIFE, max_keys=DEMAND_MAX_KEYS):
+        self.half_life = half_life
+        self.max_keys = max_keys
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _decayed(self, score, updated_at, now):
+        return score * 0.5 ** ((now - updated_at) / self.half_life)
+
+    def record(self, key, request_data):
+        now = time.time()
+        with self._lock:
+            score, updated_at, _ = self._entries.get(key, (0.0, now, None))
+            self._entries[key] = (self._decayed(score, updated_at, now) + 1, now, dict(request_data))
+            if len(self._entries) > self.max_keys:
+                self._prune(now)
+
+    def _prune(self, now):
+        ranked = sorted(self._entries, key=lambda k: self._decayed(*self._entries[k][:2], now))
+        for key in ranked[:len(ranked) - self.max_keys // 2]:
+            del self._entries[key]
+
+    def top(self, min_score=WARMER_MIN_DEMAND, limit=20):
+        """[(key, score, request_data)] for the hottest keys above min_score"""
+        now = time.time()
+        with self._lock:
+            scored = [(key, self._decayed(score, updated_at, now), data)
+                      for key, (score, updated_at, data) in self._entries.items()]
+        scored = [entry for entry in scored if entry[1] >= min_score]
+        scored.sort(key=lambda entry: entry[1], reverse=True)
+        return scored[:limit]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+demand = DemandTracker()
+
+
+def add_to_pool(key, questions):
+    """Merge freshly generated questions into a key's pool, dropping near-duplicates"""
+    if key is None or not questions:
+        return 0
+    with _pool_lock:
+        pool = quiz_pool.get(key) or []
+        merged, _ = dedupe_questions(pool + [dict(question) for question in questions])
+        merged = merged[-WARM_POOL_SIZE * 2:]
+        quiz_pool.set(key, merged)
+    return len(merged)
+
+
+def pool_size(key):
+    return len(quiz_pool.get(key) or [])
+
+
+def sample_from_pool(key, num_questions):
+    """A fresh random draw of num_questions from the pool, or None if it is too small"""
+    if key is None or num_questions <= 0:
+        return None
+    pool = quiz_pool.get(key) or []
+    if len(pool) < math.ceil(num_questions * WARM_POOL_SERVE_FACTOR):
+        return None
+    questions = [dict(question) for question in random.sample(pool, num_questions)]
+    for i, question in enumerate(questions):
+        question['id'] = i + 1
+    return questions
+
+
+def cached_explanation(key):
+    return explanation_cache.get(key) if key is not None else None
+
+
+def cache_explanation(key, body):
+    if key is not None:
+        explanation_cache.set(key, body)
+
+
+def stash_upgrade(data, body):
+    key = upgrade_key(data)
+    if key is not None:
+        quiz_upgrades.set(key, body)
+
+
+def take_upgrade(data):
+    """The stashed AI quiz for this exact request, handed out once"""
+    key = upgrade_key(data)
+    return quiz_upgrades.pop(key) if key is not None else None
+
+
+class CacheWarmer:
+    """
+    Daemon loop that tops up pools and explanations for the hottest keys.
+    Generator functions are injected: quiz_fn(request_data) and
+    explanation_fn(request_data) both return (body, status) without touching
+    the caches themselves.
+    """
+
+    def __init__(self, calls_per_minute=WARMER_CALLS_PER_MINUTE, interval=WARMER_INTERVAL,
+                 max_inflight=WARMER_MAX_INFLIGHT):
+        self.calls_per_minute = calls_per_minute
+        self.interval = interval
+        self.max_inflight = max_inflight
+        self._calls = deque()
+        self._thread = None
+        self._stop = threading.Event()
+        self._quiz_fn = None
+        self._explanation_fn = None
+        self.stats = {'quiz_calls': 0, 'explanation_calls': 0, 'failures': 0, 'skipped_busy': 0, 'skipped_budget': 0,
+                      'skipped_down': 0}
+
+    def start(self, quiz_fn, explanation_fn):
+        if self._thread is not None:
+            return
+        self._quiz_fn = quiz_fn
+        self._explanation_fn = explanation_fn
+        self._thread = threading.Thread(target=self._loop, name='cache-warmer', daemon=True)
+        self._thread.start()
+        print(f"🔥 Cache warmer started ({self.calls_per_minute} calls/min budget)")
+
+    def stop(self):
+        self._stop.set()
+
+    def _budget_left(self, now):
+        while self._calls and now - self._calls[0] > 60:
+            self._calls.popleft()
+        return self.calls_per_minute - len(self._calls)
+
+    def _next_task(self):
+        for key, score, request_data in demand.top():
+            if key[0] == 'quiz' and pool_size(key) < WARM_POOL_SIZE:
+                return key, request_data
+            if key[0] == 'explanation' and cached_explanation(key) is None:
+                return key, request_data
+        return None
+
+    def _loop(self):
+        backoff = self.interval
+        while not self._stop.wait(backoff):
+            backoff = self.interval
+            while not self._stop.is_set() and self._budget_left(time.time()) > 0:
+                if inflight_requests() > self.max_inflight:
+                    self.stats['skipped_busy'] += 1
+                    break
+                if budget_state() != 'ok':
+                    # Speculative work is the first thing to go once the daily token budget runs low
+                    self.stats['skipped_budget'] += 1
+                    break
+                if not upstream_health.available():
+                    self.stats['skipped_down'] += 1
+                    break
+                task = self._next_task()
+                if task is None:
+                    break
+                self._calls.append(time.time())
+                with usage_tag('cache-warmer'):
+                    warmed = self.warm(*task)
+                if not warmed:
+                    # Most likely rate limited or down; leave the upstream alone for a while
+                    self.stats['failures'] += 1
+                    backoff = self.interval * 4
+                    break
+
+    def warm(self, key, request_data):
+        """Generate one chunk for a key; True when something was cached"""
+        try:
+            if key[0] == 'quiz':
+                self.stats['quiz_calls'] += 1
+                body, status = self._quiz_fn({**request_data, 'numQuestions': WARM_POOL_CHUNK, 'context': ''})
+                if status != 200 or body.get('source') != 'groq_ai_realtime':
+                    return False
+                size = add_to_pool(key, body['quiz']['questions'])
+                print(f"🔥 Warmed quiz pool {key[1:]} to {size} questions")
+                return True
+
+            self.stats['explanation_calls'] += 1
+            body, status = self._explanation_fn({**request_data, 'context': ''})
+            if status != 200:
+                return False
+            cache_explanation(key, body)
+            print(f"🔥 Warmed explanation {key[1:]}")
+            return True
+        except Exception as e:
+            print(f"⚠️ Cache warming failed for {key[1:]}: {e}")
+            return False
+
+    def metrics(self):
+        return {
+            **self.stats,
+            'running': self._thread is not None and self._thread.is_alive(),
+            'tracked_keys': len(demand),
+            'pooled_quiz_keys': len(quiz_pool),
+            'cached_explanations': len(explanation_cache),
+            'calls_last_minute': len(self._calls)
+        }
+
+
+cache_warmer = CacheWarmer()
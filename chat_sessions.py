@@ -0,0 +1,171 @@
+"""
+Server-side chat sessions with a token-budgeted history: recent turns are
+kept verbatim and older ones are folded into a running summary by the small
+model, so each turn's prompt stays roughly the same size
+"""
+
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+from groq_client import completion_content, post_chat_completion
+from ttl_store import TTLStore
+
+CHAT_SESSION_TTL = int(os.environ.get('CHAT_SESSION_TTL', 2 * 3600))
+# Prompt budget for the summary plus the verbatim recent turns
+CHAT_HISTORY_TOKENS = int(os.environ.get('CHAT_HISTORY_TOKENS', 1500))
+# Always keep at least this many recent messages verbatim
+CHAT_MIN_RECENT_MESSAGES = int(os.environ.get('CHAT_MIN_RECENT_MESSAGES', 4))
+CHAT_SUMMARY_MODEL = os.environ.get('CHAT_SUMMARY_MODEL', 'llama3-8b-8192')
+CHAT_SUMMARY_MAX_TOKENS = int(os.environ.get('CHAT_SUMMARY_MAX_TOKENS', 300))
+# Without a summary, drop the oldest turns once history reaches this multiple of the budget
+HARD_LIMIT_FACTOR = 3
+
+chat_store = TTLStore(maxsize=int(os.environ.get('CHAT_SESSION_MAX', 5000)), ttl=CHAT_SESSION_TTL)
+_summary_pool = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('CHAT_SUMMARY_WORKERS', 2)),
+    thread_name_prefix='chat-summary'
+)
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token)"""
+    return len(text or '') // 4 + 1
+
+
+def message_tokens(message):
+    return estimate_tokens(message['content']) + 4
+
+
+def create_chat_session(context=''):
+    session_id = uuid.uuid4().hex
+    chat_store.set(session_id, {'context': context, 'summary': '', 'dropped': 0, 'turns': [], 'summarizing': False})
+    return session_id
+
+
+def get_chat_session(session_id):
+    return chat_store.get(session_id) if session_id else None
+
+
+def update_chat_context(session_id, context):
+    return chat_store.update(session_id, lambda session: {**session, 'context': context})
+
+
+def delete_chat_session(session_id):
+    return chat_store.pop(session_id) is not None
+
+
+def recent_turns(turns, budget):
+    """Newest turns that fit the budget, never fewer than CHAT_MIN_RECENT_MESSAGES"""
+    kept, used = [], 0
+    for turn in reversed(turns):
+        cost = message_tokens(turn)
+        if len(kept) >= CHAT_MIN_RECENT_MESSAGES and used + cost > budget:
+            break
+        kept.append(turn)
+        used += cost
+    return list(reversed(kept))
+
+
+def build_chat_messages(session, system_prompt, message):
+    """System prompt, running summary, budgeted recent turns and the new message"""
+    messages = [{'role': 'system', 'content': system_prompt}]
+    budget = CHAT_HISTORY_TOKENS
+    if session['summary']:
+        messages.append({'role': 'system', 'content': f"Summary of the earlier conversation: {session['summary']}"})
+        budget -= estimate_tokens(session['summary'])
+    messages.extend({'role': turn['role'], 'content': turn['content']} for turn in recent_turns(session['turns'], budget))
+    messages.append({'role': 'user', 'content': message})
+    return messages
+
+
+def record_turn(session_id, user_message, reply):
+    """Append an exchange and schedule summarization once history outgrows its budget"""
+    def append(session):
+        turns = session['turns'] + [
+            {'role': 'user', 'content': user_message},
+            {'role': 'assistant', 'content': reply}
+        ]
+        return {**session, 'turns': turns}
+
+    session = chat_store.update(session_id, append)
+    if session is None:
+        return
+
+    history_tokens = sum(message_tokens(turn) for turn in session['turns']) + estimate_tokens(session['summary'])
+    if history_tokens <= CHAT_HISTORY_TOKENS:
+        return
+
+    kept = recent_turns(session['turns'], CHAT_HISTORY_TOKENS // 2)
+    older = session['turns'][:len(session['turns']) - len(kept)]
+    claimed = []
+
+    def claim(s):
+        if s['summarizing']:
+            return s
+        claimed.append(True)
+        return {**s, 'summarizing': True}
+
+    if older and chat_store.update(session_id, claim) and claimed:
+        _summary_pool.submit(copy_context().run, _summarize, session_id, session['summary'], older, session['dropped'] + len(older))
+    elif history_tokens > CHAT_HISTORY_TOKENS * HARD_LIMIT_FACTOR:
+        # Summaries are falling behind; keep memory bounded regardless
+        def trim(s):
+            turns = recent_turns(s['turns'], CHAT_HISTORY_TOKENS)
+            return {**s, 'turns': turns, 'dropped': s['dropped'] + len(s['turns']) - len(turns)}
+        chat_store.update(session_id, trim)
+
+
+def summarize_turns(previous_summary, turns):
+    """Fold turns into the running summary with the small model"""
+    transcript = '\n'.join(f"{turn['role'].upper()}: {turn['content']}" for turn in turns)
+    prompt = f"""Update the summary of a tutoring conversation.
+
+EXISTING SUMMARY: {previous_summary or '(none)'}
+
+NEW TURNS:
+{transcript}
+
+Write a concise summary (under 150 words) of what the student asked, what was explained and anything they struggled with. Respond with the summary text only."""
+
+    payload = {
+        'model': CHAT_SUMMARY_MODEL,
+        'messages': [
+            {'role': 'system', 'content': 'You summarize tutoring conversations accurately and concisely.'},
+            {'role': 'user', 'content': prompt}
+        ],
+        'max_tokens': CHAT_SUMMARY_MAX_TOKENS,
+        'temperature': 0.2
+    }
+
+    response = post_chat_completion(payload, timeout=(5, 20))
+    if response.status_code != 200:
+        raise ValueError(f"Groq API error: {response.status_code}")
+    summary = completion_content(response.json())
+    if not summary:
+        raise ValueError("No response from AI model")
+    return summary
+
+
+def _summarize(session_id, previous_summary, older, covered_until):
+    try:
+        summary = summarize_turns(previous_summary, older)
+    except Exception as e:
+        print(f"⚠️ Chat summary failed for {session_id}: {e}")
+        chat_store.update(session_id, lambda s: {**s, 'summarizing': False})
+        return
+
+    def apply(session):
+        # 'dropped' counts messages already gone from the front of turns
+        remove = max(0, covered_until - session['dropped'])
+        return {
+            **session,
+            'summary': summary,
+            'dropped': session['dropped'] + remove,
+            'turns': session['turns'][remove:],
+            'summarizing': False
+        }
+
+    chat_store.update(session_id, apply)
+    print(f"🧾 Summarized {len(older)} chat messages for session {session_id}")
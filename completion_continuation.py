@@ -0,0 +1,90 @@
+"""
+Recovery for completions cut off at max_tokens: keep every fully formed
+object of the truncated JSON array and ask only for the missing ones, so a
+paid-for completion is never thrown away and a retry costs in proportion
+to what is missing
+"""
+
+import json
+import os
+import re
+
+from groq_client import completion_content
+
+CONTINUATION_ENABLED = os.environ.get('COMPLETION_CONTINUATION_ENABLED', 'true').lower() == 'true'
+# Follow-up requests per truncated completion
+CONTINUATION_MAX_ROUNDS = int(os.environ.get('COMPLETION_CONTINUATION_ROUNDS', 2))
+# Headroom on the per-item token estimate, so the follow-up is not cut off too
+CONTINUATION_HEADROOM = 1.25
+
+_decoder = json.JSONDecoder()
+
+
+def is_truncated(groq_response):
+    """True when the model stopped because it hit max_tokens"""
+    choices = groq_response.get('choices') or []
+    return bool(choices) and choices[0].get('finish_reason') == 'length'
+
+
+def salvage_array(content, key):
+    """Every complete object in the (possibly cut off) `key` array of a JSON reply"""
+    match = re.search(r'"%s"\s*:\s*\[' % re.escape(key), content or '')
+    if not match:
+        return []
+    items = []
+    position = match.end()
+    while True:
+        while position < len(content) and content[position] in ' \t\r\n,':
+            position += 1
+        if position >= len(content) or content[position] != '{':
+            break
+        try:
+            item, position = _decoder.raw_decode(content, position)
+        except ValueError:
+            break
+        if isinstance(item, dict):
+            items.append(item)
+    return items
+
+
+def continuation_max_tokens(groq_response, produced, remaining, max_tokens):
+    """Token budget for the missing items, estimated from the cost of the `produced` items in groq_response"""
+    used = (groq_response.get('usage') or {}).get('completion_tokens')
+    if not produced or not used:
+        return max_tokens
+    return min(max_tokens, int(used / produced * remaining * CONTINUATION_HEADROOM) + 100)
+
+
+def continue_truncated_array(payload, groq_response, key, wanted, continuation_payload, timeout):
+    """
+    Completion steps that recover a truncated `key` array: keeps the complete
+    objects, then asks continuation_payload(kept, remaining) for the rest
+    while replies keep getting cut off. Returns the merged objects; a failed
+    follow-up just ends the recovery with what was kept.
+    """
+    items = salvage_array(completion_content(groq_response), key)
+    # Complete objects in the latest reply, which is what its token usage paid for
+    produced = len(items)
+    print(f"✂️ Completion hit max_tokens: kept {len(items)}/{wanted} complete {key}")
+    rounds = 0
+    while CONTINUATION_ENABLED and is_truncated(groq_response) and len(items) < wanted and rounds < CONTINUATION_MAX_ROUNDS:
+        rounds += 1
+        remaining = wanted - len(items)
+        request = continuation_payload(items, remaining)
+        request['max_tokens'] = continuation_max_tokens(groq_response, produced, remaining, payload['max_tokens'])
+        try:
+            response = yield request, timeout
+        except Exception as e:
+            print(f"⚠️ Continuation request failed: {e}")
+            break
+        if response.status_code != 200:
+            print(f"⚠️ Continuation request failed: Groq API error {response.status_code}")
+            break
+        groq_response = response.json()
+        more = salvage_array(completion_content(groq_response), key)
+        if not more:
+            break
+        produced = len(more)
+        items += more[:remaining]
+        print(f"🧩 Continuation {rounds} added {len(more[:remaining])} {key} ({len(items)}/{wanted})")
+    return items
@@ -0,0 +1,50 @@
+"""
+Race-to-deadline: start the upstream-bound call in the background and the
+local fallback in the foreground, and serve whichever answer the deadline
+allows. A late upstream result is handed on so it still gets used.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextvars import copy_context
+
+# Seconds a quiz request waits for the AI before the fallback is served; 0 waits for the AI
+QUIZ_DEADLINE_SECONDS = float(os.environ.get('QUIZ_DEADLINE_SECONDS', 0))
+QUIZ_DEADLINE_MAX = 90
+RACE_WORKERS = int(os.environ.get('DEADLINE_RACE_WORKERS', 8))
+
+_race_pool = ThreadPoolExecutor(max_workers=RACE_WORKERS, thread_name_prefix='deadline-race')
+
+
+def quiz_deadline(data):
+    """Deadline for a quiz request: its deadlineSeconds, else QUIZ_DEADLINE_SECONDS (0 = none)"""
+    try:
+        deadline = float(data.get('deadlineSeconds', QUIZ_DEADLINE_SECONDS) or 0)
+    except (TypeError, ValueError):
+        deadline = QUIZ_DEADLINE_SECONDS
+    return min(max(deadline, 0.0), QUIZ_DEADLINE_MAX)
+
+
+def race_to_deadline(primary, fallback, deadline, on_late_result):
+    """
+    Run primary() in the background and fallback() here. Returns (result, True)
+    when primary finishes within deadline seconds, otherwise (fallback result,
+    False) while primary carries on and its result goes to on_late_result.
+    Exceptions from a primary that finishes in time are raised here.
+    """
+    started = time.monotonic()
+    future = _race_pool.submit(copy_context().run, primary)
+    fallback_result = fallback()
+    try:
+        return future.result(timeout=max(0.0, deadline - (time.monotonic() - started))), True
+    except FutureTimeout:
+        future.add_done_callback(lambda done: _deliver_late(done, on_late_result))
+        return fallback_result, False
+
+
+def _deliver_late(future, on_late_result):
+    try:
+        on_late_result(future.result())
+    except Exception as e:
+        print(f"⚠️ Background upgrade failed: {e}")
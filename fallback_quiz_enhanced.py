@@ -4,6 +4,8 @@ Enhanced fallback quiz generation with real, meaningful questions
 
 import random
 
+from question_dedup import NearDuplicateIndex, dedupe_questions
+
 # Comprehensive question database organized by subject, topic, and difficulty
 QUESTION_DATABASE = {
     "Mathematics": {
@@ -272,9 +274,17 @@ def generate_enhanced_fallback_quiz(subject, topic, quiz_type, num_questions, di
                     if diff in QUESTION_DATABASE[subject][other_topic]:
                         questions_pool.extend(QUESTION_DATABASE[subject][other_topic][diff])
     
-    # If still not enough, create generic but meaningful questions
+    # Drop near-identical database items (subject-wide extras can repeat each other)
+    index = NearDuplicateIndex()
+    questions_pool, duplicates = dedupe_questions(questions_pool, index=index)
+    if duplicates:
+        print(f"🧹 Removed {len(duplicates)} near-duplicate fallback questions")
+    
+    # If still not enough, top up with generic questions distinct from the pool and each other
     if len(questions_pool) < num_questions:
-        questions_pool.extend(generate_generic_questions(subject, topic, difficulty, academic_level, num_questions))
+        candidates = generate_generic_questions(subject, topic, difficulty, academic_level, len(GENERIC_FRAMES) * len(GENERIC_ASPECTS))
+        generic, _ = dedupe_questions(candidates, index=index)
+        questions_pool.extend(generic[:num_questions - len(questions_pool)])
     
     # Shuffle and select required number of questions
     random.shuffle(questions_pool)
@@ -348,14 +358,65 @@ def generate_generic_questions(subject, topic, difficulty, academic_level, num_n
         ]
     }
     
-    questions = []
-    templates = generic_templates.get(difficulty, generic_templates['medium'])
+    # The difficulty's own templates first, then one question per (frame, aspect) pair,
+    # rotating frames so consecutive questions are not phrased the same way
+    questions = list(generic_templates.get(difficulty, generic_templates['medium']))
+    for offset in range(len(GENERIC_FRAMES)):
+        for i, (aspect, description) in enumerate(GENERIC_ASPECTS):
+            if len(questions) >= num_needed:
+                return questions
+            frame = GENERIC_FRAMES[(i + offset) % len(GENERIC_FRAMES)]
+            questions.append(generic_aspect_question(frame, aspect, description, subject, topic, academic_level, len(questions)))
     
-    for i in range(num_needed):
-        template = templates[i % len(templates)]
-        questions.append(template)
-    
-    return questions
+    return questions[:num_needed]
+
+# Aspects of any topic a generic question can ask about: (name, what it covers)
+GENERIC_ASPECTS = [
+    ('core principles', 'the basic rules and ideas everything else in {topic} builds on'),
+    ('key terminology', 'the specialised vocabulary used to describe {topic} precisely'),
+    ('real-world applications', 'how {topic} is used to solve practical problems'),
+    ('historical development', 'how ideas about {topic} emerged and changed over time'),
+    ('common misconceptions', 'beliefs about {topic} that sound plausible but are wrong'),
+    ('limitations', 'the situations where {topic} stops working or needs refinement'),
+    ('measurement and evidence', 'how claims about {topic} are tested against observations'),
+    ('connections to other concepts', 'how {topic} relates to neighbouring ideas in {subject}'),
+    ('problem-solving methods', 'step-by-step strategies for working through {topic} problems'),
+    ('future directions', 'open questions and current research about {topic}'),
+    ('ethical and social impact', 'how {topic} affects people, communities and society'),
+    ('tools and techniques', 'the instruments, models or methods used when working with {topic}')
+]
+
+# Question shapes: (stem, distractors); the aspect's description is the correct option
+GENERIC_FRAMES = [
+    ("Which statement best describes the {aspect} of {topic}?",
+     ["A topic with no connection to {subject}", "Memorising isolated facts without understanding", "Something only experts outside {subject} study"]),
+    ("A {academic_level} student revising {topic} wants to understand its {aspect}. What should they focus on?",
+     ["Unrelated examples from a different field", "The formatting of their revision notes", "Guessing answers without checking reasoning"]),
+    ("Why does studying the {aspect} of {topic} matter in {subject}?",
+     ["It only matters for passing one exam", "It replaces the need to learn anything else in {subject}", "It has no effect on understanding {topic}"]),
+    ("In {subject}, what does examining the {aspect} of {topic} involve?",
+     ["Ignoring evidence that does not fit", "Repeating definitions word for word", "Avoiding any link to other ideas"]),
+    ("Which option correctly explains what is meant by the {aspect} of {topic}?",
+     ["A single fixed answer that never changes", "Personal opinion with no supporting reasoning", "A minor detail that can be safely skipped"]),
+    ("A teacher asks the class to summarise the {aspect} of {topic}. Which summary is most accurate?",
+     ["A list of dates with no explanation", "A description of a different subject entirely", "A claim that {topic} cannot be explained"])
+]
+
+def generic_aspect_question(frame, aspect, description, subject, topic, academic_level, position):
+    """One generic question about an aspect of the topic, with the correct option rotated"""
+    stem, distractors = frame
+    fill = {'aspect': aspect, 'topic': topic, 'subject': subject, 'academic_level': academic_level}
+    correct = description.format(**fill)
+    texts = [text.format(**fill) for text in distractors]
+    letters = ['A', 'B', 'C', 'D']
+    correct_letter = letters[position % 4]
+    texts.insert(position % 4, correct[0].upper() + correct[1:])
+    return {
+        'question': stem.format(**fill),
+        'options': dict(zip(letters, texts)),
+        'correct_answer': correct_letter,
+        'explanation': f"The {aspect} of {topic} concerns {correct}"
+    }
 
 def generate_enhanced_fallback_assessment(quiz_data, user_answers, quiz_type, subject, topic):
     """
@@ -392,10 +453,10 @@ def generate_enhanced_fallback_assessment(quiz_data, user_answers, quiz_type, su
         question_id = i + 1
         question_text = question.get('question', f'Question {question_id}')
         options = question.get('options', {})
-        user_answer = user_answers.get(str(question_id), 'No answer provided')
+        user_answer = user_answers.get(str(question.get('id', question_id)), user_answers.get(str(question_id), 'No answer provided'))
         
-        # Try to find correct answer
-        correct_answer = correct_answer_map.get(question_text, 'B')  # Default fallback
+        # Prefer the quiz's own answer key, then the known-topic map
+        correct_answer = question.get('correct_answer') or correct_answer_map.get(question_text, 'B')
         
         # Determine if answer is correct
         is_correct = user_answer == correct_answer
@@ -0,0 +1,76 @@
+"""
+Per-question MCQ feedback cache: AI explanation and why_wrong text keyed by
+a content hash of the question, its correct option and the selected option,
+so a (question, wrong option) pair that recurs across students is explained
+by the LLM once and reused by every later assessment
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+from ttl_store import TTLStore
+
+FEEDBACK_CACHE_ENABLED = os.environ.get('FEEDBACK_CACHE_ENABLED', 'true').lower() == 'true'
+
+feedback_store = TTLStore(
+    maxsize=int(os.environ.get('FEEDBACK_CACHE_SIZE', 20000)),
+    ttl=int(os.environ.get('FEEDBACK_CACHE_TTL', 7 * 24 * 3600))
+)
+
+_stats = {'hits': 0, 'misses': 0, 'stored': 0}
+_stats_lock = threading.Lock()
+
+
+def _norm(value):
+    return ' '.join(str(value or '').lower().split())
+
+
+def feedback_key(question, correct_answer, user_answer):
+    """
+    Content hash of what the feedback depends on. Options are keyed by their
+    text, not their letter, so shuffled variants share entries with the
+    canonical quiz.
+    """
+    options = question.get('options') if isinstance(question.get('options'), dict) else {}
+    content = json.dumps([
+        _norm(question.get('question')),
+        _norm(options.get(correct_answer, correct_answer)),
+        _norm(options.get(user_answer, user_answer))
+    ])
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def _count(stat):
+    with _stats_lock:
+        _stats[stat] += 1
+
+
+def lookup(key):
+    """Cached AI {'explanation', 'why_wrong'} for a key, or None"""
+    if not FEEDBACK_CACHE_ENABLED:
+        return None
+    entry = feedback_store.get(key)
+    _count('misses' if entry is None else 'hits')
+    return entry
+
+
+def remember(key, explanation, why_wrong):
+    """Cache AI feedback for a key; local explanations are cheap to rebuild and never cached"""
+    if not FEEDBACK_CACHE_ENABLED or not (explanation or why_wrong):
+        return
+    feedback_store.set(key, {'explanation': explanation, 'why_wrong': why_wrong})
+    _count('stored')
+
+
+def feedback_cache_metrics():
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    return {
+        'enabled': FEEDBACK_CACHE_ENABLED,
+        'entries': len(feedback_store),
+        'hit_rate': round(stats['hits'] / lookups, 3) if lookups else None,
+        **stats
+    }
@@ -0,0 +1,119 @@
+"""
+Async Groq client for the ASGI serving mode: pooled httpx clients per
+event loop and bulkhead partition, the same retry policy as the sync
+session, and a driver for the completion-step generators shared with the
+sync path
+"""
+
+import asyncio
+import itertools
+import os
+import time
+
+import requests
+
+import groq_client
+from bulkheads import current_bulkhead
+from groq_client import groq_headers, upstream_call
+from upstream_health import upstream_health
+from usage_accounting import budgeted_payload, record_completion
+
+try:
+    import httpx
+except ImportError:  # optional; only the async serving mode needs it
+    httpx = None
+
+ASYNC_MAX_CONNECTIONS = int(os.environ.get('ASYNC_GROQ_MAX_CONNECTIONS', 200))
+# httpcore scans every pooled connection per request, so large pools are split
+# across several clients; past a few dozen connections the scan dominates
+CONNECTIONS_PER_CLIENT = int(os.environ.get('ASYNC_GROQ_CONNECTIONS_PER_CLIENT', 25))
+# Mirrors create_http_session's urllib3 Retry(total=3, backoff_factor=1)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RETRIES = 3
+BACKOFF_FACTOR = 1
+
+_clients = {}
+_next_client = itertools.count()
+
+
+def get_async_client(bulkhead=None):
+    """
+    One of this event loop's pooled clients (round-robin), created on first
+    use. Each bulkhead partition has its own clients, sized to its in-flight cap.
+    """
+    if httpx is None:
+        raise RuntimeError('The async serving mode needs httpx: pip install httpx')
+    key = (asyncio.get_running_loop(), bulkhead.name if bulkhead else None)
+    clients = _clients.get(key)
+    if clients is None:
+        max_connections = min(bulkhead.async_limit, ASYNC_MAX_CONNECTIONS) if bulkhead else ASYNC_MAX_CONNECTIONS
+        per_client = max(1, min(CONNECTIONS_PER_CLIENT, max_connections))
+        limits = httpx.Limits(max_connections=per_client, max_keepalive_connections=per_client)
+        clients = [httpx.AsyncClient(limits=limits) for _ in range(max(1, max_connections // per_client))]
+        _clients[key] = clients
+    return clients[next(_next_client) % len(clients)]
+
+
+async def close_async_client():
+    loop = asyncio.get_running_loop()
+    for key in [key for key in _clients if key[0] is loop]:
+        for client in _clients.pop(key):
+            await client.aclose()
+
+
+def _as_requests_error(error):
+    # Completion steps handle requests' exception types; keep them transport-agnostic
+    if isinstance(error, httpx.TimeoutException):
+        return requests.exceptions.Timeout(str(error))
+    return requests.exceptions.ConnectionError(str(error))
+
+
+async def post_chat_completion_async(payload, timeout=(10, 30)):
+    """POST a chat completion payload without blocking the event loop; returns the raw response"""
+    client = get_async_client(current_bulkhead())
+    connect, read = timeout
+    upstream_health.check()
+    payload = budgeted_payload(payload)
+    with upstream_call():
+        started = time.monotonic()
+        response = None
+        try:
+            response = await _post_with_retries(client, payload, connect, read)
+        finally:
+            record_completion(payload, response, time.monotonic() - started)
+            upstream_health.observe(response)
+        return response
+
+
+async def _post_with_retries(client, payload, connect, read):
+    for attempt in range(RETRIES + 1):
+        try:
+            response = await client.post(
+                groq_client.GROQ_API_URL,
+                headers=groq_headers(),
+                json=payload,
+                timeout=httpx.Timeout(read, connect=connect)
+            )
+        except httpx.TransportError as e:
+            if attempt == RETRIES:
+                raise _as_requests_error(e)
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt == RETRIES:
+                return response
+        if attempt:
+            await asyncio.sleep(BACKOFF_FACTOR * 2 ** (attempt - 1))
+
+
+async def run_completion_steps_async(steps):
+    """Async counterpart of groq_client.run_completion_steps"""
+    try:
+        call = next(steps)
+        while True:
+            try:
+                response = await post_chat_completion_async(*call)
+            except Exception as e:
+                call = steps.throw(e)
+            else:
+                call = steps.send(response)
+    except StopIteration as stop:
+        return stop.value
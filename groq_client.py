@@ -0,0 +1,164 @@
+"""
+Shared helpers for talking to the Groq chat completions API
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from admission_control import OverloadedError
+from bulkheads import current_bulkhead
+from upstream_health import upstream_health
+from usage_accounting import budgeted_payload, record_completion
+
+GROQ_API_URL = os.environ.get('GROQ_API_URL', 'https://api.groq.com/openai/v1/chat/completions')
+# Listing models costs no tokens, so the health prober uses it
+GROQ_MODELS_URL = os.environ.get('GROQ_MODELS_URL', GROQ_API_URL.rsplit('/chat/completions', 1)[0] + '/models')
+
+# One pooled session per thread and bulkhead partition, created lazily and never carried across a fork
+_sessions = threading.local()
+
+# Upstream calls currently in flight, so background work can yield to users
+_inflight = 0
+_inflight_lock = threading.Lock()
+
+
+# Create a robust HTTP session with retry logic
+def create_http_session():
+    session = requests.Session()
+
+    # Retry strategy
+    retry_strategy = Retry(
+        total=3,
+        backoff_factor=1,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["HEAD", "GET", "OPTIONS", "POST"]
+    )
+
+    # Mount adapter with retry strategy
+    adapter = HTTPAdapter(max_retries=retry_strategy)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    return session
+
+
+def get_http_session(partition=None):
+    """This thread's pooled session for a partition, so repeated calls reuse upstream connections"""
+    if getattr(_sessions, 'pid', None) != os.getpid():
+        _sessions.by_partition = {}
+        _sessions.pid = os.getpid()
+    session = _sessions.by_partition.get(partition)
+    if session is None:
+        session = _sessions.by_partition[partition] = create_http_session()
+    return session
+
+
+def groq_headers():
+    """Authorization headers for the configured API key"""
+    return {
+        'Authorization': f"Bearer {os.getenv('GROQ_API_KEY')}",
+        'Content-Type': 'application/json'
+    }
+
+
+def post_chat_completion(payload, timeout=(10, 30), session=None):
+    """
+    POST a chat completion payload and return the raw response. The call
+    holds a slot in its bulkhead partition and uses that partition's
+    connections; OverloadedError is raised when the partition is full.
+    """
+    upstream_health.check()
+    payload = budgeted_payload(payload)
+    bulkhead = current_bulkhead()
+    with bulkhead.gate.admit() if bulkhead else nullcontext(), upstream_call():
+        session = session or get_http_session(bulkhead.name if bulkhead else None)
+        started = time.monotonic()
+        response = None
+        try:
+            response = session.post(GROQ_API_URL, headers=groq_headers(), json=payload, timeout=timeout)
+        finally:
+            record_completion(payload, response, time.monotonic() - started)
+            upstream_health.observe(response)
+        return response
+
+
+def probe_upstream(timeout):
+    """One zero-token reachability check: (status code, None) or (None, error)"""
+    try:
+        # No retries here: the prober wants to see every failure
+        response = requests.get(GROQ_MODELS_URL, headers=groq_headers(), timeout=timeout)
+    except requests.exceptions.RequestException as e:
+        return None, f'{type(e).__name__}: {e}'
+    return response.status_code, None if response.status_code < 400 else response.text[:200]
+
+
+@contextmanager
+def upstream_call():
+    """Count a chat completion call as in flight for its duration"""
+    global _inflight
+    with _inflight_lock:
+        _inflight += 1
+    try:
+        yield
+    finally:
+        with _inflight_lock:
+            _inflight -= 1
+
+
+def run_completion_steps(steps):
+    """
+    Drive a sans-IO generator that yields (payload, timeout) for each upstream
+    call and receives the response (or the exception) back; returns its result.
+    A full bulkhead raises OverloadedError to the caller rather than into the
+    steps, so callers shed load the same way as at their admission gates.
+    The async serving mode drives the same generators with an async client.
+    """
+    try:
+        call = next(steps)
+        while True:
+            try:
+                response = post_chat_completion(*call)
+            except OverloadedError:
+                steps.close()
+                raise
+            except Exception as e:
+                call = steps.throw(e)
+            else:
+                call = steps.send(response)
+    except StopIteration as stop:
+        return stop.value
+
+
+def inflight_requests():
+    """Number of chat completion calls currently waiting on the upstream"""
+    return _inflight
+
+
+def completion_content(groq_response):
+    """Message text of the first choice, or None when the model returned nothing"""
+    choices = groq_response.get('choices') or []
+    if not choices:
+        return None
+    return choices[0]['message']['content'].strip()
+
+
+def extract_json(content):
+    """Parse a JSON object out of model output that may carry fences or chatter"""
+    if content.startswith('```json'):
+        content = content.replace('```json', '').replace('```', '').strip()
+    elif content.startswith('```'):
+        content = content.replace('```', '').strip()
+
+    json_start = content.find('{')
+    json_end = content.rfind('}') + 1
+    if json_start != -1 and json_end > json_start:
+        content = content[json_start:json_end]
+
+    return json.loads(content)
@@ -0,0 +1,27 @@
+"""
+Gunicorn configuration: preload the app in the master so workers share its
+memory copy-on-write, then start per-worker background threads after fork
+"""
+
+import gc
+import os
+
+from bulkheads import request_thread_budget
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+# Threaded workers with room for every bulkhead partition to fill its gate and
+# queue at once, so a burst of slow quiz generations cannot hold every thread
+threads = int(os.environ.get('GUNICORN_THREADS', request_thread_budget()))
+wsgi_app = 'app:create_app(start_background=False, eager=True)'
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+
+def pre_fork(server, worker):
+    # Keep the preloaded heap out of the collector so it stays shared
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from app import start_background_services
+    start_background_services()
@@ -0,0 +1,71 @@
+"""
+Negotiated gzip/brotli compression for large API responses
+"""
+
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:  # optional; gzip alone is still negotiated
+    brotli = None
+
+RESPONSE_COMPRESSION = os.environ.get('RESPONSE_COMPRESSION', 'true').lower() == 'true'
+# Below this many bytes compression costs more CPU than it saves on the wire
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', 1024))
+# Mid levels: most of the size win for a fraction of the max-level CPU
+GZIP_LEVEL = int(os.environ.get('RESPONSE_GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('RESPONSE_BROTLI_QUALITY', 5))
+COMPRESSIBLE_TYPES = ('application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript')
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def choose_encoding(request):
+    """Best encoding the client accepts, or None"""
+    return negotiate_encoding(request.accept_encodings)
+
+
+def negotiate_encoding(accept_encodings):
+    """Best encoding in a parsed Accept-Encoding header, or None"""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_response(request, response):
+    """after_request hook: compress buffered responses above the size threshold"""
+    if (not RESPONSE_COMPRESSION
+            or response.direct_passthrough
+            or response.is_streamed
+            or response.status_code < 200
+            or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request)
+    if encoding is None:
+        return response
+
+    body = response.get_data()
+    if len(body) < RESPONSE_COMPRESS_MIN_BYTES:
+        return response
+
+    compressed = compress(body, encoding)
+    if len(compressed) >= len(body):
+        return response
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    # The compressed body is a different representation of any strong ETag
+    if response.get_etag()[0] and not response.get_etag()[1]:
+        response.set_etag(response.get_etag()[0], weak=True)
+    return response
@@ -0,0 +1,168 @@
+"""
+Background job queue for long-running quiz generation and assessment, so
+requests can return a job id instead of holding a web worker for the whole
+upstream call
+"""
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 4))
+JOB_QUEUE_MAX = int(os.environ.get('JOB_QUEUE_MAX', 100))
+JOB_TTL = int(os.environ.get('JOB_TTL', 3600))
+
+TERMINAL_STATES = ('succeeded', 'failed', 'cancelled')
+
+
+class QueueFullError(Exception):
+    """Raised when the queue already holds JOB_QUEUE_MAX waiting jobs"""
+
+
+class Job:
+    def __init__(self, kind):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.status_code = None
+        self.error = None
+        self.cancel_requested = False
+        self.version = 0
+        self.future = None
+
+    def to_dict(self, include_result=True):
+        data = {
+            'job_id': self.id,
+            'type': self.kind,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+        if self.error:
+            data['error'] = self.error
+        if self.status_code is not None:
+            data['status_code'] = self.status_code
+        if include_result and self.result is not None:
+            data['result'] = self.result
+        return data
+
+
+class JobQueue:
+    """Bounded worker pool with job tracking, cancellation, expiry and metrics"""
+
+    def __init__(self, workers=JOB_WORKERS, max_queued=JOB_QUEUE_MAX, ttl=JOB_TTL):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._jobs = {}
+        self._changed = threading.Condition()
+        self._completed = {state: 0 for state in TERMINAL_STATES}
+        self._started = 0
+        self._finished_runs = 0
+        self._wait_total = 0.0
+        self._run_total = 0.0
+
+    def _touch(self, job):
+        job.version += 1
+        self._changed.notify_all()
+
+    def _purge_expired(self, now):
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at and now - job.finished_at > self.ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(self, kind, fn, *args):
+        """Queue fn(*args) -> (result, status_code) and return the Job"""
+        with self._changed:
+            self._purge_expired(time.time())
+            queued = sum(1 for job in self._jobs.values() if job.status == 'queued')
+            if queued >= self.max_queued:
+                raise QueueFullError(f'Job queue is full ({queued} waiting)')
+            job = Job(kind)
+            self._jobs[job.id] = job
+            job.future = self._pool.submit(copy_context().run, self._run, job, fn, args)
+        return job
+
+    def _run(self, job, fn, args):
+        with self._changed:
+            if job.status != 'queued':
+                return
+            job.status = 'running'
+            job.started_at = time.time()
+            self._started += 1
+            self._wait_total += job.started_at - job.created_at
+            self._touch(job)
+
+        try:
+            result, status_code = fn(*args)
+            error = None
+            # Handlers report failures the way routes do, as an error status
+            if status_code >= 400:
+                error = (result or {}).get('error') if isinstance(result, dict) else None
+                error = error or f'Handler returned HTTP {status_code}'
+        except Exception as e:
+            result, status_code, error = None, 500, str(e)
+
+        with self._changed:
+            job.finished_at = time.time()
+            self._finished_runs += 1
+            self._run_total += job.finished_at - job.started_at
+            if job.cancel_requested:
+                job.status = 'cancelled'
+            else:
+                job.status, job.error = ('failed', error) if error else ('succeeded', None)
+                job.result, job.status_code = result, status_code
+            self._completed[job.status] += 1
+            self._touch(job)
+
+    def get(self, job_id):
+        with self._changed:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Cancel a queued job outright; a running job's result is discarded on completion"""
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in TERMINAL_STATES:
+                return job
+            job.cancel_requested = True
+            if job.status == 'queued' and job.future.cancel():
+                job.status = 'cancelled'
+                job.finished_at = time.time()
+                self._completed['cancelled'] += 1
+            self._touch(job)
+            return job
+
+    def wait_for_change(self, job, version, timeout):
+        """Block until the job's version moves past `version` or timeout elapses"""
+        with self._changed:
+            self._changed.wait_for(lambda: job.version != version, timeout=timeout)
+            return job.version
+
+    def metrics(self):
+        with self._changed:
+            self._purge_expired(time.time())
+            statuses = [job.status for job in self._jobs.values()]
+            return {
+                'workers': self.workers,
+                'queue_depth': statuses.count('queued'),
+                'queue_limit': self.max_queued,
+                'running': statuses.count('running'),
+                'tracked_jobs': len(statuses),
+                'completed': dict(self._completed),
+                'avg_wait_seconds': round(self._wait_total / self._started, 3) if self._started else 0,
+                'avg_run_seconds': round(self._run_total / self._finished_runs, 3) if self._finished_runs else 0
+            }
+
+
+job_queue = JobQueue()
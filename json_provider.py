@@ -0,0 +1,51 @@
+"""
+Pluggable JSON provider: orjson for request parsing and responses when it is
+installed, Flask's stdlib provider otherwise
+"""
+
+import os
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib provider is used instead
+    orjson = None
+
+FAST_JSON = os.environ.get('FAST_JSON', 'true').lower() == 'true'
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """DefaultJSONProvider with orjson doing the encoding and decoding"""
+
+    def _options(self, indent=False):
+        options = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        # Callers asking for json.dumps-specific formatting get the stdlib path
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=self.default, option=self._options(indent)) + b'\n'
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def json_provider_class():
+    """Provider class to install on the app"""
+    if FAST_JSON and orjson is not None:
+        return OrjsonProvider
+    return DefaultJSONProvider
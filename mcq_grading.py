@@ -0,0 +1,241 @@
+"""
+Deterministic MCQ grading against the quiz's own answer key, with optional
+background LLM enrichment of the explanations for wrong answers
+"""
+
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+from completion_continuation import continue_truncated_array, is_truncated
+from feedback_cache import feedback_key, lookup, remember
+from fallback_quiz_enhanced import (
+    calculate_grade,
+    generate_assessment_feedback,
+    generate_question_explanation,
+    generate_study_recommendations,
+    generate_study_resources
+)
+from groq_client import completion_content, extract_json, post_chat_completion, run_completion_steps
+from ttl_store import TTLStore
+
+ENRICH_BY_DEFAULT = os.environ.get('MCQ_ENRICH_EXPLANATIONS', 'false').lower() == 'true'
+ENRICHMENT_MODEL = os.environ.get('MCQ_ENRICHMENT_MODEL', 'llama3-8b-8192')
+
+# Graded assessments, kept so clients can pick up enriched explanations later
+assessment_store = TTLStore(
+    maxsize=int(os.environ.get('ASSESSMENT_STORE_SIZE', 2000)),
+    ttl=int(os.environ.get('ASSESSMENT_STORE_TTL', 3600))
+)
+_enrichment_pool = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('MCQ_ENRICHMENT_WORKERS', 2)),
+    thread_name_prefix='mcq-enrich'
+)
+
+
+def normalize_option(value):
+    """Reduce 'b', ' B ' or 'B) text' to the option letter 'B'"""
+    if value is None:
+        return None
+    value = str(value).strip().upper()
+    return value[:1] or None
+
+
+def lookup_answer(user_answers, question, position):
+    """User answer for a question, keyed by question id or 1-based position"""
+    question_id = str(question.get('id', position + 1))
+    answer = user_answers.get(question_id)
+    if answer is None:
+        answer = user_answers.get(str(position + 1))
+    return answer
+
+
+def grade_mcq_questions(questions, user_answers):
+    """Per-question correctness for an MCQ quiz, graded against its answer key"""
+    question_feedback = []
+    for i, question in enumerate(questions):
+        question_text = question.get('question', f'Question {i + 1}')
+        options = question.get('options', {})
+        user_answer = normalize_option(lookup_answer(user_answers, question, i))
+        correct_answer = normalize_option(question.get('correct_answer'))
+        is_correct = user_answer is not None and user_answer == correct_answer
+
+        # Wrong answers reuse AI feedback already written for the same question and option
+        cached = lookup(feedback_key(question, correct_answer, user_answer)) if not is_correct and user_answer is not None else None
+        if cached:
+            explanation, why_wrong, source = cached['explanation'], cached['why_wrong'], 'ai'
+        else:
+            explanation, why_wrong = generate_question_explanation(question_text, correct_answer, user_answer, options)
+            source = 'local'
+            if question.get('explanation'):
+                explanation = question['explanation']
+        if user_answer is None:
+            why_wrong = 'No answer was selected for this question.'
+
+        question_feedback.append({
+            "question_id": question.get('id', i + 1),
+            "question_text": question_text,
+            "options": options,
+            "user_answer": user_answer,
+            "correct_answer": correct_answer,
+            "is_correct": is_correct,
+            "explanation": explanation,
+            "why_wrong": why_wrong if not is_correct else None,
+            "feedback_source": source
+        })
+    return question_feedback
+
+
+def grade_mcq_quiz(quiz_data, user_answers, subject, topic):
+    """Full assessment for an MCQ quiz computed locally, in the LLM response shape"""
+    question_feedback = grade_mcq_questions(quiz_data.get('questions', []), user_answers or {})
+    total_questions = len(question_feedback)
+    correct_answers = sum(1 for item in question_feedback if item['is_correct'])
+
+    percentage = (correct_answers / total_questions * 100) if total_questions > 0 else 0
+
+    return {
+        "score": correct_answers * 10,
+        "total_questions": total_questions,
+        "correct_answers": correct_answers,
+        "percentage": round(percentage, 1),
+        "grade": calculate_grade(percentage),
+        "assessment": generate_assessment_feedback(percentage, correct_answers, total_questions, topic),
+        "question_feedback": question_feedback,
+        "study_recommendations": generate_study_recommendations(topic, percentage),
+        "resources": generate_study_resources(topic),
+        "graded_by": "local"
+    }
+
+
+def save_assessment(assessment):
+    """Store a full assessment under a new assessment_id and return the id"""
+    assessment_id = uuid.uuid4().hex
+    assessment['assessment_id'] = assessment_id
+    assessment_store.set(assessment_id, assessment)
+    return assessment_id
+
+
+def start_explanation_enrichment(assessment, topic, academic_level):
+    """
+    Store the assessment and ask the LLM in the background for richer
+    explanations of the wrong answers that have no cached AI feedback yet.
+    Returns the assessment id.
+    """
+    wrong = [item for item in assessment['question_feedback'] if not item['is_correct']]
+    missing = [item for item in wrong if item.get('feedback_source') != 'ai']
+    if not wrong:
+        assessment['enrichment'] = 'not_needed'
+    else:
+        assessment['enrichment'] = 'pending' if missing else 'complete'
+    assessment_id = save_assessment(assessment)
+
+    if missing:
+        _enrichment_pool.submit(copy_context().run, _enrich_explanations, assessment_id, missing, topic, academic_level)
+    elif wrong:
+        print(f"♻️ All {len(wrong)} wrong-answer explanations for {assessment_id} served from the feedback cache")
+    return assessment_id
+
+
+def get_assessment(assessment_id):
+    return assessment_store.get(assessment_id)
+
+
+def explanation_payload(items, topic, academic_level):
+    """Groq payload asking why each of the items' answers is wrong"""
+    prompt = f"""A {academic_level} level student answered these multiple-choice questions on {topic} incorrectly.
+
+{json.dumps(items, indent=2)}
+
+For each item explain why the correct answer is right and why the student's answer is wrong.
+Refer to options by their text, not their letter - other students may see them in a different order.
+
+Respond with ONLY valid JSON in this exact format:
+{{"feedback": [{{"id": "1", "explanation": "...", "why_wrong": "..."}}]}}"""
+
+    return {
+        'model': ENRICHMENT_MODEL,
+        'messages': [
+            {'role': 'system', 'content': 'You are an expert educator explaining quiz mistakes. Always respond with valid JSON only.'},
+            {'role': 'user', 'content': prompt}
+        ],
+        'max_tokens': min(300 * len(items), 3000),
+        'temperature': 0.3
+    }
+
+
+def explain_wrong_answers_with_llm(items, topic, academic_level):
+    """
+    Ask the LLM why each student answer is wrong. Items carry an 'id', the
+    question text, options, correct_answer and user_answer; returns
+    {id: {'explanation': ..., 'why_wrong': ...}}.
+    """
+    payload = explanation_payload(items, topic, academic_level)
+    response = post_chat_completion(payload, timeout=(10, 30))
+    if response.status_code != 200:
+        raise ValueError(f"Groq API error: {response.status_code}")
+    groq_response = response.json()
+    content = completion_content(groq_response)
+    if not content:
+        raise ValueError("No response from AI model")
+    if not is_truncated(groq_response):
+        return {str(item.get('id')): item for item in extract_json(content).get('feedback', [])}
+
+    # Cut off at max_tokens: keep the complete items and ask again only for the missing ones
+    def missing_payload(kept, remaining):
+        done = {str(item.get('id')) for item in kept}
+        return explanation_payload([item for item in items if str(item['id']) not in done], topic, academic_level)
+
+    feedback = run_completion_steps(continue_truncated_array(payload, groq_response, 'feedback', len(items), missing_payload, (10, 30)))
+    return {str(item.get('id')): item for item in feedback}
+
+
+def remember_item_feedback(item, extra):
+    """Cache an LLM explanation for a graded wrong answer"""
+    question = {'question': item['question_text'], 'options': item['options']}
+    remember(
+        feedback_key(question, item['correct_answer'], item['user_answer']),
+        extra.get('explanation') or item['explanation'],
+        extra.get('why_wrong') or item['why_wrong']
+    )
+
+
+def _enrich_explanations(assessment_id, wrong, topic, academic_level):
+    items = [{
+        'id': str(item['question_id']),
+        'question': item['question_text'],
+        'options': item['options'],
+        'correct_answer': item['correct_answer'],
+        'user_answer': item['user_answer']
+    } for item in wrong]
+
+    try:
+        enriched = explain_wrong_answers_with_llm(items, topic, academic_level)
+    except Exception as e:
+        print(f"⚠️ Explanation enrichment failed for {assessment_id}: {e}")
+        assessment_store.update(assessment_id, lambda a: {**a, 'enrichment': 'failed'})
+        return
+
+    for item in wrong:
+        extra = enriched.get(str(item['question_id']))
+        if extra and item['user_answer'] is not None:
+            remember_item_feedback(item, extra)
+
+    def merge(assessment):
+        feedback = []
+        for item in assessment['question_feedback']:
+            extra = enriched.get(str(item['question_id']))
+            if extra and not item['is_correct']:
+                item = {
+                    **item,
+                    'explanation': extra.get('explanation') or item['explanation'],
+                    'why_wrong': extra.get('why_wrong') or item['why_wrong'],
+                    'feedback_source': 'ai'
+                }
+            feedback.append(item)
+        return {**assessment, 'question_feedback': feedback, 'enrichment': 'complete'}
+
+    assessment_store.update(assessment_id, merge)
+    print(f"✨ Enriched {len(enriched)} explanations for assessment {assessment_id}")
@@ -0,0 +1,230 @@
+"""
+Progressive explanations: a quick outline from a small completion first,
+then each section generated on its own when a client asks for it (or
+prefetched), with outlines and sections cached individually so sections
+nobody opens are never generated
+"""
+
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+from groq_client import completion_content, extract_json
+from ttl_store import TTLStore
+
+OUTLINE_MODEL = os.environ.get('PROGRESSIVE_OUTLINE_MODEL', 'llama3-8b-8192')
+OUTLINE_MAX_TOKENS = int(os.environ.get('PROGRESSIVE_OUTLINE_MAX_TOKENS', 500))
+SECTION_MODEL = os.environ.get('PROGRESSIVE_SECTION_MODEL', 'llama3-8b-8192')
+SECTION_MAX_TOKENS = int(os.environ.get('PROGRESSIVE_SECTION_MAX_TOKENS', 700))
+OUTLINE_SECTIONS = int(os.environ.get('PROGRESSIVE_OUTLINE_SECTIONS', 8))
+# Sections generated in the background as soon as the outline is served
+PREFETCH_SECTIONS = int(os.environ.get('PROGRESSIVE_PREFETCH_SECTIONS', 1))
+SECTION_WORKERS = int(os.environ.get('PROGRESSIVE_SECTION_WORKERS', 8))
+SECTION_WAIT_SECONDS = 60
+
+_cache_ttl = int(os.environ.get('PROGRESSIVE_CACHE_TTL', 6 * 3600))
+outlines = TTLStore(maxsize=int(os.environ.get('PROGRESSIVE_OUTLINE_KEYS', 1000)), ttl=_cache_ttl)
+sections = TTLStore(maxsize=int(os.environ.get('PROGRESSIVE_SECTION_KEYS', 8000)), ttl=_cache_ttl)
+
+# Same headings the comprehensive prompt asks for, used when the outline call returns nothing usable
+TEMPLATE_SECTIONS = [
+    ('Clear Definition', 'What it is, in a few precise sentences'),
+    ('Core Concepts', 'The fundamental concepts and principles'),
+    ('How It Works', 'The mechanisms and processes involved'),
+    ('Real-World Applications', 'Concrete examples and use cases'),
+    ('Benefits and Advantages', 'Why it matters and what problems it solves'),
+    ('Challenges and Limitations', 'Current challenges and limitations'),
+    ('Future Implications', 'Where the topic is heading'),
+    ('Key Takeaways', 'The most important points to remember')
+]
+
+_section_pool = ThreadPoolExecutor(max_workers=SECTION_WORKERS, thread_name_prefix='explain-section')
+# Sections being generated right now, so a prefetch and a client request share one call
+_pending = {}
+_pending_lock = threading.Lock()
+
+
+def _norm(value):
+    return ' '.join(str(value or '').lower().split())
+
+
+def outline_id(data):
+    """Stable id for a progressive explanation request, shared by identical requests"""
+    key = '|'.join(_norm(data.get(field)) for field in ('subject', 'topic', 'academicLevel', 'context'))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+
+def cached_outline(data):
+    """Cached model outline for a request; template outlines are never returned here"""
+    return outlines.get(outline_id(data))
+
+
+def get_outline(explanation_id):
+    return outlines.get(explanation_id)
+
+
+def outline_steps(data):
+    """Outline as completion steps: one short JSON completion on the small model"""
+    topic = data.get('topic', '')
+    subject = data.get('subject', '')
+    academic_level = data.get('academicLevel', 'Secondary')
+    prompt = f"""Plan an explanation of "{topic}" in {subject} for {academic_level} level students.
+
+Return ONLY a JSON object with exactly {OUTLINE_SECTIONS} sections, in teaching order:
+{{"summary": "one-sentence overview", "sections": [{{"title": "short heading", "summary": "what this section covers, one sentence"}}]}}
+
+Start with a definition and end with key takeaways.
+Context: {data.get('context', '')}"""
+
+    response = yield {
+        'model': OUTLINE_MODEL,
+        'messages': [
+            {'role': 'system', 'content': 'You are an expert educator. Respond with valid JSON only.'},
+            {'role': 'user', 'content': prompt}
+        ],
+        'max_tokens': OUTLINE_MAX_TOKENS,
+        'temperature': 0.3
+    }, (10, 20)
+
+    planned = None
+    if response.status_code == 200:
+        content = completion_content(response.json())
+        try:
+            planned = extract_json(content) if content else None
+        except ValueError as e:
+            print(f"⚠️ Outline was not valid JSON, using the template outline: {e}")
+    return build_outline(data, planned)
+
+
+def build_outline(data, planned):
+    """Outline body from the model's plan, or the template headings when the plan is unusable"""
+    planned_sections = (planned or {}).get('sections') if isinstance(planned, dict) else None
+    entries = [
+        (str(item.get('title', '')).strip(), str(item.get('summary', '')).strip())
+        for item in planned_sections or [] if isinstance(item, dict)
+    ]
+    entries = [(title, summary) for title, summary in entries if title][:OUTLINE_SECTIONS]
+    source = 'groq_ai'
+    explanation_id = outline_id(data)
+    if len(entries) < 2:
+        # Its own id, so cached_outline() never serves a template that came from a failed call
+        entries, source = TEMPLATE_SECTIONS, 'template'
+        explanation_id += '-template'
+
+    return {
+        'success': True,
+        'mode': 'progressive',
+        'explanation_id': explanation_id,
+        'topic': data.get('topic', ''),
+        'subject': data.get('subject', ''),
+        'academic_level': data.get('academicLevel', 'Secondary'),
+        'summary': str((planned or {}).get('summary', '')).strip() if isinstance(planned, dict) else '',
+        'sections': [
+            {
+                'id': number,
+                'title': title,
+                'summary': summary,
+                'url': f'/api/explain-topic/{explanation_id}/sections/{number}'
+            }
+            for number, (title, summary) in enumerate(entries, 1)
+        ],
+        'source': source
+    }
+
+
+def remember_outline(data, outline):
+    """Keep the outline and the request it came from, so sections can be generated later"""
+    entry = {
+        'outline': outline,
+        'request': {field: data.get(field, '') for field in ('subject', 'topic', 'academicLevel', 'context')}
+    }
+    outlines.set(outline['explanation_id'], entry)
+    return entry
+
+
+def section_steps(entry, section_id):
+    """One outline section as completion steps"""
+    outline = entry['outline']
+    request = entry['request']
+    section = outline['sections'][section_id - 1]
+    plan = '\n'.join(f"{item['id']}. {item['title']}" for item in outline['sections'])
+    prompt = f"""You are writing section {section_id} of an explanation of "{request['topic']}" in {request['subject']} for {request['academicLevel'] or 'Secondary'} level students.
+
+Full outline:
+{plan}
+
+Write only section {section_id}: "{section['title']}" - {section['summary']}
+- 200-300 words, clear and engaging, with a specific example where it helps
+- Markdown, but do not repeat the section title as a heading
+- Do not cover material that belongs to other sections
+
+Context: {request['context']}"""
+
+    response = yield {
+        'model': SECTION_MODEL,
+        'messages': [
+            {'role': 'system', 'content': 'You are an expert educator. Provide clear, accurate, and engaging explanations.'},
+            {'role': 'user', 'content': prompt}
+        ],
+        'max_tokens': SECTION_MAX_TOKENS,
+        'temperature': 0.7
+    }, (10, 30)
+
+    if response.status_code != 200:
+        return {'error': f'AI API error: {response.status_code}'}, response.status_code
+    content = completion_content(response.json())
+    if not content:
+        return {'error': 'No response from AI model'}, 502
+    return {
+        'success': True,
+        'explanation_id': outline['explanation_id'],
+        'section_id': section_id,
+        'title': section['title'],
+        'content': content,
+        'word_count': len(content.split()),
+        'source': 'groq_ai'
+    }, 200
+
+
+def cached_section(explanation_id, section_id):
+    return sections.get((explanation_id, section_id))
+
+
+def section_future(explanation_id, section_id, generate):
+    """
+    Future for a section's (body, status), joining a generation already in
+    flight. generate() runs on the section pool in the caller's context and
+    successful sections are cached.
+    """
+    key = (explanation_id, section_id)
+    with _pending_lock:
+        future = _pending.get(key)
+        if future is None:
+            future = _pending[key] = _section_pool.submit(copy_context().run, _generate_section, key, generate)
+    return future
+
+
+def _generate_section(key, generate):
+    try:
+        body, status = generate()
+        if status == 200:
+            sections.set(key, body)
+        return body, status
+    finally:
+        with _pending_lock:
+            _pending.pop(key, None)
+
+
+def prefetch_sections(outline, generate_for):
+    """Start the first PREFETCH_SECTIONS sections in the background; generate_for(section_id) builds each call"""
+    for section in outline['sections'][:PREFETCH_SECTIONS]:
+        if cached_section(outline['explanation_id'], section['id']) is None:
+            future = section_future(outline['explanation_id'], section['id'], generate_for(section['id']))
+            future.add_done_callback(_log_prefetch_failure)
+
+
+def _log_prefetch_failure(future):
+    if future.exception() is not None:
+        print(f"⚠️ Section prefetch failed: {future.exception()}")
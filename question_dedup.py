@@ -0,0 +1,152 @@
+"""
+Near-duplicate question detection using MinHash signatures and an LSH index
+"""
+
+import os
+import re
+import zlib
+
+# Tunables (override through environment variables)
+DEFAULT_THRESHOLD = float(os.environ.get('QUESTION_DEDUP_THRESHOLD', 0.7))
+DEFAULT_NUM_PERM = int(os.environ.get('QUESTION_DEDUP_NUM_PERM', 64))
+DEFAULT_BANDS = int(os.environ.get('QUESTION_DEDUP_BANDS', 16))
+DEFAULT_SHINGLE_SIZE = int(os.environ.get('QUESTION_DEDUP_SHINGLE_SIZE', 5))
+
+_EMPTY = 1 << 32
+_NON_WORD = re.compile(r'[^\w\s]+')
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    """Lowercase, drop punctuation and collapse whitespace"""
+    text = _NON_WORD.sub(' ', str(text).lower())
+    return _SPACES.sub(' ', text).strip()
+
+
+def question_text(question):
+    """
+    Text used to fingerprint a question: the stem alone. Sibling questions
+    often share an option set ("SI unit of energy" / "of power"), which would
+    otherwise dominate the shingles and make distinct stems look identical.
+    """
+    return normalize_text(question.get('question', ''))
+
+
+def shingles(text, size=DEFAULT_SHINGLE_SIZE):
+    """Character shingles of a normalized text"""
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def minhash_signature(text, num_perm=DEFAULT_NUM_PERM, shingle_size=DEFAULT_SHINGLE_SIZE):
+    """
+    One-permutation MinHash signature: every shingle hash is routed to one of
+    num_perm bins and each bin keeps its minimum. Empty bins are filled from the
+    next non-empty bin (rotation densification) so signatures stay comparable.
+    """
+    signature = [_EMPTY] * num_perm
+    for shingle in shingles(text, shingle_size):
+        h = zlib.crc32(shingle.encode('utf-8'))
+        b = h % num_perm
+        value = h // num_perm
+        if value < signature[b]:
+            signature[b] = value
+
+    if _EMPTY in signature:
+        if all(v == _EMPTY for v in signature):
+            return tuple(signature)
+        dense = list(signature)
+        for i, value in enumerate(signature):
+            if value != _EMPTY:
+                continue
+            step = 1
+            while signature[(i + step) % num_perm] == _EMPTY:
+                step += 1
+            dense[i] = signature[(i + step) % num_perm] + step * _EMPTY
+        signature = dense
+
+    return tuple(signature)
+
+
+def estimate_similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of two signatures"""
+    matches = sum(1 for a, b in zip(sig_a, sig_b) if a == b)
+    return matches / len(sig_a) if sig_a else 0.0
+
+
+class NearDuplicateIndex:
+    """LSH index over MinHash signatures for fast near-duplicate lookups"""
+
+    def __init__(self, threshold=None, num_perm=None, bands=None, shingle_size=None):
+        self.threshold = DEFAULT_THRESHOLD if threshold is None else threshold
+        self.num_perm = num_perm or DEFAULT_NUM_PERM
+        self.bands = bands or DEFAULT_BANDS
+        self.shingle_size = shingle_size or DEFAULT_SHINGLE_SIZE
+        if self.num_perm % self.bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.rows = self.num_perm // self.bands
+        self._buckets = [{} for _ in range(self.bands)]
+        self._signatures = {}
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def signature(self, text):
+        return minhash_signature(text, self.num_perm, self.shingle_size)
+
+    def _band_keys(self, signature):
+        rows = self.rows
+        for band in range(self.bands):
+            yield band, signature[band * rows:(band + 1) * rows]
+
+    def query(self, text=None, signature=None):
+        """Return [(key, similarity)] of indexed items at or above the threshold"""
+        if signature is None:
+            signature = self.signature(text)
+        candidates = set()
+        for band, band_key in self._band_keys(signature):
+            candidates.update(self._buckets[band].get(band_key, ()))
+
+        matches = []
+        for key in candidates:
+            similarity = estimate_similarity(signature, self._signatures[key])
+            if similarity >= self.threshold:
+                matches.append((key, similarity))
+        matches.sort(key=lambda item: item[1], reverse=True)
+        return matches
+
+    def add(self, key, text=None, signature=None):
+        """Index an item and return the near-duplicates it had before insertion"""
+        if signature is None:
+            signature = self.signature(text)
+        matches = self.query(signature=signature)
+        self._signatures[key] = signature
+        for band, band_key in self._band_keys(signature):
+            self._buckets[band].setdefault(band_key, []).append(key)
+        return matches
+
+
+def dedupe_questions(questions, threshold=None, index=None):
+    """
+    Drop near-duplicate questions, keeping the first occurrence.
+
+    Returns (unique_questions, duplicates) where duplicates is a list of
+    (dropped_position, similarity). Pass an existing index to also reject
+    questions that duplicate ones indexed by earlier calls.
+    """
+    if index is None:
+        index = NearDuplicateIndex(threshold=threshold)
+
+    unique = []
+    duplicates = []
+    for position, question in enumerate(questions):
+        signature = index.signature(question_text(question))
+        matches = index.query(signature=signature)
+        if matches:
+            duplicates.append((position, matches[0][1]))
+            continue
+        index.add(len(index), signature=signature)
+        unique.append(question)
+
+    return unique, duplicates
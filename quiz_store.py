@@ -0,0 +1,94 @@
+"""
+Server-side quiz sessions: generated quizzes (with their answer keys) are kept
+here so assessment requests only need a quiz_id and the student's answers
+"""
+
+import json
+import os
+import uuid
+
+from ttl_store import TTLStore
+
+try:
+    import redis
+except ImportError:  # optional shared backend
+    redis = None
+
+QUIZ_SESSION_TTL = int(os.environ.get('QUIZ_SESSION_TTL', 4 * 3600))
+QUIZ_SESSION_MAX = int(os.environ.get('QUIZ_SESSION_MAX', 5000))
+QUIZ_STORE_REDIS_URL = os.environ.get('QUIZ_STORE_REDIS_URL') or os.environ.get('REDIS_URL')
+HIDE_ANSWER_KEYS = os.environ.get('QUIZ_HIDE_ANSWER_KEYS', 'false').lower() == 'true'
+
+# Fields that reveal the answer key and can be withheld from clients
+ANSWER_KEY_FIELDS = ('correct_answer', 'explanation', 'model_answer', 'key_points')
+
+_REDIS_PREFIX = 'acadtutor:quiz:'
+
+
+class QuizSessionStore:
+    """In-memory LRU/TTL tier in front of an optional shared Redis backend"""
+
+    def __init__(self, ttl=QUIZ_SESSION_TTL, maxsize=QUIZ_SESSION_MAX, redis_url=QUIZ_STORE_REDIS_URL):
+        self.ttl = ttl
+        self._local = TTLStore(maxsize=maxsize, ttl=ttl)
+        self._shared = None
+        if redis_url and redis is not None:
+            self._shared = redis.Redis.from_url(redis_url)
+        elif redis_url:
+            print("⚠️  Redis URL configured but the redis package is not installed - using in-memory quiz store only")
+
+    @property
+    def backend(self):
+        return 'redis' if self._shared is not None else 'memory'
+
+    def save(self, session):
+        quiz_id = uuid.uuid4().hex
+        self._local.set(quiz_id, session)
+        if self._shared is not None:
+            try:
+                self._shared.setex(_REDIS_PREFIX + quiz_id, self.ttl, json.dumps(session))
+            except Exception as e:
+                print(f"⚠️ Shared quiz store write failed: {e}")
+        return quiz_id
+
+    def load(self, quiz_id):
+        session = self._local.get(quiz_id)
+        if session is not None or self._shared is None:
+            return session
+        try:
+            raw = self._shared.get(_REDIS_PREFIX + quiz_id)
+        except Exception as e:
+            print(f"⚠️ Shared quiz store read failed: {e}")
+            return None
+        if raw is None:
+            return None
+        session = json.loads(raw)
+        self._local.set(quiz_id, session)
+        return session
+
+
+quiz_sessions = QuizSessionStore()
+
+
+def save_quiz_session(quiz, quiz_type, subject, topic, academic_level):
+    """Store a generated quiz and its context; returns the new quiz_id"""
+    return quiz_sessions.save({
+        'quiz': quiz,
+        'quiz_type': quiz_type,
+        'subject': subject,
+        'topic': topic,
+        'academic_level': academic_level
+    })
+
+
+def load_quiz_session(quiz_id):
+    return quiz_sessions.load(quiz_id)
+
+
+def strip_answer_keys(quiz):
+    """Copy of a quiz without the fields that give away the answers"""
+    questions = [
+        {key: value for key, value in question.items() if key not in ANSWER_KEY_FIELDS}
+        for question in quiz.get('questions', [])
+    ]
+    return {**quiz, 'questions': questions}
@@ -0,0 +1,105 @@
+"""
+Seeded MCQ quiz variants: one generated quiz becomes a different question
+order, option order and (optionally) question subset per student. A variant
+is rebuilt from the canonical quiz and its seed alone, so only the seed needs
+keeping per student and no further LLM calls are made.
+"""
+
+import hashlib
+import os
+import random
+import secrets
+
+from mcq_grading import lookup_answer, normalize_option
+
+MAX_VARIANTS = int(os.environ.get('QUIZ_MAX_VARIANTS', 500))
+
+# Options that refer to the other options stay where they are
+_PINNED_PREFIXES = ('all of the above', 'none of the above', 'both ', 'neither ')
+
+
+def variant_seed(quiz_id, student_id):
+    """Stable seed for a student's variant of a quiz, so nothing has to be stored"""
+    if student_id is None or str(student_id).strip() == '':
+        raise ValueError('A student id is required to derive a variant seed')
+    digest = hashlib.sha256(f'{quiz_id}:{student_id}'.encode('utf-8')).hexdigest()
+    return int(digest[:12], 16)
+
+
+def random_variant_seed():
+    """Fresh seed for an anonymous student; the client keeps it and sends it back for grading"""
+    return secrets.randbits(48)
+
+
+def variant_error(quiz):
+    """Why a quiz cannot be varied, or None when every question has a usable answer key"""
+    questions = quiz.get('questions') or []
+    if not questions:
+        return 'Quiz has no questions'
+    for i, question in enumerate(questions):
+        options = question.get('options')
+        if not isinstance(options, dict) or len(options) < 2:
+            return f'Question {i + 1} has no options to shuffle'
+        if normalize_option(question.get('correct_answer')) not in options:
+            return f'Question {i + 1} has no valid correct_answer'
+    return None
+
+
+def _is_pinned(text):
+    return str(text).strip().lower().startswith(_PINNED_PREFIXES)
+
+
+def _shuffle_options(options, rng):
+    """Shuffled options under the same letters, and the letter mapping old -> new"""
+    letters = sorted(options)
+    movable = [letter for letter in letters if not _is_pinned(options[letter])]
+    rng.shuffle(movable)
+    order = iter(movable)
+    # placed[i] is the original letter now shown under letters[i]
+    placed = [letter if _is_pinned(options[letter]) else next(order) for letter in letters]
+    mapping = {original: shown for shown, original in zip(letters, placed)}
+    return {shown: options[original] for shown, original in zip(letters, placed)}, mapping
+
+
+def _variant_plan(questions, seed, size):
+    """(canonical position, shuffled options, letter mapping) per variant question, in variant order"""
+    rng = random.Random(seed)
+    positions = list(range(len(questions)))
+    rng.shuffle(positions)
+    if size:
+        positions = positions[:max(1, min(size, len(positions)))]
+    return [(position, *_shuffle_options(questions[position]['options'], rng)) for position in positions]
+
+
+def make_variant(quiz, seed, size=None):
+    """The quiz as the student with this seed sees it, with correct_answer remapped"""
+    questions = quiz.get('questions', [])
+    variant_questions = []
+    for number, (position, options, mapping) in enumerate(_variant_plan(questions, seed, size), 1):
+        question = questions[position]
+        variant_questions.append({
+            **question,
+            'id': number,
+            'canonical_id': question.get('id', position + 1),
+            'options': options,
+            'correct_answer': mapping.get(normalize_option(question.get('correct_answer')))
+        })
+    return {**quiz, 'questions': variant_questions, 'variant_seed': seed, 'variant_size': len(variant_questions)}
+
+
+def canonical_answers(quiz, seed, answers, size=None):
+    """
+    Map a student's answers on a variant back onto the canonical quiz: returns
+    the canonical questions the variant contained and the answers keyed by
+    their canonical ids, with option letters translated back.
+    """
+    questions = quiz.get('questions', [])
+    variant_questions = []
+    canonical = {}
+    for number, (position, _, mapping) in enumerate(_variant_plan(questions, seed, size)):
+        question_id = questions[position].get('id', position + 1)
+        variant_questions.append({**questions[position], 'id': question_id})
+        shown = normalize_option(lookup_answer(answers or {}, {'id': number + 1}, number))
+        if shown is not None:
+            canonical[str(question_id)] = {new: old for old, new in mapping.items()}.get(shown, shown)
+    return variant_questions, canonical
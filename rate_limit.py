@@ -0,0 +1,312 @@
+"""
+Per-client fair-share rate limiting: token buckets per client (API token or
+IP) for each upstream-bound endpoint, plus one bucket per client for the
+estimated LLM tokens its requests cost. Buckets live in process memory, or
+in Redis when configured so every worker shares them.
+"""
+
+import hashlib
+import math
+import os
+import threading
+import time
+
+from chat_sessions import CHAT_HISTORY_TOKENS, estimate_tokens
+from ttl_store import TTLStore
+
+try:
+    import redis
+except ImportError:  # optional shared backend
+    redis = None
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMIT_REDIS_URL = os.environ.get('RATE_LIMIT_REDIS_URL') or os.environ.get('REDIS_URL')
+# X-Forwarded-For is client-supplied; only the hops our own proxies append can be trusted.
+# Off unless configured (Render and most PaaS put one proxy in front of the app).
+RATE_LIMIT_TRUST_PROXY = os.environ.get('RATE_LIMIT_TRUST_PROXY', 'false').lower() == 'true'
+RATE_LIMIT_PROXY_HOPS = int(os.environ.get('RATE_LIMIT_PROXY_HOPS', 1 if RATE_LIMIT_TRUST_PROXY else 0))
+# Tokens that identify a client; any other token is ignored and the client keyed on its IP
+RATE_LIMIT_API_KEYS = frozenset(key.strip() for key in os.environ.get('RATE_LIMIT_API_KEYS', '').split(',') if key.strip())
+RATE_LIMIT_MAX_CLIENTS = int(os.environ.get('RATE_LIMIT_MAX_CLIENTS', 20000))
+
+# endpoint: (requests per minute, burst)
+ENDPOINT_LIMIT_DEFAULTS = {
+    'chat': (30, 10),
+    'explain': (20, 5),
+    'explain-section': (60, 16),
+    'generate-quiz': (10, 3),
+    'generate-quiz-batch': (2, 1),
+    'assess-quiz': (30, 10),
+    'assess-quiz-batch': (4, 2),
+    'test-connection': (6, 2)
+}
+# Estimated LLM tokens (prompt + completion) each client may spend
+LLM_TOKENS_PER_MINUTE = int(os.environ.get('RATE_LIMIT_LLM_TOKENS_PER_MINUTE', 20000))
+LLM_TOKEN_BURST = int(os.environ.get('RATE_LIMIT_LLM_TOKEN_BURST', 40000))
+
+ROUTES = {
+    ('POST', '/api/chat'): 'chat',
+    ('POST', '/api/explain-topic'): 'explain',
+    ('POST', '/api/generate-quiz'): 'generate-quiz',
+    ('POST', '/api/generate-quiz/batch'): 'generate-quiz-batch',
+    ('POST', '/api/assess-quiz'): 'assess-quiz',
+    ('POST', '/api/assess-quiz/batch'): 'assess-quiz-batch',
+    ('GET', '/api/test-connection'): 'test-connection'
+}
+
+_REDIS_PREFIX = 'acadtutor:ratelimit:'
+
+# Checks every bucket before taking from any, so a denied request costs nothing.
+# KEYS are bucket keys; ARGV holds capacity, refill/second and cost per key.
+_TAKE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local levels = {}
+local allowed = 1
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 3 - 2])
+    local rate = tonumber(ARGV[i * 3 - 1])
+    local cost = tonumber(ARGV[i * 3])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    levels[i] = tokens
+    if tokens < cost then
+        allowed = 0
+    end
+end
+local result = {allowed}
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 3 - 2])
+    local rate = tonumber(ARGV[i * 3 - 1])
+    if allowed == 1 then
+        levels[i] = levels[i] - tonumber(ARGV[i * 3])
+    end
+    redis.call('HSET', key, 'tokens', tostring(levels[i]), 'ts', tostring(now))
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+    result[i + 1] = tostring(levels[i])
+end
+return result
+"""
+
+
+class Bucket:
+    """One client's token bucket to draw from: capacity, refill per second and this request's cost"""
+
+    def __init__(self, client, name, capacity, per_minute, cost=1):
+        self.name = name
+        self.key = f'{client}:{name}'
+        self.capacity = capacity
+        self.rate = per_minute / 60.0
+        # A request larger than the whole bucket may still run once the bucket is full
+        self.cost = min(cost, capacity)
+
+
+class RateLimiter:
+    """All-or-nothing token bucket checks, in memory or on a shared Redis backend"""
+
+    def __init__(self, redis_url=RATE_LIMIT_REDIS_URL, max_clients=RATE_LIMIT_MAX_CLIENTS):
+        # Idle buckets refill completely within a few minutes, so expiring them loses nothing
+        self._local = TTLStore(maxsize=max_clients, ttl=3600)
+        self._lock = threading.Lock()
+        self._shared = None
+        self._script = None
+        self._allowed = 0
+        self._limited = 0
+        if redis_url and redis is not None:
+            self._shared = redis.Redis.from_url(redis_url)
+            self._script = self._shared.register_script(_TAKE_SCRIPT)
+        elif redis_url:
+            print("⚠️  Redis URL configured but the redis package is not installed - using in-memory rate limits only")
+
+    @property
+    def backend(self):
+        return 'redis' if self._shared is not None else 'memory'
+
+    def _take_local(self, buckets):
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            for bucket in buckets:
+                tokens, updated = self._local.get(bucket.key, (bucket.capacity, now))
+                levels.append(min(bucket.capacity, tokens + (now - updated) * bucket.rate))
+            allowed = all(level >= bucket.cost for level, bucket in zip(levels, buckets))
+            if allowed:
+                levels = [level - bucket.cost for level, bucket in zip(levels, buckets)]
+            for level, bucket in zip(levels, buckets):
+                self._local.set(bucket.key, (level, now))
+        return allowed, levels
+
+    def _take_shared(self, buckets):
+        args = []
+        for bucket in buckets:
+            args += [bucket.capacity, bucket.rate, bucket.cost]
+        result = self._script(keys=[_REDIS_PREFIX + bucket.key for bucket in buckets], args=args)
+        return bool(int(result[0])), [float(level) for level in result[1:]]
+
+    def take(self, buckets):
+        """Draw each bucket's cost if every bucket can afford it; returns the decision"""
+        if self._shared is not None:
+            try:
+                allowed, levels = self._take_shared(buckets)
+            except Exception as e:
+                print(f"⚠️ Shared rate limiter failed, using in-memory buckets: {e}")
+                allowed, levels = self._take_local(buckets)
+        else:
+            allowed, levels = self._take_local(buckets)
+
+        with self._lock:
+            if allowed:
+                self._allowed += 1
+            else:
+                self._limited += 1
+        return _decision(buckets, levels, allowed)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'enabled': RATE_LIMIT_ENABLED,
+                'backend': self.backend,
+                'allowed': self._allowed,
+                'limited': self._limited
+            }
+
+
+def _decision(buckets, levels, allowed):
+    """Header values for the bucket that binds: the one denying the request, else the emptiest"""
+    waits = [math.ceil((bucket.cost - level) / bucket.rate) if level < bucket.cost else 0
+             for bucket, level in zip(buckets, levels)]
+    if allowed:
+        index = min(range(len(buckets)), key=lambda i: levels[i] / buckets[i].capacity)
+    else:
+        index = max(range(len(buckets)), key=lambda i: waits[i])
+    bucket, level = buckets[index], max(0.0, levels[index])
+    return {
+        'allowed': allowed,
+        'limit': bucket.capacity,
+        'remaining': int(level),
+        'reset': math.ceil((bucket.capacity - level) / bucket.rate),
+        'retry_after': 0 if allowed else max(1, waits[index]),
+        'bucket': bucket.name
+    }
+
+
+def endpoint_limits(name):
+    prefix = 'RATE_LIMIT_' + name.upper().replace('-', '_')
+    per_minute, burst = ENDPOINT_LIMIT_DEFAULTS[name]
+    return (float(os.environ.get(f'{prefix}_PER_MINUTE', per_minute)),
+            int(os.environ.get(f'{prefix}_BURST', burst)))
+
+
+def client_ip(headers, remote_addr):
+    """
+    Client address: with RATE_LIMIT_PROXY_HOPS trusted proxies in front, the
+    X-Forwarded-For entry the outermost of them appended; otherwise the peer
+    address. Entries left of that are supplied by the client and ignored.
+    """
+    if RATE_LIMIT_PROXY_HOPS > 0:
+        hops = [hop.strip() for hop in (headers.get('X-Forwarded-For') or '').split(',') if hop.strip()]
+        if len(hops) >= RATE_LIMIT_PROXY_HOPS:
+            return hops[-RATE_LIMIT_PROXY_HOPS]
+    return remote_addr or 'unknown'
+
+
+def client_id(headers, remote_addr):
+    """Stable client identity: a hash of an allow-listed API token if one is sent, else the client IP"""
+    token = headers.get('X-API-Key') or ''
+    auth = headers.get('Authorization') or ''
+    if not token and auth.lower().startswith('bearer '):
+        token = auth[7:].strip()
+    if token and token in RATE_LIMIT_API_KEYS:
+        return 'token-' + hashlib.sha256(token.encode('utf-8')).hexdigest()[:16]
+    return 'ip-' + client_ip(headers, remote_addr)
+
+
+def _quiz_tokens(spec):
+    try:
+        num_questions = int(spec.get('numQuestions', 10))
+    except (TypeError, ValueError):
+        num_questions = 10
+    # Prompt plus roughly 180 completion tokens per question
+    return 800 + 180 * max(1, num_questions)
+
+
+def _assessment_tokens(data, answers):
+    count = len(answers) if isinstance(answers, dict) else 0
+    # Subjective answers may be escalated to LLM review; MCQ grading is local
+    return count * (400 if data.get('quizType', 'mcq') != 'mcq' else 30)
+
+
+def estimate_llm_tokens(endpoint, data):
+    """Rough upstream token cost of a request, charged before it runs"""
+    data = data if isinstance(data, dict) else {}
+    if endpoint == 'chat':
+        message = str(data.get('message') or '') + str(data.get('context') or '')
+        return estimate_tokens(message) + CHAT_HISTORY_TOKENS + 600
+    if endpoint == 'explain':
+        # A progressive request only asks for the outline
+        return 700 if data.get('mode') == 'progressive' else 3000
+    if endpoint == 'explain-section':
+        return 1100
+    if endpoint == 'generate-quiz':
+        return _quiz_tokens(data)
+    if endpoint == 'generate-quiz-batch':
+        defaults = {key: data[key] for key in ('numQuestions',) if key in data}
+        return sum(_quiz_tokens({**defaults, **spec}) for spec in data.get('specs') or [] if isinstance(spec, dict))
+    if endpoint == 'assess-quiz':
+        return _assessment_tokens(data, data.get('answers'))
+    if endpoint == 'assess-quiz-batch':
+        return sum(_assessment_tokens(data, student.get('answers'))
+                   for student in data.get('students') or [] if isinstance(student, dict))
+    # test-connection only reads the prober's zero-token check
+    return 0
+
+
+def endpoint_for(method, path, data):
+    """Rate-limited endpoint name and the payload it will run, or (None, None)"""
+    if path == '/api/jobs' and method == 'POST' and isinstance(data, dict):
+        # Queued jobs cost the same upstream work as the endpoint they wrap
+        return data.get('type') if data.get('type') in ENDPOINT_LIMIT_DEFAULTS else None, data.get('payload')
+    if method == 'GET' and path.startswith('/api/explain-topic/') and '/sections/' in path:
+        return 'explain-section', data
+    return ROUTES.get((method, path)), data
+
+
+rate_limiter = RateLimiter()
+
+
+def check_rate_limit(method, path, headers, remote_addr, data):
+    """Rate-limit decision for a request, or None when the route is not limited"""
+    if not RATE_LIMIT_ENABLED:
+        return None
+    endpoint, payload = endpoint_for(method, path, data)
+    if endpoint is None:
+        return None
+    client = client_id(headers, remote_addr)
+    per_minute, burst = endpoint_limits(endpoint)
+    buckets = [Bucket(client, endpoint, burst, per_minute)]
+    cost = estimate_llm_tokens(endpoint, payload)
+    if cost:
+        buckets.append(Bucket(client, 'llm-tokens', LLM_TOKEN_BURST, LLM_TOKENS_PER_MINUTE, cost))
+    return rate_limiter.take(buckets)
+
+
+def rate_limit_headers(decision):
+    headers = {
+        'RateLimit-Limit': str(decision['limit']),
+        'RateLimit-Remaining': str(decision['remaining']),
+        'RateLimit-Reset': str(decision['reset'])
+    }
+    if not decision['allowed']:
+        headers['Retry-After'] = str(decision['retry_after'])
+    return headers
+
+
+def rate_limited_body(decision):
+    return {
+        'error': 'Rate limit exceeded - please slow down',
+        'code': 'rate_limited',
+        'limit': decision['bucket'],
+        'retry_after': decision['retry_after']
+    }
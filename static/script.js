@@ -1215,6 +1215,8 @@ async function generateQuiz(subject, topic, academicLevel, quizType, numQuestion
                         }));
                         
                         quiz.questions = [...quiz.questions, ...newQuestions];
+                        // The merged quiz no longer matches the server-side session
+                        delete quiz.quiz_id;
                         console.log(`✅ Added ${newQuestions.length} more AI questions. Total: ${quiz.questions.length}`);
                     }
                 } catch (error) {
@@ -1377,13 +1379,13 @@ async function assessQuiz(quiz, answers, quizType, subject, topic, academicLevel
     try {
         console.log('Assessing quiz with:', { quiz, answers, quizType, subject, topic, academicLevel });
         
-        const response = await fetch('/api/assess-quiz', {
+        const postAssessment = (payload) => fetch('/api/assess-quiz', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
             body: JSON.stringify({
-                quiz: quiz,
+                ...payload,
                 answers: answers,
                 quizType: quizType,
                 subject: subject,
@@ -1392,6 +1394,14 @@ async function assessQuiz(quiz, answers, quizType, subject, topic, academicLevel
             })
         });
 
+        // The server keeps generated quizzes; only send the full quiz if its session expired
+        let response = quiz.quiz_id
+            ? await postAssessment({ quizId: quiz.quiz_id })
+            : await postAssessment({ quiz: quiz });
+        if (response.status === 404 && quiz.quiz_id) {
+            response = await postAssessment({ quiz: quiz });
+        }
+
         const data = await response.json();
         console.log('Assessment API response:', data);
 
@@ -0,0 +1,117 @@
+"""
+In-memory static asset layer: precompressed gzip/brotli variants, content-hash
+fingerprinted URLs in index.html, strong ETags and long-lived caching
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:  # optional; gzip alone is still served
+    brotli = None
+
+# Smaller files are not worth compressing
+COMPRESS_MIN_BYTES = int(os.environ.get('STATIC_COMPRESS_MIN_BYTES', 1024))
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'no-cache'
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+# index.html is the only entry point; its local src/href references get fingerprinted
+_ASSET_REFERENCE = re.compile(r'''((?:src|href)=["'])([^"':?#]+)(["'])''')
+
+
+class Asset:
+    def __init__(self, name, body):
+        self.name = name
+        self.mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.digest = hashlib.sha256(body).hexdigest()[:12]
+        self.variants = {'identity': body}
+        if len(body) >= COMPRESS_MIN_BYTES and self.mimetype.startswith(COMPRESSIBLE_TYPES):
+            gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(gzipped) < len(body):
+                self.variants['gzip'] = gzipped
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=11)
+                if len(compressed) < len(body):
+                    self.variants['br'] = compressed
+
+    @property
+    def fingerprinted_name(self):
+        root, ext = os.path.splitext(self.name)
+        return f"{root}.{self.digest}{ext}"
+
+    def etag(self, encoding):
+        return self.digest if encoding == 'identity' else f"{self.digest}-{encoding}"
+
+
+class StaticAssets:
+    """Loads every file under root once and serves it from memory"""
+
+    def __init__(self, root, entry='index.html'):
+        self.root = root
+        self.entry = entry
+        self._assets = {}
+        self._fingerprinted = {}
+        self.load()
+
+    def load(self):
+        assets = {}
+        for directory, _, files in os.walk(self.root):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                if name == self.entry:
+                    continue
+                with open(path, 'rb') as f:
+                    assets[name] = Asset(name, f.read())
+
+        entry_path = os.path.join(self.root, self.entry)
+        if os.path.exists(entry_path):
+            with open(entry_path, encoding='utf-8') as f:
+                html = f.read()
+
+            def fingerprint(match):
+                asset = assets.get(match.group(2).lstrip('./'))
+                if asset is None:
+                    return match.group(0)
+                return f"{match.group(1)}{asset.fingerprinted_name}{match.group(3)}"
+
+            assets[self.entry] = Asset(self.entry, _ASSET_REFERENCE.sub(fingerprint, html).encode('utf-8'))
+
+        self._assets = assets
+        self._fingerprinted = {asset.fingerprinted_name: asset for asset in assets.values()}
+        saved = sum(len(a.variants['identity']) - min(len(v) for v in a.variants.values()) for a in assets.values())
+        print(f"📦 Loaded {len(assets)} static assets ({saved // 1024} KB saved by compression, brotli: {'yes' if brotli else 'no'})")
+
+    def response(self, name, request):
+        """Response for an asset name (plain or fingerprinted), or None if unknown"""
+        asset = self._fingerprinted.get(name)
+        immutable = asset is not None and name != asset.name
+        if asset is None:
+            asset = self._assets.get(name)
+        if asset is None:
+            return None
+
+        encoding = 'identity'
+        for candidate in ('br', 'gzip'):
+            if candidate in asset.variants and request.accept_encodings[candidate]:
+                encoding = candidate
+                break
+
+        etag = asset.etag(encoding)
+        headers = {
+            'ETag': f'"{etag}"',
+            'Cache-Control': IMMUTABLE_CACHE if immutable else REVALIDATE_CACHE,
+            'Vary': 'Accept-Encoding'
+        }
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers=headers)
+
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(asset.variants[encoding], mimetype=asset.mimetype, headers=headers)
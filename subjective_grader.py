@@ -0,0 +1,282 @@
+"""
+Local pre-grader for subjective answers: scores key-point coverage and
+similarity to the model answer, and flags answers that need the LLM
+"""
+
+import json
+import math
+import os
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextvars import copy_context
+
+from fallback_quiz_enhanced import (
+    calculate_grade,
+    generate_assessment_feedback,
+    generate_study_recommendations,
+    generate_study_resources
+)
+from groq_client import completion_content, extract_json, post_chat_completion
+
+MAX_SCORE = 10
+# Provisional scores inside this band are escalated to the LLM
+ESCALATE_MIN = int(os.environ.get('SUBJECTIVE_ESCALATE_MIN', 3))
+ESCALATE_MAX = int(os.environ.get('SUBJECTIVE_ESCALATE_MAX', 7))
+# Long answers are always escalated; overlap scoring is weakest there
+LONG_ANSWER_WORDS = int(os.environ.get('SUBJECTIVE_LONG_ANSWER_WORDS', 200))
+# Fraction of a key point's weighted terms that must appear to count as covered
+KEY_POINT_COVERED = 0.5
+MIN_CONTENT_TOKENS = 5
+
+# Escalated answers are graded by concurrent per-question LLM calls
+REVIEW_MODEL = os.environ.get('SUBJECTIVE_REVIEW_MODEL', 'llama3-8b-8192')
+REVIEW_CONCURRENCY = int(os.environ.get('SUBJECTIVE_GRADING_CONCURRENCY', 4))
+REVIEW_DEADLINE = float(os.environ.get('SUBJECTIVE_GRADING_DEADLINE', 25))
+REVIEW_MAX_TOKENS = int(os.environ.get('SUBJECTIVE_GRADING_MAX_TOKENS', 700))
+# Compact responses drop suggestions and covered points, so the LLM writes less
+REVIEW_COMPACT_MAX_TOKENS = int(os.environ.get('SUBJECTIVE_GRADING_COMPACT_MAX_TOKENS', 250))
+
+_review_pool = ThreadPoolExecutor(max_workers=REVIEW_CONCURRENCY, thread_name_prefix='subjective-review')
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being
+below between both but by can could did do does doing down during each few for from further had has
+have having he her here hers him his how i if in into is it its itself just me more most my no nor
+not of off on once only or other our out over own same she should so some such than that the their
+them then there these they this those through to too under until up very was we were what when where
+which while who whom why will with would you your yours e g eg ie etc many much like use uses used
+using across new way ways thing things also
+""".split())
+_SUFFIXES = ('ations', 'ation', 'ments', 'ment', 'nesses', 'ness', 'ings', 'ing', 'ies', 'ied', 'ed', 'es', 'ly', 's')
+
+
+def _stem(word):
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)]
+            if suffix in ('ies', 'ied'):
+                return word + 'y'
+            break
+    # 'validate' and 'validates' should meet at 'validat'
+    return word[:-1] if word.endswith('e') and len(word) > 4 else word
+
+
+def tokenize(text):
+    """Lowercased, stopword-free, lightly stemmed content tokens"""
+    return [_stem(word) for word in _WORD.findall(str(text).lower()) if word not in _STOPWORDS]
+
+
+def _idf(documents):
+    """Smoothed BM25-style inverse document frequency over token sets"""
+    n = len(documents)
+    df = Counter(token for doc in documents for token in set(doc))
+    return lambda token: math.log(1 + (n - df.get(token, 0) + 0.5) / (df.get(token, 0) + 0.5))
+
+
+def _cosine(tokens_a, tokens_b, idf):
+    a = Counter(tokens_a)
+    b = Counter(tokens_b)
+    dot = sum(count * b[token] * idf(token) ** 2 for token, count in a.items() if token in b)
+    norm_a = math.sqrt(sum((count * idf(token)) ** 2 for token, count in a.items()))
+    norm_b = math.sqrt(sum((count * idf(token)) ** 2 for token, count in b.items()))
+    return dot / (norm_a * norm_b) if norm_a and norm_b else 0.0
+
+
+def score_answer(question, answer):
+    """
+    Provisional 0-10 score for one answer.
+
+    Returns a dict with the score, covered and missing key points, model
+    answer similarity and whether the answer should go to the LLM.
+    """
+    key_points = [str(point) for point in question.get('key_points') or []]
+    model_answer = question.get('model_answer') or ''
+    answer = (answer or '').strip()
+    answer_tokens = tokenize(answer)
+    answer_terms = set(answer_tokens)
+    word_count = len(answer.split())
+
+    key_point_tokens = [tokenize(point) for point in key_points]
+    model_tokens = tokenize(model_answer)
+    idf = _idf(key_point_tokens + [model_tokens])
+
+    covered, missing, coverages = [], [], []
+    for point, tokens in zip(key_points, key_point_tokens):
+        total = sum(idf(token) for token in set(tokens))
+        hit = sum(idf(token) for token in set(tokens) if token in answer_terms)
+        coverage = hit / total if total else 0.0
+        coverages.append(coverage)
+        (covered if coverage >= KEY_POINT_COVERED else missing).append(point)
+
+    similarity = _cosine(answer_tokens, model_tokens, idf) if model_tokens else 0.0
+    coverage = sum(coverages) / len(coverages) if coverages else similarity
+
+    if len(answer_tokens) < MIN_CONTENT_TOKENS:
+        score = 0 if not answer_tokens else 1
+    else:
+        raw = 0.75 * coverage + 0.25 * min(1.0, similarity * 2)
+        score = max(0, min(MAX_SCORE, round(raw * MAX_SCORE)))
+
+    gradable = bool(key_points or model_tokens)
+    needs_review = (
+        not gradable
+        or word_count > LONG_ANSWER_WORDS
+        or (ESCALATE_MIN <= score <= ESCALATE_MAX and len(answer_tokens) >= MIN_CONTENT_TOKENS)
+    )
+
+    return {
+        'score': score,
+        'coverage': round(coverage, 3),
+        'similarity': round(similarity, 3),
+        'key_points_covered': covered,
+        'missing_points': missing,
+        'word_count': word_count,
+        'needs_review': needs_review
+    }
+
+
+def _local_feedback(result, total_points):
+    if result['word_count'] == 0:
+        return "No answer was provided for this question."
+    if not total_points:
+        return "Your answer was compared against the model answer for this question."
+    feedback = f"Your answer covers {len(result['key_points_covered'])} of {total_points} key points."
+    if result['missing_points']:
+        feedback += " To strengthen it, also address: " + "; ".join(result['missing_points']) + "."
+    else:
+        feedback += " Good coverage of the expected concepts."
+    return feedback
+
+
+def pre_grade_answers(questions, user_answers):
+    """Locally graded question_feedback entries, in the LLM response shape"""
+    question_feedback = []
+    for i, question in enumerate(questions):
+        question_id = question.get('id', i + 1)
+        answer = user_answers.get(str(question_id), user_answers.get(str(i + 1), ''))
+        result = score_answer(question, answer)
+        question_feedback.append({
+            "question_id": question_id,
+            "question_text": question.get('question', f'Question {question_id}'),
+            "user_answer": answer,
+            "score": result['score'],
+            "max_score": MAX_SCORE,
+            "feedback": _local_feedback(result, len(question.get('key_points') or [])),
+            "model_answer": question.get('model_answer', ''),
+            "suggestions": [f"Explain: {point}" for point in result['missing_points']],
+            "key_points_covered": result['key_points_covered'],
+            "missing_points": result['missing_points'],
+            "graded_by": "local",
+            "needs_review": result['needs_review']
+        })
+    return question_feedback
+
+
+def build_subjective_assessment(question_feedback, topic):
+    """Aggregate per-question feedback into a full subjective assessment"""
+    total_score = sum(item.get('score', 0) for item in question_feedback)
+    max_total = sum(item.get('max_score', MAX_SCORE) for item in question_feedback)
+    percentage = (total_score / max_total * 100) if max_total else 0
+    answered_well = sum(1 for item in question_feedback if item.get('score', 0) >= MAX_SCORE * 0.6)
+
+    result = {
+        "score": round(percentage),
+        "total_questions": len(question_feedback),
+        "percentage": round(percentage, 1),
+        "grade": calculate_grade(percentage),
+        "assessment": generate_assessment_feedback(percentage, answered_well, len(question_feedback), topic),
+        "question_feedback": question_feedback,
+        "study_recommendations": generate_study_recommendations(topic, percentage),
+        "resources": generate_study_resources(topic)
+    }
+
+    # Answers whose AI review timed out or failed keep provisional local grades
+    provisional = [item['question_id'] for item in question_feedback if item.get('review_status')]
+    if provisional:
+        result['partial'] = True
+        result['provisional_questions'] = provisional
+    return result
+
+
+def merge_ai_feedback(local_item, ai_item):
+    """Overlay an AI-graded feedback entry on the local provisional one"""
+    merged = {**local_item, **ai_item, 'graded_by': 'ai', 'needs_review': False}
+    try:
+        merged['score'] = max(0.0, min(float(merged['score']), float(local_item['max_score'])))
+    except (TypeError, ValueError):
+        merged['score'] = local_item['score']
+    merged['max_score'] = local_item['max_score']
+    return merged
+
+
+def review_answer_with_llm(question, item, topic, academic_level, compact=False):
+    """Grade one escalated answer with a small, self-contained LLM call"""
+    if compact:
+        response_format = '{"score": 7, "feedback": "One or two sentences on what to improve", "missing_points": ["..."]}'
+    else:
+        response_format = '{"score": 7, "feedback": "What was good and what could be improved", "suggestions": ["..."], "key_points_covered": ["..."], "missing_points": ["..."]}'
+    prompt = f"""You are an expert educator grading one subjective answer on {topic} for a {academic_level} level student.
+
+QUESTION: {item['question_text']}
+KEY POINTS: {json.dumps(question.get('key_points') or [])}
+MODEL ANSWER: {question.get('model_answer', '')}
+STUDENT ANSWER: {item['user_answer']}
+
+Grade the student answer out of {MAX_SCORE}. Respond with ONLY valid JSON in this exact format:
+{response_format}"""
+
+    payload = {
+        'model': REVIEW_MODEL,
+        'messages': [
+            {'role': 'system', 'content': 'You are an expert educator providing detailed quiz assessments. Always respond with valid JSON only.'},
+            {'role': 'user', 'content': prompt}
+        ],
+        'max_tokens': REVIEW_COMPACT_MAX_TOKENS if compact else REVIEW_MAX_TOKENS,
+        'temperature': 0.3
+    }
+
+    response = post_chat_completion(payload, timeout=(5, REVIEW_DEADLINE))
+    if response.status_code != 200:
+        raise ValueError(f"Groq API error: {response.status_code}")
+    content = completion_content(response.json())
+    if not content:
+        raise ValueError("No response from AI model")
+    return extract_json(content)
+
+
+def review_escalated_answers(questions, question_feedback, topic, academic_level, deadline=None, compact=False):
+    """
+    Fan the escalated answers out as concurrent per-question LLM calls and
+    merge the grades that arrive before the deadline. Answers whose review
+    fails or times out keep their local provisional grade.
+    """
+    deadline = REVIEW_DEADLINE if deadline is None else deadline
+    futures = {}
+    for position, (question, item) in enumerate(zip(questions, question_feedback)):
+        if item['needs_review']:
+            futures[_review_pool.submit(copy_context().run, review_answer_with_llm, question, item, topic, academic_level, compact)] = position
+
+    if not futures:
+        return question_feedback
+
+    done, pending = wait(futures, timeout=deadline)
+    for future in pending:
+        future.cancel()
+
+    merged = list(question_feedback)
+    for future, position in futures.items():
+        item = merged[position]
+        if future in pending:
+            merged[position] = {**item, 'needs_review': False, 'review_status': 'timeout'}
+            continue
+        try:
+            merged[position] = merge_ai_feedback(item, future.result())
+        except Exception as e:
+            print(f"⚠️ AI review failed for question {item['question_id']}: {e}")
+            merged[position] = {**item, 'needs_review': False, 'review_status': 'failed'}
+
+    reviewed = sum(1 for item in merged if item.get('graded_by') == 'ai')
+    print(f"🤖 AI reviewed {reviewed}/{len(futures)} escalated answers ({len(pending)} timed out)")
+    return merged
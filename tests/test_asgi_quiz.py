@@ -0,0 +1,48 @@
+"""
+Async generate-quiz path: the same upstream-health and generate-quiz gate
+checks as the sync route
+"""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip('asgiref')
+pytest.importorskip('httpx')
+
+import asgi
+from admission_control import AdmissionGate
+
+REQUEST = {'subject': 'Physics', 'topic': 'Units', 'numQuestions': 3, 'quizType': 'mcq'}
+
+
+@pytest.fixture
+def async_app(monkeypatch):
+    monkeypatch.setattr(asgi.tutor, 'warm_pool_quiz_response', lambda data: None)
+    monkeypatch.setattr(asgi, 'take_upgrade', lambda data: None)
+    monkeypatch.setattr(asgi, 'quiz_deadline', lambda data: None)
+    return asgi.AsyncTutorApp(asgi.tutor.create_app(start_background=False))
+
+
+def generate(async_app):
+    return asyncio.run(async_app.generate_quiz(dict(REQUEST)))
+
+
+def test_upstream_down_serves_local_quiz(async_app, monkeypatch):
+    monkeypatch.setattr(asgi.upstream_health, 'available', lambda: False)
+    monkeypatch.setattr(async_app, 'run_steps', lambda steps: pytest.fail('called the upstream while it was down'))
+    result, status = generate(async_app)
+    assert status == 200
+    assert result['degraded'] == 'upstream_down'
+
+
+def test_full_generate_quiz_gate_serves_local_quiz(async_app, monkeypatch):
+    gate = AdmissionGate('generate-quiz', 1, 1, 1)
+    gate._active = 1
+    monkeypatch.setitem(asgi.gates, 'generate-quiz', gate)
+    monkeypatch.setattr(asgi.upstream_health, 'available', lambda: True)
+    monkeypatch.setattr(async_app, 'run_steps', lambda steps: pytest.fail('called the upstream without a gate slot'))
+    result, status = generate(async_app)
+    assert status == 200
+    assert result['degraded'] == 'overloaded'
+    assert gate.metrics()['rejected'] == 1
@@ -0,0 +1,48 @@
+"""
+/api/assess-quiz when the client has to re-post a quiz whose server-side
+session expired
+"""
+
+import pytest
+
+import app as tutor
+from quiz_store import strip_answer_keys
+
+QUIZ = {
+    'questions': [
+        {'id': 1, 'question': 'What is the SI unit of force?',
+         'options': {'A': 'Joule', 'B': 'Newton', 'C': 'Watt', 'D': 'Pascal'}, 'correct_answer': 'B'},
+        {'id': 2, 'question': 'What is the SI unit of power?',
+         'options': {'A': 'Joule', 'B': 'Newton', 'C': 'Watt', 'D': 'Pascal'}, 'correct_answer': 'C'}
+    ]
+}
+ANSWERS = {'1': 'B', '2': 'C'}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr('rate_limit.RATE_LIMIT_ENABLED', False)
+    return tutor.create_app(start_background=False).test_client()
+
+
+def test_expired_session_then_posted_quiz_without_keys_is_410(client):
+    response = client.post('/api/assess-quiz', json={'quizId': 'expired-session', 'answers': ANSWERS})
+    assert response.status_code == 404
+
+    # The frontend's retry re-posts the quiz it holds, which has no keys when they are hidden
+    response = client.post('/api/assess-quiz', json={'quiz': strip_answer_keys(QUIZ), 'answers': ANSWERS, 'quizType': 'mcq'})
+    assert response.status_code == 410
+    assert response.get_json()['code'] == 'quiz_expired'
+
+
+def test_posted_quiz_with_keys_is_graded(client):
+    response = client.post('/api/assess-quiz', json={'quiz': QUIZ, 'answers': ANSWERS, 'quizType': 'mcq'})
+    assert response.status_code == 200
+    assert response.get_json()['correct_answers'] == 2
+
+
+def test_batch_with_posted_quiz_without_keys_is_410(client):
+    response = client.post('/api/assess-quiz/batch', json={
+        'quiz': strip_answer_keys(QUIZ), 'quizType': 'mcq', 'students': [{'studentId': 's1', 'answers': ANSWERS}]
+    })
+    assert response.status_code == 410
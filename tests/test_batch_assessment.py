@@ -0,0 +1,74 @@
+"""
+Subjective class assessment: AI review goes through the assess-review gate
+per student, and one student's failure does not end the stream
+"""
+
+from contextlib import contextmanager
+
+import pytest
+
+import batch_assessment
+from admission_control import OverloadedError
+
+# No key points or model answer, so every answer is escalated for AI review
+QUESTIONS = [{'id': 1, 'question': 'Explain why the sky is blue.'}]
+STUDENTS = [
+    {'studentId': 'ada', 'answers': {'1': 'Shorter wavelengths scatter more in the atmosphere.'}},
+    {'studentId': 'bob', 'answers': {'1': 'Because sunlight is scattered by air molecules.'}}
+]
+
+
+def reviewed(questions, feedback, topic, academic_level):
+    return [{**item, 'score': 4, 'graded_by': 'ai', 'needs_review': False} for item in feedback]
+
+
+def assess(use_llm=True):
+    return list(batch_assessment.assess_subjective_class(QUESTIONS, STUDENTS, 'Optics', 'high school', use_llm))
+
+
+def test_failed_student_gets_error_record_and_stream_continues(monkeypatch):
+    def review(questions, feedback, topic, academic_level):
+        if feedback[0]['user_answer'].startswith('Shorter'):
+            raise RuntimeError('upstream exploded')
+        return reviewed(questions, feedback, topic, academic_level)
+
+    monkeypatch.setattr(batch_assessment, 'review_escalated_answers', review)
+    records = assess()
+
+    errors = [record for record in records if record['type'] == 'error']
+    students = [record for record in records if record['type'] == 'student']
+    assert [record['student_id'] for record in errors] == ['ada']
+    assert [record['student_id'] for record in students] == ['bob']
+    assert records[-1]['type'] == 'summary'
+    assert records[-1]['students'] == 1
+
+
+def test_review_runs_inside_assess_review_gate(monkeypatch):
+    admitted = []
+
+    class Gate:
+        @contextmanager
+        def admit(self):
+            admitted.append(True)
+            yield
+
+    monkeypatch.setitem(batch_assessment.gates, 'assess-review', Gate())
+    monkeypatch.setattr(batch_assessment, 'review_escalated_answers', reviewed)
+    records = assess()
+    assert len(admitted) == len(STUDENTS)
+    assert all(record['question_results'][0]['graded_by'] == 'ai' for record in records if record['type'] == 'student')
+
+
+def test_saturated_gate_keeps_provisional_grades(monkeypatch):
+    class Gate:
+        @contextmanager
+        def admit(self):
+            raise OverloadedError('assess-review', 1)
+            yield
+
+    monkeypatch.setitem(batch_assessment.gates, 'assess-review', Gate())
+    monkeypatch.setattr(batch_assessment, 'review_escalated_answers', lambda *args: pytest.fail('reviewed without a gate slot'))
+    records = assess()
+    students = [record for record in records if record['type'] == 'student']
+    assert len(students) == len(STUDENTS)
+    assert all(record['question_results'][0]['review_status'] == 'overloaded' for record in students)
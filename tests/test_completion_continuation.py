@@ -0,0 +1,80 @@
+"""
+Recovery of JSON arrays cut off at max_tokens: salvaging complete objects
+and sizing each continuation from the reply before it
+"""
+
+import json
+
+from completion_continuation import continue_truncated_array, salvage_array
+
+
+class Reply:
+    def __init__(self, body, status_code=200):
+        self.body = body
+        self.status_code = status_code
+
+    def json(self):
+        return self.body
+
+
+def completion(content, tokens, finish_reason='length'):
+    return {
+        'choices': [{'message': {'content': content}, 'finish_reason': finish_reason}],
+        'usage': {'completion_tokens': tokens}
+    }
+
+
+def questions_json(numbers, cut=''):
+    items = ', '.join(json.dumps({'id': n, 'question': f'Question {n}?'}) for n in numbers)
+    return '{"questions": [' + items + (', ' + cut if cut else '')
+
+
+def continuation_payload(kept, remaining):
+    return {'messages': [{'role': 'user', 'content': f'{remaining} more after {len(kept)}'}]}
+
+
+def run(steps, replies):
+    """Drive the completion steps, returning (result, requests sent)"""
+    requests = []
+    try:
+        request, _ = next(steps)
+        for reply in replies:
+            requests.append(request)
+            request, _ = steps.send(reply)
+    except StopIteration as stop:
+        return stop.value, requests
+    raise AssertionError('steps wanted more replies than were given')
+
+
+def test_salvage_drops_item_cut_mid_string():
+    content = questions_json([1, 2], cut='{"id": 3, "question": "Which planet is clo')
+    assert [item['id'] for item in salvage_array(content, 'questions')] == [1, 2]
+
+
+def test_salvage_ignores_missing_array():
+    assert salvage_array('{"quiz": "cut off', 'questions') == []
+
+
+def test_multi_round_continuation_sizes_each_round_from_the_last_reply():
+    first = completion(questions_json([1, 2], cut='{"id": 3, "question": "Quest'), 300)
+    replies = [
+        Reply(completion(questions_json([3], cut='{"id": 4'), 200)),
+        Reply(completion(questions_json([4, 5, 6]) + ']}', 240, finish_reason='stop'))
+    ]
+    steps = continue_truncated_array({'max_tokens': 4000}, first, 'questions', 6, continuation_payload, 30)
+    items, requests = run(steps, replies)
+
+    assert [item['id'] for item in items] == [1, 2, 3, 4, 5, 6]
+    # Round 1: 300 tokens bought 2 items, 4 missing; round 2: 200 tokens bought 1 item, 3 missing
+    assert [request['max_tokens'] for request in requests] == [
+        int(300 / 2 * 4 * 1.25) + 100,
+        int(200 / 1 * 3 * 1.25) + 100
+    ]
+
+
+def test_failed_continuation_keeps_salvaged_items():
+    first = completion(questions_json([1, 2], cut='{"id": 3, "quest'), 300)
+    steps = continue_truncated_array({'max_tokens': 4000}, first, 'questions', 5, continuation_payload, 30)
+    items, requests = run(steps, [Reply({}, status_code=503)])
+    assert [item['id'] for item in items] == [1, 2]
+    assert len(requests) == 1
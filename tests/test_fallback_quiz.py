@@ -0,0 +1,25 @@
+"""
+Fallback quiz generation: the local quiz served when the AI is unavailable
+"""
+
+from fallback_quiz_enhanced import generate_enhanced_fallback_quiz
+from question_dedup import dedupe_questions
+
+
+def test_unknown_subject_returns_requested_count():
+    quiz = generate_enhanced_fallback_quiz('Underwater Basket Weaving', 'Knots', 'mcq', 10, 'medium', 'Secondary')
+    assert len(quiz['questions']) == 10
+    assert [question['id'] for question in quiz['questions']] == list(range(1, 11))
+
+
+def test_unknown_subject_questions_are_distinct():
+    quiz = generate_enhanced_fallback_quiz('Underwater Basket Weaving', 'Knots', 'mcq', 50, 'hard', 'College')
+    unique, duplicates = dedupe_questions(quiz['questions'])
+    assert len(quiz['questions']) == 50
+    assert duplicates == []
+
+
+def test_known_topic_is_topped_up_to_requested_count():
+    quiz = generate_enhanced_fallback_quiz('Physics', 'Mechanics', 'mcq', 10, 'easy', 'Secondary')
+    assert len(quiz['questions']) == 10
+    assert any(question['question'] == 'What is the SI unit of force?' for question in quiz['questions'])
@@ -0,0 +1,56 @@
+"""
+Shared MCQ feedback: keyed on option text so reordered variants share an
+entry, and only AI-written explanations are cached
+"""
+
+import pytest
+
+import feedback_cache
+from feedback_cache import feedback_key
+from mcq_grading import grade_mcq_questions, remember_item_feedback
+from ttl_store import TTLStore
+
+CANONICAL = {
+    'id': 1, 'question': 'What is the SI unit of power?',
+    'options': {'A': 'Joule', 'B': 'Newton', 'C': 'Watt', 'D': 'Pascal'}, 'correct_answer': 'C'
+}
+# The same question as a shuffled variant shows it
+REORDERED = {
+    'id': 1, 'question': 'What is the SI unit of power?',
+    'options': {'A': 'Watt', 'B': 'Pascal', 'C': 'Joule', 'D': 'Newton'}, 'correct_answer': 'A'
+}
+
+
+@pytest.fixture(autouse=True)
+def store(monkeypatch):
+    store = TTLStore(maxsize=100, ttl=3600)
+    monkeypatch.setattr(feedback_cache, 'feedback_store', store)
+    monkeypatch.setattr(feedback_cache, 'FEEDBACK_CACHE_ENABLED', True)
+    return store
+
+
+def test_reordered_options_share_a_key():
+    # Joule is A in the canonical quiz and C in the variant
+    assert feedback_key(CANONICAL, 'C', 'A') == feedback_key(REORDERED, 'A', 'C')
+    assert feedback_key(CANONICAL, 'C', 'A') != feedback_key(CANONICAL, 'C', 'B')
+
+
+def test_local_explanations_are_not_cached(store):
+    [item] = grade_mcq_questions([CANONICAL], {'1': 'A'})
+    assert item['feedback_source'] == 'local'
+    assert len(store) == 0
+
+
+def test_ai_feedback_is_reused_by_a_reordered_variant(store):
+    [item] = grade_mcq_questions([CANONICAL], {'1': 'A'})
+    remember_item_feedback(item, {'explanation': 'Power is energy per unit time, measured in watts.',
+                                  'why_wrong': 'The joule measures energy, not power.'})
+    assert len(store) == 1
+
+    [variant_item] = grade_mcq_questions([REORDERED], {'1': 'C'})
+    assert variant_item['feedback_source'] == 'ai'
+    assert variant_item['why_wrong'] == 'The joule measures energy, not power.'
+
+    # A different wrong option has no AI feedback yet
+    [other_item] = grade_mcq_questions([REORDERED], {'1': 'D'})
+    assert other_item['feedback_source'] == 'local'
@@ -0,0 +1,49 @@
+"""
+Job outcomes: handlers report failures as an error status, the way routes do
+"""
+
+import pytest
+
+from job_queue import JobQueue
+
+
+@pytest.fixture
+def queue():
+    return JobQueue(workers=1)
+
+
+def finish(queue, fn, *args):
+    job = queue.submit('generate-quiz', fn, *args)
+    job.future.result(timeout=5)
+    return queue.get(job.id).to_dict()
+
+
+@pytest.mark.parametrize('status_code', [400, 429, 500, 503])
+def test_error_status_marks_job_failed(queue, status_code):
+    job = finish(queue, lambda: ({'error': 'Groq API error'}, status_code))
+    assert job['status'] == 'failed'
+    assert job['error'] == 'Groq API error'
+    assert job['status_code'] == status_code
+    assert job['result'] == {'error': 'Groq API error'}
+
+
+def test_error_status_without_message_still_fails(queue):
+    job = finish(queue, lambda: (None, 502))
+    assert job['status'] == 'failed'
+    assert job['error'] == 'Handler returned HTTP 502'
+
+
+def test_success_status_marks_job_succeeded(queue):
+    job = finish(queue, lambda topic: ({'topic': topic}, 200), 'Optics')
+    assert job['status'] == 'succeeded'
+    assert 'error' not in job
+    assert job['result'] == {'topic': 'Optics'}
+
+
+def test_raising_handler_marks_job_failed(queue):
+    def handler():
+        raise RuntimeError('boom')
+    job = finish(queue, handler)
+    assert job['status'] == 'failed'
+    assert job['error'] == 'boom'
+    assert queue.metrics()['completed']['failed'] == 1
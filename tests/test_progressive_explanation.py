@@ -0,0 +1,52 @@
+"""
+Progressive explanation outlines: a template outline from a failed call is
+cached under its own id and never replaces the request's model outline
+"""
+
+import pytest
+
+import progressive_explanation
+from progressive_explanation import build_outline, cached_outline, get_outline, outline_id, remember_outline
+from ttl_store import TTLStore
+
+REQUEST = {'subject': 'Physics', 'topic': 'Refraction', 'academicLevel': 'Secondary', 'context': ''}
+PLAN = {
+    'summary': 'How light bends between media.',
+    'sections': [
+        {'title': 'Definition', 'summary': 'What refraction is.'},
+        {'title': "Snell's law", 'summary': 'Relating the angles.'},
+        {'title': 'Key takeaways', 'summary': 'What to remember.'}
+    ]
+}
+
+
+@pytest.fixture(autouse=True)
+def outlines(monkeypatch):
+    store = TTLStore(maxsize=100, ttl=3600)
+    monkeypatch.setattr(progressive_explanation, 'outlines', store)
+    return store
+
+
+def test_template_outline_does_not_overwrite_model_outline():
+    model = build_outline(REQUEST, PLAN)
+    remember_outline(REQUEST, model)
+
+    # A later identical request whose outline call failed
+    template = build_outline(REQUEST, None)
+    remember_outline(REQUEST, template)
+
+    assert model['explanation_id'] == outline_id(REQUEST)
+    assert template['explanation_id'] != model['explanation_id']
+    assert cached_outline(REQUEST)['outline'] == model
+    assert get_outline(template['explanation_id'])['outline']['source'] == 'template'
+
+
+def test_template_outline_is_not_served_as_the_cached_outline():
+    template = build_outline(REQUEST, {'sections': [{'title': 'Only one'}]})
+    remember_outline(REQUEST, template)
+
+    assert template['source'] == 'template'
+    assert cached_outline(REQUEST) is None
+    # Its section links still resolve
+    assert get_outline(template['explanation_id'])['outline'] == template
+    assert template['sections'][0]['url'].startswith(f"/api/explain-topic/{template['explanation_id']}/")
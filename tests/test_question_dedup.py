@@ -0,0 +1,44 @@
+"""
+Near-duplicate question detection: distinct stems that share an option set
+must survive, rephrasings of the same stem must not
+"""
+
+from question_dedup import dedupe_questions
+
+UNITS = {'A': 'Joule', 'B': 'Newton', 'C': 'Watt', 'D': 'Pascal'}
+COLORS = {'A': 'Red', 'B': 'Green', 'C': 'Blue', 'D': 'Yellow'}
+
+
+def question(stem, options):
+    return {'question': stem, 'options': dict(options), 'correct_answer': 'A'}
+
+
+def test_different_stems_with_shared_options_are_kept():
+    questions = [
+        question('What is the SI unit of energy?', UNITS),
+        question('What is the SI unit of power?', UNITS)
+    ]
+    unique, duplicates = dedupe_questions(questions)
+    assert len(unique) == 2
+    assert duplicates == []
+
+
+def test_negated_stem_with_shared_options_is_kept():
+    questions = [
+        question('Which of these is NOT a primary color?', COLORS),
+        question('Which of these is a primary color?', COLORS)
+    ]
+    unique, duplicates = dedupe_questions(questions)
+    assert len(unique) == 2
+    assert duplicates == []
+
+
+def test_restated_stem_is_dropped():
+    questions = [
+        question('What is the SI unit of energy?', UNITS),
+        question('What is the SI unit of energy?', {'A': 'Joule', 'B': 'Calorie', 'C': 'Erg', 'D': 'Watt'}),
+        question('What is the S.I. unit of energy?!', UNITS)
+    ]
+    unique, duplicates = dedupe_questions(questions)
+    assert len(unique) == 1
+    assert [position for position, _ in duplicates] == [1, 2]
@@ -0,0 +1,68 @@
+"""
+/api/quiz/<quiz_id>/variants request bounds: oversized or malformed requests
+are rejected before any seeds are built
+"""
+
+import pytest
+
+import app as tutor
+from quiz_store import save_quiz_session
+from quiz_variants import MAX_VARIANTS
+
+QUIZ = {
+    'questions': [
+        {'id': 1, 'question': 'What is the SI unit of force?',
+         'options': {'A': 'Joule', 'B': 'Newton', 'C': 'Watt', 'D': 'Pascal'}, 'correct_answer': 'B'},
+        {'id': 2, 'question': 'What is the SI unit of power?',
+         'options': {'A': 'Joule', 'B': 'Newton', 'C': 'Watt', 'D': 'Pascal'}, 'correct_answer': 'C'}
+    ]
+}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr('rate_limit.RATE_LIMIT_ENABLED', False)
+    return tutor.create_app(start_background=False).test_client()
+
+
+@pytest.fixture
+def quiz_id():
+    return save_quiz_session(QUIZ, 'mcq', 'Physics', 'Units', 'high school')
+
+
+def post_variants(client, quiz_id, body):
+    return client.post(f'/api/quiz/{quiz_id}/variants', json=body)
+
+
+def test_count_within_limit_builds_variants(client, quiz_id):
+    response = post_variants(client, quiz_id, {'count': 3})
+    assert response.status_code == 200
+    assert len(response.get_json()['variants']) == 3
+
+
+def test_huge_count_is_rejected(client, quiz_id, monkeypatch):
+    monkeypatch.setattr(tutor, 'random_variant_seed', lambda: pytest.fail('seeds built for a rejected count'))
+    response = post_variants(client, quiz_id, {'count': 10 ** 9})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('count', ['many', [3], {'n': 3}, 0, -1])
+def test_invalid_count_is_rejected(client, quiz_id, count):
+    response = post_variants(client, quiz_id, {'count': count})
+    assert response.status_code == 400
+
+
+def test_too_many_seeds_are_rejected(client, quiz_id):
+    response = post_variants(client, quiz_id, {'seeds': list(range(MAX_VARIANTS + 1))})
+    assert response.status_code == 400
+
+
+def test_too_many_students_are_rejected(client, quiz_id, monkeypatch):
+    monkeypatch.setattr(tutor, 'variant_seed', lambda *args: pytest.fail('seeds built for a rejected roster'))
+    response = post_variants(client, quiz_id, {'students': [f's{i}' for i in range(MAX_VARIANTS + 1)]})
+    assert response.status_code == 400
+
+
+def test_non_list_students_are_rejected(client, quiz_id):
+    response = post_variants(client, quiz_id, {'students': 'alice'})
+    assert response.status_code == 400
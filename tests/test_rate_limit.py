@@ -0,0 +1,122 @@
+"""
+Per-client token buckets on the in-memory backend: burst, refill, 429
+headers, and which client key a request is charged to
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+import app as tutor
+import rate_limit
+from rate_limit import Bucket, RateLimiter, client_id, endpoint_limits
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit, 'time', SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    limiter = RateLimiter(redis_url=None)
+    monkeypatch.setattr(rate_limit, 'rate_limiter', limiter)
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_ENABLED', True)
+    return limiter
+
+
+def take(limiter, client='ip-1.2.3.4'):
+    # 3 burst, 60 per minute: one token a second
+    return limiter.take([Bucket(client, 'chat', 3, 60)])
+
+
+def test_burst_then_denied(limiter, clock):
+    decisions = [take(limiter) for _ in range(4)]
+    assert [decision['allowed'] for decision in decisions] == [True, True, True, False]
+    assert [decision['remaining'] for decision in decisions[:3]] == [2, 1, 0]
+    assert decisions[3]['retry_after'] == 1
+    assert limiter.metrics() == {'enabled': True, 'backend': 'memory', 'allowed': 3, 'limited': 1}
+
+
+def test_refill_is_proportional_and_capped(limiter, clock):
+    for _ in range(3):
+        take(limiter)
+    clock.now += 2
+    assert [take(limiter)['allowed'] for _ in range(3)] == [True, True, False]
+
+    clock.now += 3600
+    assert take(limiter)['remaining'] == 2
+
+
+def test_clients_have_separate_buckets(limiter, clock):
+    for _ in range(3):
+        take(limiter, 'ip-1.2.3.4')
+    assert not take(limiter, 'ip-1.2.3.4')['allowed']
+    assert take(limiter, 'ip-5.6.7.8')['allowed']
+
+
+def test_denied_request_draws_from_no_bucket(limiter, clock):
+    client = 'ip-1.2.3.4'
+    limiter.take([Bucket(client, 'llm-tokens', 100, 60, 100)])
+    decision = limiter.take([Bucket(client, 'chat', 3, 60), Bucket(client, 'llm-tokens', 100, 60, 50)])
+    assert not decision['allowed']
+    assert decision['bucket'] == 'llm-tokens'
+    assert take(limiter, client)['remaining'] == 2
+
+
+def test_limited_route_returns_429_with_retry_after(limiter, monkeypatch):
+    monkeypatch.setattr(tutor, 'GROQ_API_KEY', None)
+    client = tutor.create_app(start_background=False).test_client()
+    per_minute, burst = endpoint_limits('test-connection')
+
+    for remaining in reversed(range(burst)):
+        response = client.get('/api/test-connection')
+        assert response.status_code != 429
+        assert response.headers['RateLimit-Limit'] == str(burst)
+        assert response.headers['RateLimit-Remaining'] == str(remaining)
+        assert 'Retry-After' not in response.headers
+
+    response = client.get('/api/test-connection')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert int(response.headers['Retry-After']) <= 60 / per_minute + 1
+    body = response.get_json()
+    assert body['code'] == 'rate_limited'
+    assert body['retry_after'] == int(response.headers['Retry-After'])
+
+
+def test_forwarded_for_is_ignored_without_trusted_proxies(monkeypatch):
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_PROXY_HOPS', 0)
+    assert client_id({'X-Forwarded-For': '6.6.6.6'}, '10.0.0.1') == 'ip-10.0.0.1'
+
+
+def test_trusted_proxy_hops_pick_the_entry_they_appended(monkeypatch):
+    # The client spoofs the leftmost entry; our one proxy appended the real address
+    headers = {'X-Forwarded-For': '6.6.6.6, 203.0.113.7'}
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_PROXY_HOPS', 1)
+    assert client_id(headers, '10.0.0.1') == 'ip-203.0.113.7'
+
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_PROXY_HOPS', 2)
+    assert client_id({'X-Forwarded-For': '6.6.6.6, 203.0.113.7, 10.0.0.2'}, '10.0.0.1') == 'ip-203.0.113.7'
+
+    # Fewer entries than trusted hops: the request did not come through our proxies
+    assert client_id({'X-Forwarded-For': '6.6.6.6'}, '10.0.0.1') == 'ip-10.0.0.1'
+
+
+def test_only_allow_listed_tokens_identify_a_client(monkeypatch):
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_PROXY_HOPS', 0)
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_API_KEYS', frozenset({'school-key'}))
+    keyed = client_id({'Authorization': 'Bearer school-key'}, '10.0.0.1')
+    assert keyed.startswith('token-') and 'school-key' not in keyed
+    assert client_id({'X-API-Key': 'school-key'}, '10.0.0.2') == keyed
+    assert client_id({'X-API-Key': 'made-up'}, '10.0.0.1') == 'ip-10.0.0.1'
@@ -0,0 +1,12 @@
+"""
+Startup-cost regression budget: a cold `import app` and one worker's app
+instance, measured in a fresh interpreter
+"""
+
+from verify_deployment import IMPORT_BUDGET_MS, WORKER_RSS_BUDGET_MB, measure_startup_cost
+
+
+def test_cold_start_stays_within_budget():
+    cost = measure_startup_cost()
+    assert cost['import_ms'] <= IMPORT_BUDGET_MS, f"cold import took {cost['import_ms']:.0f} ms"
+    assert cost['rss_mb'] <= WORKER_RSS_BUDGET_MB, f"worker RSS is {cost['rss_mb']:.1f} MB"
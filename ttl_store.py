@@ -0,0 +1,64 @@
+"""
+Thread-safe in-memory LRU store with per-entry expiry
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLStore:
+    """Bounded LRU mapping whose entries expire ttl seconds after being written"""
+
+    def __init__(self, maxsize=1000, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            self._purge_expired(time.monotonic())
+            return len(self._data)
+
+    def _purge_expired(self, now):
+        expired = [key for key, (expires_at, _) in self._data.items() if expires_at <= now]
+        for key in expired:
+            del self._data[key]
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def update(self, key, fn):
+        """Atomically replace a live entry with fn(value), keeping its expiry"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            value = fn(entry[1])
+            self._data[key] = (entry[0], value)
+            return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None or entry[0] <= time.monotonic():
+                return default
+            return entry[1]
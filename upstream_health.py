@@ -0,0 +1,155 @@
+"""
+Background Groq health prober: measures upstream reachability and latency
+with a zero-token request on a timer, caches the result for health checks,
+and lets calls fail fast to their local fallbacks while the upstream is down
+"""
+
+import os
+import threading
+import time
+
+import requests
+
+PROBE_ENABLED = os.environ.get('GROQ_PROBE_ENABLED', 'true').lower() == 'true'
+PROBE_INTERVAL = float(os.environ.get('GROQ_PROBE_INTERVAL', 30))
+# Probe more often while the upstream is down, so recovery is noticed quickly
+PROBE_DOWN_INTERVAL = float(os.environ.get('GROQ_PROBE_DOWN_INTERVAL', 5))
+PROBE_TIMEOUT = float(os.environ.get('GROQ_PROBE_TIMEOUT', 5))
+# Consecutive failed probes before calls stop going upstream
+PROBE_FAILURES_TO_DOWN = int(os.environ.get('GROQ_PROBE_FAILURES', 2))
+PROBE_SLOW_MS = float(os.environ.get('GROQ_PROBE_SLOW_MS', 2000))
+READY_REQUIRES_UPSTREAM = os.environ.get('HEALTH_READY_REQUIRES_UPSTREAM', 'false').lower() == 'true'
+
+
+class UpstreamUnavailable(requests.exceptions.ConnectionError):
+    """Raised instead of calling the upstream while the prober reports it down"""
+
+    def __init__(self, retry_after):
+        super().__init__('Groq API is unreachable - serving local fallbacks')
+        self.retry_after = retry_after
+
+
+class UpstreamHealth:
+    """
+    Cached upstream state: 'unknown' until the first probe, then 'up',
+    'degraded' (slow or rate limited) or 'down'. Only probes mark the upstream
+    down; a failing real call just brings the next probe forward.
+    """
+
+    def __init__(self, interval=PROBE_INTERVAL, down_interval=PROBE_DOWN_INTERVAL,
+                 failures_to_down=PROBE_FAILURES_TO_DOWN, slow_ms=PROBE_SLOW_MS):
+        self.interval = interval
+        self.down_interval = down_interval
+        self.failures_to_down = failures_to_down
+        self.slow_ms = slow_ms
+        self.state = 'unknown'
+        self.latency_ms = None
+        self.last_status = None
+        self.last_error = None
+        self.checked_at = None
+        self.changed_at = time.time()
+        self.consecutive_failures = 0
+        self.stats = {'probes': 0, 'probe_failures': 0, 'call_failures': 0, 'short_circuited': 0}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._probe_fn = None
+
+    def start(self, probe_fn):
+        """Probe with probe_fn(timeout) -> (status code or None, error) on a daemon thread"""
+        if self._thread is not None:
+            return
+        self._probe_fn = probe_fn
+        self._thread = threading.Thread(target=self._loop, name='groq-prober', daemon=True)
+        self._thread.start()
+        print(f"🩺 Groq health prober started (every {self.interval:g}s)")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.probe()
+            self._wake.wait(self.down_interval if self.state == 'down' else self.interval)
+            self._wake.clear()
+
+    def probe(self, probe_fn=None):
+        """Run one probe now and update the cached state; returns the snapshot"""
+        started = time.monotonic()
+        try:
+            status, error = (probe_fn or self._probe_fn)(PROBE_TIMEOUT)
+        except Exception as e:
+            status, error = None, str(e)
+        latency_ms = round((time.monotonic() - started) * 1000)
+
+        with self._lock:
+            self.stats['probes'] += 1
+            self.checked_at = time.time()
+            self.last_status = status
+            self.last_error = error
+            # A 429 still proves the upstream is reachable; auth and server errors do not
+            if status is not None and (status < 400 or status == 429):
+                self.consecutive_failures = 0
+                self.latency_ms = latency_ms
+                slow = status == 429 or latency_ms > self.slow_ms
+                self._set_state('degraded' if slow else 'up')
+            else:
+                self.stats['probe_failures'] += 1
+                self.consecutive_failures += 1
+                if self.consecutive_failures >= self.failures_to_down:
+                    self._set_state('down')
+        return self.snapshot()
+
+    def _set_state(self, state):
+        if state != self.state:
+            icon = {'up': '✅', 'degraded': '🐢', 'down': '🔴'}.get(state, '❔')
+            print(f"{icon} Groq upstream {self.state} -> {state} ({self.last_error or self.last_status})")
+            self.state = state
+            self.changed_at = time.time()
+
+    def observe(self, response):
+        """Passive signal from a real call: a server error or dead connection triggers an early probe"""
+        if response is not None and response.status_code < 500:
+            with self._lock:
+                if self.state == 'down':
+                    self.consecutive_failures = 0
+                    self._set_state('up')
+            return
+        with self._lock:
+            self.stats['call_failures'] += 1
+            # At most one early probe per down_interval, however many calls fail
+            due = self.checked_at is None or time.time() - self.checked_at >= self.down_interval
+        if due:
+            self._wake.set()
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def available(self):
+        """False only while a running prober reports the upstream down; it alone can bring it back"""
+        return self.state != 'down' or not self.running()
+
+    def check(self):
+        """Raise UpstreamUnavailable while the upstream is down, so callers fall back at once"""
+        if not self.available():
+            with self._lock:
+                self.stats['short_circuited'] += 1
+            raise UpstreamUnavailable(max(1, round(self.down_interval)))
+
+    def snapshot(self):
+        return {
+            'state': self.state,
+            'latency_ms': self.latency_ms,
+            'last_status': self.last_status,
+            'last_error': self.last_error,
+            'checked_at': self.checked_at,
+            'age_seconds': round(time.time() - self.checked_at, 1) if self.checked_at else None,
+            'state_since': self.changed_at,
+            'prober_running': self.running(),
+            **self.stats
+        }
+
+
+upstream_health = UpstreamHealth()
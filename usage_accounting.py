@@ -0,0 +1,261 @@
+"""
+LLM token usage accounting: prompt/completion tokens and latency of every
+Groq call, per endpoint, model and client, in per-minute buckets over a
+rolling window. Daily token budgets step requests down to a smaller model
+and then to local fallbacks once they run out.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import requests
+
+try:
+    import redis
+except ImportError:  # optional shared backend for the daily budget counters
+    redis = None
+
+USAGE_WINDOW_MINUTES = int(os.environ.get('USAGE_WINDOW_MINUTES', 24 * 60))
+# Daily token budgets (UTC days); 0 disables the budget
+DAILY_TOKEN_BUDGET = int(os.environ.get('USAGE_DAILY_TOKEN_BUDGET', 0))
+CLIENT_DAILY_TOKEN_BUDGET = int(os.environ.get('USAGE_CLIENT_DAILY_TOKEN_BUDGET', 0))
+# Share of a budget after which calls use the small model instead
+DOWNGRADE_AT = float(os.environ.get('USAGE_DOWNGRADE_AT', 0.8))
+SMALL_MODEL = os.environ.get('USAGE_SMALL_MODEL', 'llama3-8b-8192')
+USAGE_REDIS_URL = os.environ.get('USAGE_REDIS_URL') or os.environ.get('REDIS_URL')
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+_REDIS_PREFIX = 'acadtutor:usage:'
+# Shared daily totals are re-read at most this often
+_SHARED_REFRESH_SECONDS = 5
+
+# (endpoint, client) the current request's upstream calls are charged to
+_usage_tag = ContextVar('usage_tag', default=('background', None))
+
+
+class TokenBudgetExceeded(requests.exceptions.RequestException):
+    """Raised instead of calling the upstream once a daily token budget is spent"""
+
+    def __init__(self, scope, retry_after):
+        super().__init__(f'Daily {scope} token budget exhausted')
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+def set_usage_tag(endpoint, client=None):
+    """Charge upstream calls in this context to endpoint/client; returns a reset token"""
+    return _usage_tag.set((endpoint, client))
+
+
+def reset_usage_tag(token):
+    _usage_tag.reset(token)
+
+
+@contextmanager
+def usage_tag(endpoint, client=None):
+    token = set_usage_tag(endpoint, client)
+    try:
+        yield
+    finally:
+        reset_usage_tag(token)
+
+
+def current_usage_tag():
+    return _usage_tag.get()
+
+
+def _today():
+    return time.strftime('%Y-%m-%d', time.gmtime())
+
+
+def seconds_until_reset():
+    """Seconds until the daily budgets reset at UTC midnight"""
+    return 86400 - int(time.time()) % 86400
+
+
+class UsageLedger:
+    """Per-minute usage buckets over a rolling window, plus today's token totals"""
+
+    def __init__(self, window_minutes=USAGE_WINDOW_MINUTES, redis_url=USAGE_REDIS_URL):
+        self.window_minutes = window_minutes
+        # minute -> {(endpoint, model, client): [calls, errors, prompt, completion, latency seconds]}
+        self._minutes = OrderedDict()
+        self._day = _today()
+        self._day_total = 0
+        self._day_clients = {}
+        self._lock = threading.Lock()
+        self._shared = None
+        self._shared_cache = {}
+        if redis_url and redis is not None:
+            self._shared = redis.Redis.from_url(redis_url)
+        elif redis_url:
+            print("⚠️  Redis URL configured but the redis package is not installed - token budgets are per process")
+
+    def _roll_day(self):
+        today = _today()
+        if today != self._day:
+            self._day, self._day_total, self._day_clients = today, 0, {}
+
+    def record(self, endpoint, model, client, prompt_tokens, completion_tokens, latency, ok=True):
+        minute = int(time.time() // 60)
+        tokens = prompt_tokens + completion_tokens
+        with self._lock:
+            buckets = self._minutes.get(minute)
+            if buckets is None:
+                buckets = self._minutes[minute] = {}
+                while self._minutes and next(iter(self._minutes)) <= minute - self.window_minutes:
+                    self._minutes.popitem(last=False)
+            entry = buckets.setdefault((endpoint, model, client), [0, 0, 0, 0, 0.0])
+            entry[0] += 1
+            entry[1] += 0 if ok else 1
+            entry[2] += prompt_tokens
+            entry[3] += completion_tokens
+            entry[4] += latency
+
+            self._roll_day()
+            self._day_total += tokens
+            if client:
+                self._day_clients[client] = self._day_clients.get(client, 0) + tokens
+
+        if self._shared is not None and tokens:
+            day_key = _REDIS_PREFIX + self._day
+            try:
+                pipe = self._shared.pipeline()
+                pipe.incrby(day_key + ':total', tokens)
+                pipe.expire(day_key + ':total', 2 * 86400)
+                if client:
+                    pipe.incrby(f'{day_key}:client:{client}', tokens)
+                    pipe.expire(f'{day_key}:client:{client}', 2 * 86400)
+                pipe.execute()
+            except Exception as e:
+                print(f"⚠️ Shared usage counter update failed: {e}")
+
+    def _shared_tokens(self, key):
+        cached = self._shared_cache.get(key)
+        if cached and time.monotonic() - cached[0] < _SHARED_REFRESH_SECONDS:
+            return cached[1]
+        try:
+            value = int(self._shared.get(key) or 0)
+        except Exception as e:
+            print(f"⚠️ Shared usage counter read failed: {e}")
+            return None
+        self._shared_cache[key] = (time.monotonic(), value)
+        return value
+
+    def tokens_today(self, client=None):
+        """Tokens spent today by everyone (client=None) or by one client"""
+        if self._shared is not None:
+            day_key = _REDIS_PREFIX + _today()
+            shared = self._shared_tokens(f'{day_key}:client:{client}' if client else day_key + ':total')
+            if shared is not None:
+                return shared
+        with self._lock:
+            self._roll_day()
+            return self._day_clients.get(client, 0) if client else self._day_total
+
+    def series(self, minutes=60, group_by=('endpoint', 'model')):
+        """Per-minute totals for the last `minutes`, grouped by any of endpoint/model/client"""
+        fields = [field for field in ('endpoint', 'model', 'client') if field in group_by]
+        positions = [('endpoint', 'model', 'client').index(field) for field in fields]
+        since = int(time.time() // 60) - minutes
+        with self._lock:
+            snapshot = [(minute, [(key, list(entry)) for key, entry in buckets.items()])
+                        for minute, buckets in self._minutes.items() if minute > since]
+
+        points = []
+        totals = {}
+        for minute, entries in snapshot:
+            grouped = {}
+            for key, entry in entries:
+                group = tuple(key[i] for i in positions)
+                for target in (grouped.setdefault(group, [0, 0, 0, 0, 0.0]), totals.setdefault(group, [0, 0, 0, 0, 0.0])):
+                    for i, value in enumerate(entry):
+                        target[i] += value
+            points += [{'timestamp': minute * 60, **_usage_fields(fields, group, entry)} for group, entry in grouped.items()]
+        return {
+            'series': points,
+            'totals': sorted((_usage_fields(fields, group, entry) for group, entry in totals.items()),
+                             key=lambda item: -item['total_tokens'])
+        }
+
+
+def _usage_fields(fields, group, entry):
+    calls, errors, prompt, completion, latency = entry
+    return {
+        **dict(zip(fields, group)),
+        'calls': calls,
+        'errors': errors,
+        'prompt_tokens': prompt,
+        'completion_tokens': completion,
+        'total_tokens': prompt + completion,
+        'avg_latency_ms': round(latency / calls * 1000) if calls else 0
+    }
+
+
+usage_ledger = UsageLedger()
+
+
+def _budgets(client):
+    """(scope, daily budget, tokens spent today) for each configured budget"""
+    if DAILY_TOKEN_BUDGET:
+        yield 'global', DAILY_TOKEN_BUDGET, usage_ledger.tokens_today()
+    if CLIENT_DAILY_TOKEN_BUDGET and client:
+        yield 'client', CLIENT_DAILY_TOKEN_BUDGET, usage_ledger.tokens_today(client)
+
+
+def budget_state(client=None):
+    """'ok', 'downgrade' (use the small model) or 'exhausted', across the global and client budgets"""
+    state = 'ok'
+    for scope, budget, used in _budgets(client):
+        if used >= budget:
+            return 'exhausted'
+        if used >= budget * DOWNGRADE_AT:
+            state = 'downgrade'
+    return state
+
+
+def budgeted_payload(payload):
+    """The payload to send under the current budgets; raises TokenBudgetExceeded when none is left"""
+    downgrade = False
+    for scope, budget, used in _budgets(current_usage_tag()[1]):
+        if used >= budget:
+            raise TokenBudgetExceeded(scope, seconds_until_reset())
+        downgrade = downgrade or used >= budget * DOWNGRADE_AT
+    if downgrade and payload.get('model') != SMALL_MODEL:
+        return {**payload, 'model': SMALL_MODEL}
+    return payload
+
+
+def record_completion(payload, response, latency):
+    """Charge one upstream response to the current endpoint/client"""
+    endpoint, client = current_usage_tag()
+    usage = {}
+    ok = response is not None and response.status_code == 200
+    if ok:
+        try:
+            usage = response.json().get('usage') or {}
+        except ValueError:
+            usage = {}
+    usage_ledger.record(endpoint, payload.get('model', 'unknown'), client,
+                        int(usage.get('prompt_tokens', 0)), int(usage.get('completion_tokens', 0)), latency, ok)
+
+
+def usage_report(minutes=60, group_by=('endpoint', 'model')):
+    """Admin view: grouped time series plus today's budget position"""
+    return {
+        'window_minutes': minutes,
+        'group_by': list(group_by),
+        **usage_ledger.series(minutes, group_by),
+        'today': {
+            'date': _today(),
+            'tokens': usage_ledger.tokens_today(),
+            'daily_budget': DAILY_TOKEN_BUDGET or None,
+            'client_daily_budget': CLIENT_DAILY_TOKEN_BUDGET or None,
+            'state': budget_state(),
+            'resets_in_seconds': seconds_until_reset()
+        }
+    }
@@ -3,9 +3,58 @@
 Quick verification script to test if the app can start properly
 """
 
+import json
 import os
+import subprocess
 import sys
 
+# Regression budgets for a cold `import app` and for one worker's app instance
+IMPORT_BUDGET_MS = float(os.environ.get('IMPORT_BUDGET_MS', 1000))
+WORKER_RSS_BUDGET_MB = float(os.environ.get('WORKER_RSS_BUDGET_MB', 120))
+
+# Runs in a fresh interpreter so nothing is already imported or cached
+_PROBE = """
+import json, resource, time
+start = time.perf_counter()
+import app
+import_ms = (time.perf_counter() - start) * 1000
+flask_app = app.create_app(start_background=False, eager=True)
+flask_app.test_client().get('/api/health')
+print(json.dumps({'import_ms': import_ms, 'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+def measure_startup_cost():
+    """Cold import time (ms) and peak RSS (MB) of a freshly started worker"""
+    result = subprocess.run(
+        [sys.executable, '-c', _PROBE],
+        capture_output=True, text=True, timeout=120,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'probe failed')
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def check_startup_budget():
+    """Report startup cost against the budgets; tests/test_startup_budget.py asserts them"""
+    try:
+        cost = measure_startup_cost()
+    except Exception as e:
+        print(f"❌ Startup measurement failed: {e}")
+        return False
+    
+    ok = True
+    if cost['import_ms'] <= IMPORT_BUDGET_MS:
+        print(f"✅ Cold import: {cost['import_ms']:.0f} ms (budget {IMPORT_BUDGET_MS:.0f} ms)")
+    else:
+        print(f"❌ Cold import: {cost['import_ms']:.0f} ms exceeds budget of {IMPORT_BUDGET_MS:.0f} ms")
+        ok = False
+    if cost['rss_mb'] <= WORKER_RSS_BUDGET_MB:
+        print(f"✅ Worker RSS: {cost['rss_mb']:.1f} MB (budget {WORKER_RSS_BUDGET_MB:.0f} MB)")
+    else:
+        print(f"❌ Worker RSS: {cost['rss_mb']:.1f} MB exceeds budget of {WORKER_RSS_BUDGET_MB:.0f} MB")
+        ok = False
+    return ok
+
 def verify_deployment():
     print("🔍 Verifying AcadTutor Deployment")
     print("=" * 40)
@@ -33,6 +82,10 @@ def verify_deployment():
         print(f"❌ Flask app context failed: {e}")
         return False
     
+    # Check startup cost has not regressed
+    if not check_startup_budget():
+        return False
+    
     print("=" * 40)
     print("🎉 Deployment verification complete!")
     return True